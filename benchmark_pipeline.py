@@ -0,0 +1,238 @@
+"""
+Engineer 1 - Micro-benchmarks del pipeline de predicción
+Mide por separado cada etapa de una predicción para distintos tamaños de lote, guarda el
+histórico por commit y avisa de regresiones
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+import main
+from fast_json import prediction_template
+from inference import load_model_data, predict_array
+from validation import validator_for
+
+BATCH_SIZES = (1, 10, 100, 1_000, 10_000, 100_000)
+
+# Tiempo mínimo medido por etapa y tamaño (se repite la etapa hasta alcanzarlo)
+MIN_MEASURE_SECONDS = 0.2
+MIN_REPEATS = 3
+
+
+def measure(fn: Callable[[], Any], min_seconds: float = MIN_MEASURE_SECONDS) -> Dict[str, float]:
+    """Mediana y mínimo de varias ejecuciones de ``fn`` (al menos MIN_REPEATS)"""
+    fn()  # primera llamada fuera de la medición
+    times = []
+    deadline = time.perf_counter() + min_seconds
+    while len(times) < MIN_REPEATS or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeats": len(times)}
+
+
+def sample_rows(n: int, seed: int = 0) -> List[Dict[str, float]]:
+    """Filas válidas con valores como los del formulario"""
+    rng = np.random.RandomState(seed)
+    names = list(main.FEATURE_RANGES)
+    lows = np.array([main.FEATURE_RANGES[name][0] for name in names], dtype=np.float64)
+    highs = np.array([main.FEATURE_RANGES[name][1] for name in names], dtype=np.float64)
+    values = np.round(rng.uniform(lows, highs, size=(n, len(names))), 1)
+    return [dict(zip(names, row)) for row in values.tolist()]
+
+
+def form_request(body: bytes) -> Request:
+    """Request de Starlette con un cuerpo de formulario, como el que recibe /predict"""
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/predict",
+        "headers": [(b"content-type", b"application/x-www-form-urlencoded")],
+        "query_string": b""
+    }
+    return Request(scope, receive)
+
+
+def build_stages(
+    model_data: Dict[str, Any],
+    rows: List[Dict[str, float]],
+    loop: asyncio.AbstractEventLoop
+) -> Dict[str, Callable[[], Any]]:
+    """Una función por etapa, cada una sobre las ``len(rows)`` filas.
+
+    Las etapas asíncronas corren en ``loop``, creado una sola vez fuera de la medición:
+    crear y cerrar un event loop por repetición costaría más que parsear un formulario.
+    """
+    names = list(model_data['feature_names'])
+    form_bodies = [urlencode(row).encode() for row in rows]
+    raw_rows = [[row[name] for name in names] for row in rows]
+    X = np.array(raw_rows, dtype=np.float64)
+    # Los modelos fusionados (train_model.py --fused) no tienen scaler
+    scaler = model_data.get('scaler')
+    model = model_data.get('model')
+    validator = validator_for(tuple(names))
+    predictions, confidences, probabilities = predict_array(model_data, X)
+    classes = [str(label) for label in model_data['classes']]
+
+    async def parse_forms():
+        for body in form_bodies:
+            await form_request(body).form()
+
+    def serialize_responses():
+        for row, quality, confidence, probs in zip(rows, predictions, confidences, probabilities):
+            response = main.PredictionResponse(
+                quality=str(quality),
+                confidence=float(confidence),
+                probabilities={label: float(p) for label, p in zip(classes, probs)},
+                features=row,
+                model_version=model_data['model_version']
+            )
+            JSONResponse(content=jsonable_encoder(response)).body
+
+    def serialize_fast():
+        template = prediction_template(model_data['model_version'], tuple(classes))
+        for row, quality, confidence, probs in zip(rows, predictions, confidences, probabilities):
+            template.encode(str(quality), confidence, probs, row)
+
+    stages = {
+        "form_parsing": lambda: loop.run_until_complete(parse_forms()),
+        "pydantic_parsing": lambda: [main.CoffeeFeatures.parse_obj(row) for row in rows],
+        "range_validation": lambda: validator.row_errors(X),
+        # Como /predict y /predict-json: una fila cada vez, sin crear arrays
+        "range_validation_row": lambda: [validator.first_error(row) for row in raw_rows],
+        "batch_validation": lambda: main.validate_rows(rows, names),
+        "np_array": lambda: np.array(raw_rows, dtype=np.float64),
+        "predict_array": lambda: predict_array(model_data, X),
+        "response_serialization": serialize_responses,
+        "response_fast_json": serialize_fast
+    }
+    if scaler is not None:
+        X_scaled = scaler.transform(X)
+        stages["scaler_transform"] = lambda: scaler.transform(X)
+        if model is not None:
+            stages["sklearn_predict"] = lambda: model.predict(X_scaled)
+            stages["sklearn_predict_proba"] = lambda: model.predict_proba(X_scaled)
+    return stages
+
+
+def run_suite(model_path: str, engine: str, batch_sizes, stage_filter: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Medir todas las etapas para cada tamaño de lote"""
+    model_data = load_model_data(model_path, engine)
+    results = {}
+    loop = asyncio.new_event_loop()
+    try:
+        for n in batch_sizes:
+            rows = sample_rows(n)
+            for stage, fn in build_stages(model_data, rows, loop).items():
+                if stage_filter and stage not in stage_filter:
+                    continue
+                timing = measure(fn)
+                timing["per_row_us"] = timing["median_s"] / n * 1e6
+                results.setdefault(stage, {})[str(n)] = timing
+                print(f"  {stage:<24} n={n:<7} {timing['median_s'] * 1000:>10.3f} ms  {timing['per_row_us']:>9.2f} µs/fila")
+    finally:
+        loop.close()
+    return {"engine": model_data['engine'], "model_version": model_data['model_version'], "stages": results}
+
+
+def current_commit() -> Optional[str]:
+    """Commit actual de git (con ``+`` si hay cambios sin commitear)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def find_regressions(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Etapas y tamaños cuya mediana empeora más de ``threshold`` (0.1 = 10 %) frente a la base"""
+    regressions = []
+    for stage, sizes in current["stages"].items():
+        for n, timing in sizes.items():
+            before = baseline["stages"].get(stage, {}).get(n)
+            if before is None:
+                continue
+            ratio = timing["median_s"] / before["median_s"]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{stage} n={n}: {before['median_s'] * 1000:.3f} → {timing['median_s'] * 1000:.3f} ms "
+                    f"({(ratio - 1) * 100:+.1f}%)"
+                )
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks por etapa del pipeline de predicción")
+    parser.add_argument("--model", default="model.pkl", help="model.pkl o directorio de artefacto")
+    parser.add_argument("--engine", default="sklearn", help="Motor de inferencia para predict_array")
+    parser.add_argument("--sizes", default=",".join(map(str, BATCH_SIZES)), help="Tamaños de lote separados por comas")
+    parser.add_argument("--stages", help="Medir sólo estas etapas (separadas por comas)")
+    parser.add_argument("--history", default="benchmark_history.jsonl", help="Histórico de ejecuciones por commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento que cuenta como regresión (0.10 = 10%%)")
+    parser.add_argument("--no-save", action="store_true", help="No añadir esta ejecución al histórico")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Salir con código 1 si hay regresiones")
+    args = parser.parse_args()
+
+    # El scaler avisa en cada llamada con arrays sin nombres de columna; sólo ensucia la salida
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    sizes = [int(n) for n in args.sizes.split(",")]
+    stages = args.stages.split(",") if args.stages else None
+    commit = current_commit()
+    print(f"⏱️ Micro-benchmarks del pipeline (commit {commit})")
+    run = dict(run_suite(args.model, args.engine, sizes, stages), commit=commit,
+               timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    # La base es la última ejecución de otro commit con el mismo motor
+    history = load_history(args.history)
+    baseline = next(
+        (entry for entry in reversed(history)
+         if entry.get("commit") != commit and entry.get("engine") == run["engine"]),
+        None
+    )
+    regressions = find_regressions(baseline, run, args.threshold) if baseline else []
+    if baseline is None:
+        print("\nℹ️ Sin ejecución anterior con la que comparar")
+    elif regressions:
+        print(f"\n⚠️ Regresiones frente a {baseline['commit']} (umbral {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"   {line}")
+    else:
+        print(f"\n✅ Sin regresiones frente a {baseline['commit']} (umbral {args.threshold:.0%})")
+
+    if not args.no_save:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(run) + "\n")
+        print(f"💾 Ejecución añadida a {args.history}")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
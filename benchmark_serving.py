@@ -0,0 +1,189 @@
+"""
+QA/Tester - Benchmark del servidor TCP binario frente a /predict-json
+Las mismas filas contra los dos puntos de entrada del mismo proceso (mismo modelo y
+executor): HTTP/JSON, TCP con una petición en vuelo por conexión y TCP encadenado
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+
+from load_test import SYNTHETIC_BOUNDS, current_commit, summarize, wait_until_ready
+from tcp_server import PredictionClient, PredictionError
+
+
+def synthetic_rows(n: int, seed: int = 0) -> List[Dict[str, float]]:
+    rng = random.Random(seed)
+    return [
+        {name: round(rng.uniform(low, high), 1 if high <= 10 else 0) for name, (low, high) in SYNTHETIC_BOUNDS.items()}
+        for _ in range(n)
+    ]
+
+
+async def run_http(url: str, rows, concurrency: int, total: int) -> Dict[str, Any]:
+    """``concurrency`` clientes keep-alive contra /predict-json"""
+    latencies, statuses = [], Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/predict-json", json=rows[i % len(rows)])
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed)
+
+
+async def run_tcp(host: str, port: int, matrices, connections: int, depth: int, total: int) -> Dict[str, Any]:
+    """``connections`` conexiones con hasta ``depth`` peticiones en vuelo cada una"""
+    latencies, statuses = [], Counter()
+    clients = [await PredictionClient.connect(host, port) for _ in range(connections)]
+    counter = iter(range(total))
+
+    async def worker(client):
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await client.predict(matrices[i % len(matrices)])
+                status = "200"
+            except PredictionError as e:
+                status = f"status_{e.status}"
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients for _ in range(depth)))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        await client.close()
+    return summarize(latencies, statuses, elapsed)
+
+
+async def check_agreement(url: str, host: str, port: int, rows, matrices, n: int = 50) -> int:
+    """Filas en las que los dos puntos de entrada no devuelven la misma calidad"""
+    client = await PredictionClient.connect(host, port)
+    mismatches = 0
+    async with httpx.AsyncClient(base_url=url, timeout=30.0) as http:
+        for row, matrix in zip(rows[:n], matrices[:n]):
+            expected = (await http.post("/predict-json", json=row)).json()["quality"]
+            qualities, *_ = await client.predict(matrix)
+            mismatches += qualities[0] != expected
+    await client.close()
+    return mismatches
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    rows = synthetic_rows(1000, args.seed)
+    async with httpx.AsyncClient(base_url=args.url, timeout=10.0) as client:
+        await wait_until_ready(client)
+        feature_names = (await client.get("/model-info")).json()["features"]
+    matrices = [np.array([[row[name] for name in feature_names]], dtype=np.float64) for row in rows]
+
+    mismatches = await check_agreement(args.url, args.tcp_host, args.tcp_port, rows, matrices)
+    # Calentamiento de las dos rutas sin medir
+    await run_http(args.url, rows, args.concurrency, args.warmup)
+    await run_tcp(args.tcp_host, args.tcp_port, matrices, args.concurrency, 1, args.warmup)
+
+    scenarios = {
+        "http /predict-json": await run_http(args.url, rows, args.concurrency, args.requests),
+        "tcp": await run_tcp(args.tcp_host, args.tcp_port, matrices, args.concurrency, 1, args.requests),
+        f"tcp pipeline x{args.depth}": await run_tcp(
+            args.tcp_host, args.tcp_port, matrices, args.concurrency, args.depth, args.requests
+        )
+    }
+    return {
+        "config": {
+            "url": args.url,
+            "tcp": f"{args.tcp_host}:{args.tcp_port}",
+            "concurrency": args.concurrency,
+            "depth": args.depth,
+            "requests": args.requests,
+            "warmup": args.warmup
+        },
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mismatches": mismatches,
+        "scenarios": scenarios
+    }
+
+
+def print_report(results: Dict[str, Any]):
+    config = results["config"]
+    print(f"\n📊 {config['requests']} peticiones de una fila, {config['concurrency']} conexiones")
+    print(f"{'Escenario':<22} {'Req/s':>9} {'Err %':>7} {'p50':>9} {'p99':>9}")
+    baseline = results["scenarios"]["http /predict-json"]["throughput_rps"]
+    for name, summary in results["scenarios"].items():
+        latency = summary.get("latency_ms", {})
+        print(
+            f"{name:<22} {summary['throughput_rps']:>9.1f} {summary['error_rate'] * 100:>6.2f}% "
+            f"{latency.get('p50', float('nan')):>7.2f}ms {latency.get('p99', float('nan')):>7.2f}ms "
+            f"(x{summary['throughput_rps'] / baseline:.1f})"
+        )
+    if results["mismatches"]:
+        print(f"⚠️ {results['mismatches']} filas con distinta calidad por HTTP y por TCP")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar el servidor TCP binario con /predict-json")
+    parser.add_argument("--url", help="API ya arrancada con COFFEE_TCP_PORT; sin --url se lanza uvicorn")
+    parser.add_argument("--tcp-host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=9000)
+    parser.add_argument("--port", type=int, default=8765, help="Puerto HTTP del uvicorn lanzado por el benchmark")
+    parser.add_argument("--engine", default="fused",
+                        help="COFFEE_INFERENCE_ENGINE del uvicorn lanzado (fused: la inferencia no tapa el coste del protocolo)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes HTTP y conexiones TCP")
+    parser.add_argument("--depth", type=int, default=16, help="Peticiones en vuelo por conexión en el modo encadenado")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Guardar los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    server = None
+    if not args.url:
+        args.url = f"http://127.0.0.1:{args.port}"
+        # Sin caché: el servidor TCP no la usa y las filas se repiten
+        env = dict(
+            os.environ, COFFEE_TCP_PORT=str(args.tcp_port), COFFEE_TCP_HOST=args.tcp_host,
+            COFFEE_INFERENCE_ENGINE=args.engine, COFFEE_CACHE_SIZE="0"
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            env=env
+        )
+    try:
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Engineer 1 - Formatos binarios de entrada para /predict-batch
+Matriz cruda little-endian (float32/float64) con la forma en una cabecera, o un stream
+Arrow IPC con una columna por característica, sin pasar por JSON
+"""
+
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# Content-Type de la matriz cruda: filas × características en orden C (fila a fila)
+RAW_MATRIX_MEDIA_TYPE = "application/x-coffee-matrix"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+BINARY_MEDIA_TYPES = (RAW_MATRIX_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE)
+
+# Cabeceras de la matriz cruda: X-Matrix-Shape: "filas,columnas" y X-Matrix-Dtype
+RAW_DTYPES = {"float32": np.dtype("<f4"), "float64": np.dtype("<f8")}
+
+
+class BinaryFormatError(ValueError):
+    """Cuerpo binario que no se puede interpretar (forma, tipo o longitud incorrectos)"""
+
+
+def decode_raw_matrix(body: bytes, shape_header: str, dtype_header: str, n_features: int) -> np.ndarray:
+    """Envolver el cuerpo como matriz sin copiarlo (``np.frombuffer``).
+
+    Con float64 el array comparte la memoria del cuerpo (sólo lectura); float32 se pasa a
+    float64 para que el escalado y el bosque vean los mismos valores que con JSON.
+    """
+    dtype = RAW_DTYPES.get((dtype_header or "float64").lower())
+    if dtype is None:
+        raise BinaryFormatError(f"X-Matrix-Dtype debe ser {' o '.join(RAW_DTYPES)}")
+    try:
+        rows, columns = (int(part) for part in shape_header.split(","))
+    except (AttributeError, ValueError):
+        raise BinaryFormatError("X-Matrix-Shape debe ser 'filas,columnas'")
+    if columns != n_features or rows < 0:
+        raise BinaryFormatError(f"La matriz debe tener {n_features} columnas, recibida forma {rows},{columns}")
+    if len(body) != rows * columns * dtype.itemsize:
+        raise BinaryFormatError(
+            f"El cuerpo tiene {len(body)} bytes, la forma {rows},{columns} en {dtype.name} necesita "
+            f"{rows * columns * dtype.itemsize}"
+        )
+
+    features = np.frombuffer(body, dtype=dtype).reshape(rows, columns)
+    if dtype != np.float64:
+        features = features.astype(np.float64)
+    return features
+
+
+def decode_arrow_stream(body: bytes, feature_names: Sequence[str]) -> np.ndarray:
+    """Leer un stream Arrow IPC con una columna numérica por característica.
+
+    Las columnas se apilan en una matriz fila a fila (la única copia); los nulos quedan
+    como NaN y se rechazan en la validación de rangos.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise BinaryFormatError("Leer Arrow requiere pyarrow en el servidor: pip install pyarrow")
+
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except (pa.ArrowInvalid, OSError) as e:
+        raise BinaryFormatError(f"Stream Arrow inválido: {e}")
+    missing = [name for name in feature_names if name not in table.column_names]
+    if missing:
+        raise BinaryFormatError(f"Faltan columnas en el stream Arrow: {', '.join(missing)}")
+
+    features = np.empty((table.num_rows, len(feature_names)), dtype=np.float64)
+    for j, name in enumerate(feature_names):
+        column = table.column(name)
+        if not (pa.types.is_floating(column.type) or pa.types.is_integer(column.type)):
+            raise BinaryFormatError(f"La columna {name} debe ser numérica, es {column.type}")
+        features[:, j] = column.to_numpy(zero_copy_only=False)
+    return features
+
+
+def decode_matrix(body: bytes, content_type: str, headers: Dict[str, str], feature_names: Sequence[str]) -> np.ndarray:
+    """Matriz float64 (filas × características en el orden de ``feature_names``) según el Content-Type"""
+    if content_type == RAW_MATRIX_MEDIA_TYPE:
+        return decode_raw_matrix(
+            body, headers.get("x-matrix-shape"), headers.get("x-matrix-dtype"), len(feature_names)
+        )
+    return decode_arrow_stream(body, feature_names)
+
+
+def encode_raw_matrix(features: np.ndarray, dtype: str = "float64") -> Tuple[bytes, Dict[str, str]]:
+    """Cuerpo y cabeceras para enviar ``features`` como matriz cruda (lado cliente)"""
+    features = np.ascontiguousarray(features, dtype=RAW_DTYPES[dtype])
+    rows, columns = features.shape
+    return features.tobytes(), {
+        "Content-Type": RAW_MATRIX_MEDIA_TYPE,
+        "X-Matrix-Shape": f"{rows},{columns}",
+        "X-Matrix-Dtype": dtype
+    }
@@ -0,0 +1,87 @@
+"""
+Engineer 1 - Serialización JSON rápida de las respuestas de predicción
+Respuestas pre-codificadas por modelo para una sola predicción y codificación con orjson
+(si está instalado) para el resto, sin volver a validar el response_model
+"""
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """JSON compacto en UTF-8, con orjson si está disponible (mismo resultado que JSONResponse)"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_str(value: str) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def encode_float(value: float) -> bytes:
+    # repr de un float de Python es lo mismo que escribe json.dumps
+    return repr(float(value)).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que codifica con ``dumps``; el contenido debe ser ya serializable
+    (dicts, listas, str, int, float), no modelos de Pydantic"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class PredictionTemplate:
+    """Fragmentos de bytes de un PredictionResponse ya codificados para un modelo.
+
+    Las etiquetas de clase, las claves y la versión del modelo no cambian entre
+    peticiones: sólo se formatean los floats. Los campos van en el orden de
+    PredictionResponse, así el resultado coincide byte a byte con la ruta de Pydantic.
+    """
+
+    def __init__(self, model_version: str, classes: Sequence[str]):
+        self.classes = tuple(classes)
+        self.quality = {label: b'{"quality":' + encode_str(label) + b',"confidence":' for label in self.classes}
+        self.probability_keys = [
+            (b',"probabilities":{' if i == 0 else b",") + encode_str(label) + b":"
+            for i, label in enumerate(self.classes)
+        ]
+        self.model_version = b',"model_version":' + encode_str(model_version)
+
+    def encode(
+        self,
+        quality: str,
+        confidence: float,
+        probabilities: Iterable[float],
+        features: Optional[Dict[str, float]] = None,
+        extra: Optional[Dict[str, Any]] = None
+    ) -> bytes:
+        """Codificar una predicción; ``probabilities`` en el orden de las clases del modelo"""
+        parts = [self.quality[quality], encode_float(confidence)]
+        for key, probability in zip(self.probability_keys, probabilities):
+            parts.append(key)
+            parts.append(encode_float(probability))
+        parts.append(b"}")
+        if features is not None:
+            parts.append(b',"features":')
+            parts.append(dumps({name: float(value) for name, value in features.items()}))
+        parts.append(self.model_version)
+        for key, value in (extra or {}).items():
+            parts.append(b"," + encode_str(key) + b":" + dumps(value))
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+@lru_cache(maxsize=16)
+def prediction_template(model_version: str, classes: Sequence[str]) -> PredictionTemplate:
+    """Plantilla de cada (versión, clases); durante una recarga conviven dos versiones"""
+    return PredictionTemplate(model_version, classes)
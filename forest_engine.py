@@ -0,0 +1,251 @@
+"""
+Engineer 1 - Motor de inferencia de bosque en arrays planos
+Evalúa todos los árboles del RandomForest con recorrido vectorizado en NumPy
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FlatForest:
+    """Bosque aplanado: los nodos de todos los ``estimators_`` viven en arrays contiguos.
+
+    Reproduce bit a bit ``RandomForestClassifier.predict_proba``:
+    - la entrada se convierte a float32 y se compara contra umbrales float64, como en el
+      Cython de sklearn;
+    - la probabilidad de cada hoja se normaliza igual que ``DecisionTreeClassifier``;
+    - las probabilidades de los árboles se suman en el orden de ``estimators_`` y se
+      dividen por el número de árboles.
+
+    En las hojas ``left == right == nodo`` y ``feature == 0``, de modo que el recorrido
+    puede avanzar ``max_depth`` pasos sin ramas especiales: las filas que ya llegaron a
+    una hoja se quedan en ella.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        classes: np.ndarray,
+        max_depth: int,
+        fused: bool = False
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        # Con el scaler fusionado los umbrales están en el espacio original y la entrada
+        # se compara en float64 sin pasar por float32
+        self.fused = fused
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """Aplanar un RandomForestClassifier entrenado"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n, dtype=np.intp)
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.intp))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.intp))
+
+            # Misma normalización que DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth
+        )
+
+    def fold_scaler(self, mean: np.ndarray, scale: np.ndarray) -> "FlatForest":
+        """Fusionar un StandardScaler en los umbrales para predecir sobre valores sin escalar.
+
+        Para cada nodo con umbral ``t`` sobre la característica ``j`` se busca el mayor
+        float64 ``x`` que cumple ``float32((x - mean[j]) / scale[j]) <= t``. Esa función es
+        monótona en ``x``, así que ``x <= umbral_fusionado`` decide exactamente igual que el
+        pipeline scaler + bosque, también en los casos límite de redondeo.
+        """
+        if self.fused:
+            raise ValueError("El bosque ya tiene un scaler fusionado")
+
+        threshold = self.threshold.copy()
+        split = np.flatnonzero(self.left != np.arange(self.n_nodes))
+        feature = self.feature[split]
+        threshold[split] = _fold_thresholds(
+            self.threshold[split],
+            np.asarray(mean, dtype=np.float64)[feature],
+            np.asarray(scale, dtype=np.float64)[feature]
+        )
+
+        return FlatForest(
+            feature=self.feature,
+            threshold=threshold,
+            left=self.left,
+            right=self.right,
+            value=self.value,
+            roots=self.roots,
+            classes=self.classes_,
+            max_depth=self.max_depth,
+            fused=True
+        )
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Índice global de la hoja alcanzada por cada fila en cada árbol, forma (n, árboles)"""
+        if self.fused:
+            X = np.asarray(X, dtype=np.float64)
+        else:
+            # sklearn evalúa los árboles sobre float32; el umbral se compara en float64
+            X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_estimators)).copy()
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidades por clase, idénticas a las de sklearn"""
+        leaf_values = self.value[self.apply(X)]
+        # cumsum acumula en orden de árbol, igual que el bucle de sklearn (np.sum usaría
+        # suma por pares y podría diferir en el último bit)
+        total = np.cumsum(leaf_values, axis=1)[:, -1, :]
+        return total / self.n_estimators
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    def nbytes(self) -> int:
+        """Memoria ocupada por los arrays de nodos"""
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value, self.roots))
+
+    def verify_against(self, model, X: np.ndarray, scaler=None) -> Optional[str]:
+        """Comparar con sklearn sobre X; devuelve None si coinciden bit a bit o el motivo si no.
+
+        Si se pasa ``scaler`` la referencia es el pipeline de dos pasos
+        ``model.predict_proba(scaler.transform(X))``.
+        """
+        expected = model.predict_proba(scaler.transform(X) if scaler is not None else X)
+        actual = self.predict_proba(X)
+        if expected.shape != actual.shape:
+            return f"Forma distinta: {actual.shape} vs {expected.shape}"
+        if not np.array_equal(expected, actual):
+            mismatches = int((expected != actual).any(axis=1).sum())
+            return f"{mismatches} filas con probabilidades distintas de sklearn"
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "estimators": self.n_estimators,
+            "nodes": self.n_nodes,
+            "max_depth": self.max_depth,
+            "bytes": self.nbytes(),
+            "fused": self.fused
+        }
+
+
+def verification_sample(forest: FlatForest, n_features: int, n_rows: int = 2048, scaler=None) -> np.ndarray:
+    """Filas para comparar motores: aleatorias y justo sobre los umbrales de los nodos.
+
+    Las filas aleatorias se generan en el espacio escalado; con ``scaler`` se llevan al
+    espacio original (para bosques fusionados, cuyos umbrales ya están en ese espacio).
+    Un tercio de las filas cae exactamente sobre un umbral y otro tercio en el float64
+    siguiente, que es donde un error de redondeo cambiaría de rama.
+    """
+    rng = np.random.RandomState(0)
+    X = rng.normal(scale=2.0, size=(n_rows, n_features))
+    if scaler is not None:
+        X = scaler.inverse_transform(X)
+
+    split_nodes = np.flatnonzero(forest.left != np.arange(forest.n_nodes))
+    picked = rng.choice(split_nodes, size=min(n_rows // 3, len(split_nodes)), replace=False)
+    on_threshold = np.arange(len(picked))
+    X[on_threshold, forest.feature[picked]] = forest.threshold[picked]
+    X[on_threshold + len(picked), forest.feature[picked]] = np.nextafter(forest.threshold[picked], np.inf)
+    return X
+
+
+def _scaled_float32(x: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Lo que ve el árbol para un valor crudo: StandardScaler.transform y después float32"""
+    return ((x - mean) / scale).astype(np.float32).astype(np.float64)
+
+
+def _ordered_key(x: np.ndarray) -> np.ndarray:
+    """Entero monótono con el orden de los float64 (vecinos en float64 difieren en 1)"""
+    bits = x.view(np.int64)
+    return np.where(bits < 0, np.iinfo(np.int64).min - bits, bits)
+
+
+def _from_ordered_key(key: np.ndarray) -> np.ndarray:
+    bits = np.where(key < 0, np.iinfo(np.int64).min - key, key)
+    return bits.view(np.float64)
+
+
+def _fold_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Mayor float64 x con float32((x - mean) / scale) <= threshold, vectorizado por nodo"""
+    guess = threshold * scale + mean
+    step = np.maximum(np.abs(guess), 1.0) * 1e-6
+
+    # Ampliar el intervalo hasta que lo <= umbral < hi
+    lo = guess - step
+    hi = guess + step
+    while True:
+        bad_lo = _scaled_float32(lo, mean, scale) > threshold
+        bad_hi = _scaled_float32(hi, mean, scale) <= threshold
+        if not (bad_lo.any() or bad_hi.any()):
+            break
+        step = step * 2
+        lo = np.where(bad_lo, guess - step, lo)
+        hi = np.where(bad_hi, guess + step, hi)
+
+    # Bisección sobre la representación ordenada de los float64
+    lo_key = _ordered_key(lo)
+    hi_key = _ordered_key(hi)
+    while True:
+        open_ = hi_key - lo_key > 1
+        if not open_.any():
+            break
+        mid_key = lo_key + (hi_key - lo_key) // 2
+        mid_ok = _scaled_float32(_from_ordered_key(mid_key), mean, scale) <= threshold
+        lo_key = np.where(open_ & mid_ok, mid_key, lo_key)
+        hi_key = np.where(open_ & ~mid_ok, mid_key, hi_key)
+
+    return _from_ordered_key(lo_key)
@@ -0,0 +1,484 @@
+"""
+Engineer 1 - Núcleo de inferencia
+Carga del modelo y ejecución de predicciones fuera del event loop
+"""
+
+import asyncio
+import fcntl
+import glob
+import hashlib
+import multiprocessing
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from forest_engine import FlatForest, verification_sample
+from lookup_table import LookupTable
+from model_artifact import ArrayScaler, is_artifact, read_artifact, write_artifact
+from validation import FEATURE_BOUNDS
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+ENGINES = ("sklearn", "flat", "fused")
+
+# Por encima de este número de filas sklearn es más rápido que el recorrido vectorizado
+# (los resultados son idénticos, así que cambiar de motor según el tamaño es seguro)
+FLAT_ENGINE_MAX_ROWS = 1024
+
+# Modelo propio de cada proceso del pool (se carga en el initializer)
+_worker_model_data = None
+
+# Dentro de cada artefacto compartido: quien lo carga mantiene un lock compartido sobre
+# este archivo mientras usa el modelo, y sólo se borra si se puede tomar en exclusiva
+SHARED_IN_USE_FILE = "in-use.lock"
+
+
+def pickle_model_version(model_data: Dict[str, Any], raw: bytes) -> str:
+    """Versión de un model.pkl: la que trae o, si no, un hash del archivo"""
+    if 'model_version' in model_data:
+        return model_data['model_version']
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def load_model_data(
+    path: str = 'model.pkl',
+    engine: str = "sklearn",
+    lut_steps: Optional[List[float]] = None
+) -> Dict[str, Any]:
+    """Leer el artefacto del modelo desde disco y preparar el motor de inferencia.
+
+    ``path`` puede ser un model.pkl o un directorio de artefacto (ver model_artifact.py),
+    que se carga sin pickle y con los arrays mapeados en memoria. Con ``lut_steps`` se
+    añade además una tabla de consulta precalculada sobre esa rejilla.
+    """
+    if is_artifact(path):
+        model_data = read_artifact(path)
+        in_use_path = os.path.join(path, SHARED_IN_USE_FILE)
+        if os.path.exists(in_use_path):
+            # Artefacto compartido: el lock se suelta al liberar model_data (se cierra el archivo)
+            model_data['in_use_lock'] = open(in_use_path)
+            fcntl.flock(model_data['in_use_lock'], fcntl.LOCK_SH)
+    else:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        model_data = pickle.loads(raw)
+        # Versión = hash del contenido, como en los artefactos
+        model_data['model_version'] = pickle_model_version(model_data, raw)
+    prepare_engine(model_data, engine)
+    model_data['lut'] = None
+    if lut_steps:
+        attach_lookup_table(model_data, path, lut_steps)
+    model_data['identity'] = {
+        "model_version": model_data['model_version'],
+        "classes": [str(label) for label in model_data['classes']]
+    }
+    return model_data
+
+
+def default_shared_dir() -> str:
+    """/dev/shm si existe (memoria compartida), si no el directorio temporal del sistema"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def ensure_shared_artifact(model_path: str, shared_dir: Optional[str] = None) -> str:
+    """Devolver un artefacto mapeable en memoria para ``model_path``.
+
+    Todos los procesos que mapean los mismos .npy comparten las páginas físicas, así que
+    el estado del modelo no crece con el número de workers. Un directorio de artefacto se
+    usa tal cual; un model.pkl (normal o ya fusionado con ``train_model.py --fused``) se
+    convierte una sola vez a ``shared_dir`` (el primer worker lo escribe bajo un lock de
+    archivo y los demás lo reutilizan) conservando su ``model_version``. El nombre del
+    directorio incluye tamaño y fecha del model.pkl, así que un modelo nuevo genera uno
+    nuevo; los de versiones anteriores se borran cuando nadie los usa.
+    """
+    if is_artifact(model_path):
+        return model_path
+
+    shared_dir = shared_dir or default_shared_dir()
+    stat = os.stat(model_path)
+    name = os.path.basename(os.path.abspath(model_path))
+    target = os.path.join(shared_dir, f"coffee-{name}-{stat.st_size}-{stat.st_mtime_ns}")
+
+    os.makedirs(shared_dir, exist_ok=True)
+    with open(os.path.join(shared_dir, f"coffee-{name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not is_artifact(target):
+            with open(model_path, 'rb') as f:
+                raw = f.read()
+            model_data = pickle.loads(raw)
+            n_features = len(model_data['feature_names'])
+            if model_data.get('fused'):
+                # Ya fusionado y sin scaler: el bosque "escalado" es el mismo con un scaler
+                # identidad ((x - 0) / 1 == x bit a bit), así funcionan fused y flat
+                forest = fused_forest = model_data['forest']
+                scaler = ArrayScaler(np.zeros(n_features), np.ones(n_features))
+            else:
+                # Import diferido: sólo el worker que convierte necesita sklearn
+                from train_model import build_fused_forest
+
+                forest = FlatForest.from_sklearn(model_data['model'])
+                fused_forest = build_fused_forest(model_data, np.empty((0, n_features)))
+                scaler = model_data['scaler']
+            # El lock de uso existe antes que la cabecera: nunca hay un artefacto válido sin él
+            os.makedirs(target, exist_ok=True)
+            open(os.path.join(target, SHARED_IN_USE_FILE), "w").close()
+            write_artifact(
+                target,
+                forest=forest,
+                fused_forest=fused_forest,
+                scaler=scaler,
+                feature_names=model_data['feature_names'],
+                accuracy=model_data['accuracy'],
+                model_version=pickle_model_version(model_data, raw)
+            )
+    remove_unused_shared_artifacts(model_path, shared_dir, keep=target)
+    return target
+
+
+def remove_unused_shared_artifacts(
+    model_path: str,
+    shared_dir: Optional[str] = None,
+    keep: Optional[str] = None
+) -> List[str]:
+    """Borrar los artefactos compartidos de versiones anteriores de ``model_path`` (y sus
+    tablas de consulta) que ya no carga ningún proceso. Devuelve los borrados.
+
+    Uno sigue en uso mientras algún proceso tiene el lock compartido de su
+    SHARED_IN_USE_FILE; se vuelve a intentar en la siguiente carga o recarga. Se hace
+    bajo el mismo lock que la conversión, así nunca se borra uno a medio escribir.
+    """
+    shared_dir = shared_dir or default_shared_dir()
+    name = os.path.basename(os.path.abspath(model_path))
+    pattern = re.compile(rf"coffee-{re.escape(name)}-\d+-\d+")
+    removed = []
+    with open(os.path.join(shared_dir, f"coffee-{name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for entry in os.listdir(shared_dir):
+            path = os.path.join(shared_dir, entry)
+            if not pattern.fullmatch(entry) or path == keep:
+                continue
+            try:
+                with open(os.path.join(path, SHARED_IN_USE_FILE)) as in_use:
+                    fcntl.flock(in_use, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    shutil.rmtree(path)
+            except BlockingIOError:
+                continue
+            except FileNotFoundError:
+                # Sin lock de uso (anterior a este mecanismo): quien lo tenga mapeado
+                # conserva las páginas aunque se borren los archivos
+                shutil.rmtree(path, ignore_errors=True)
+            for lut_file in glob.glob(glob.escape(path) + ".lut*"):
+                try:
+                    os.remove(lut_file)
+                except FileNotFoundError:
+                    pass
+            removed.append(path)
+    return removed
+
+
+def prepare_engine(model_data: Dict[str, Any], engine: str = "sklearn") -> Dict[str, Any]:
+    """Construir el motor de inferencia elegido sobre model_data.
+
+    - ``sklearn``: scaler + ``RandomForestClassifier.predict_proba``.
+    - ``flat``: bosque aplanado sobre la entrada escalada.
+    - ``fused``: bosque aplanado con el scaler fusionado en los umbrales; predice sobre
+      valores crudos. Los artefactos exportados con ``train_model.py --fused`` ya vienen
+      fusionados y siempre usan este motor.
+
+    Los artefactos sin pickle no incluyen el modelo de sklearn: usan ``fused`` salvo que
+    se pida ``flat``.
+
+    Los motores construidos aquí se verifican contra sklearn; si las probabilidades no
+    coinciden bit a bit se vuelve al motor de sklearn.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconocido: {engine}. Opciones: {', '.join(ENGINES)}")
+
+    if model_data.get('fused'):
+        model_data['engine'] = "fused"
+        model_data['classes'] = np.asarray(model_data['forest'].classes_)
+        return model_data
+
+    if model_data.get('artifact'):
+        if engine == "flat":
+            model_data['forest'] = model_data['scaled_forest']
+        model_data['engine'] = "flat" if engine == "flat" else "fused"
+        model_data['classes'] = np.asarray(model_data['forest'].classes_)
+        return model_data
+
+    model = model_data['model']
+    model_data['engine'] = "sklearn"
+    model_data['forest'] = None
+    model_data['classes'] = np.asarray(model.classes_)
+    if engine == "sklearn":
+        return model_data
+
+    forest = FlatForest.from_sklearn(model)
+    scaler = None
+    if engine == "fused":
+        scaler = model_data['scaler']
+        forest = forest.fold_scaler(scaler.mean_, scaler.scale_)
+    sample = verification_sample(forest, model.n_features_in_, scaler=scaler)
+    mismatch = forest.verify_against(model, sample, scaler=scaler)
+    if mismatch is None:
+        model_data['engine'] = engine
+        model_data['forest'] = forest
+    else:
+        print(f"⚠️ Motor {engine} descartado, se usa sklearn: {mismatch}")
+    return model_data
+
+
+def attach_lookup_table(model_data: Dict[str, Any], model_path: str, steps: List[float]) -> LookupTable:
+    """Abrir (o construir) la tabla de consulta del modelo y activarla en model_data.
+
+    La tabla se guarda junto al modelo como ``<modelo>.lut.npy`` y se mapea en memoria,
+    así que los procesos que cargan el mismo modelo comparten las páginas. Se reconstruye
+    si cambian la rejilla o el archivo del modelo.
+
+    Con varios workers arrancando a la vez sólo uno la construye: el resto espera el lock
+    de archivo y mapea la tabla que ha dejado (como ``ensure_shared_artifact``).
+    """
+    names = model_data['feature_names']
+    lows = [FEATURE_BOUNDS[name][0] for name in names]
+    highs = [FEATURE_BOUNDS[name][1] for name in names]
+    stat = os.stat(os.path.join(model_path, "header.json") if is_artifact(model_path) else model_path)
+    signature = {"model_size": stat.st_size, "model_mtime_ns": stat.st_mtime_ns}
+    lut_path = model_path.rstrip(os.sep) + ".lut.npy"
+
+    def live_proba(X):
+        return predict_array(model_data, X)[2]
+
+    lut = LookupTable.open(lut_path, lows, highs, steps, signature)
+    if lut is None:
+        # Rechazar una rejilla desmesurada antes de tomar el lock y reservar el memmap
+        LookupTable.check_grid(lows, highs, steps, len(model_data['classes']))
+        with open(lut_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Otro worker puede haberla construido mientras esperábamos el lock
+            lut = LookupTable.open(lut_path, lows, highs, steps, signature)
+            if lut is None:
+                lut = LookupTable.build(
+                    live_proba, lows, highs, steps, model_data['classes'], lut_path, signature
+                )
+    model_data['lut_report'] = dict(lut.stats(), **lut.disagreement(live_proba))
+    model_data['lut'] = lut
+    return lut
+
+
+def predict_array(
+    model_data: Dict[str, Any],
+    feature_array: np.ndarray,
+    timings: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Escalar y predecir una matriz 2-D de características en una sola pasada del bosque.
+
+    La etiqueta se obtiene con argmax sobre las clases del modelo (lo mismo que hace
+    ``RandomForestClassifier.predict`` internamente), así no se recorren los árboles dos veces.
+    Devuelve (calidades, confianzas, matriz de probabilidades por clase). Si se pasa
+    ``timings`` se anotan en él los segundos de ``scaling`` (sólo si hay que escalar) e
+    ``inference``.
+    """
+    started = time.perf_counter() if timings is not None else 0.0
+    forest = model_data.get('forest')
+    small = len(feature_array) <= FLAT_ENGINE_MAX_ROWS
+    if model_data.get('lut') is not None:
+        # Modo tabla de consulta: unos pocos índices en lugar del bosque
+        probabilities = model_data['lut'].predict_proba(feature_array)
+    elif model_data['engine'] == "fused" and (small or 'model' not in model_data):
+        # Umbrales en espacio original: no hace falta escalar
+        probabilities = forest.predict_proba(feature_array)
+    else:
+        feature_array_scaled = model_data['scaler'].transform(feature_array)
+        if timings is not None:
+            scaled = time.perf_counter()
+            timings['scaling'] = scaled - started
+            started = scaled
+        if model_data['engine'] == "flat" and (small or 'model' not in model_data):
+            probabilities = forest.predict_proba(feature_array_scaled)
+        else:
+            probabilities = model_data['model'].predict_proba(feature_array_scaled)
+    best = probabilities.argmax(axis=1)
+    predictions = model_data['classes'].take(best)
+    confidences = probabilities[np.arange(len(best)), best]
+    if timings is not None:
+        timings['inference'] = time.perf_counter() - started
+    return predictions, confidences, probabilities
+
+
+def _init_worker(model_path: str, engine: str, lut_steps: Optional[List[float]]):
+    """Initializer del pool de procesos: precargar el modelo en cada worker"""
+    global _worker_model_data
+    _worker_model_data = load_model_data(model_path, engine, lut_steps)
+
+
+def _predict_in_worker(
+    feature_array: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any], Dict[str, float]]:
+    """Predicción dentro de un proceso del pool usando su copia del modelo (con los tiempos
+    por etapa, que no se pueden anotar en un dict del proceso principal)"""
+    timings = {}
+    return predict_array(_worker_model_data, feature_array, timings) + (_worker_model_data['identity'], timings)
+
+
+class ExecutorSaturated(Exception):
+    """La cola de inferencia está llena; el cliente debe reintentar más tarde"""
+
+
+class InferenceExecutor:
+    """Ejecuta la inferencia en un pool de threads o procesos para no bloquear el event loop.
+
+    Acepta como máximo ``workers + max_queue`` predicciones pendientes; por encima de ese
+    límite ``run`` lanza ``ExecutorSaturated`` para que la API responda 503.
+
+    Cada resultado indica qué modelo lo produjo (``model_data['identity']``): con procesos
+    cada worker tiene su propia copia, que puede ser la anterior durante una recarga.
+
+    Si se asigna ``observer``, se llama en el event loop tras cada predicción con
+    (filas, calidades, tiempos por etapa de ``predict_array``).
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        workers: Optional[int] = None,
+        max_queue: int = 256,
+        model_path: str = 'model.pkl',
+        engine: str = "sklearn",
+        lut_steps: Optional[List[float]] = None
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Executor desconocido: {kind}. Opciones: {', '.join(EXECUTOR_KINDS)}")
+        if max_queue < 0:
+            raise ValueError("max_queue no puede ser negativo")
+
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.model_path = model_path
+        self.engine = engine
+        self.lut_steps = lut_steps
+        self._pool = None
+        self._retiring = []
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.observer: Optional[Callable[[int, np.ndarray, Dict[str, float]], None]] = None
+
+    @property
+    def capacity(self) -> int:
+        """Número máximo de predicciones en curso o en cola"""
+        return self.workers + self.max_queue
+
+    def start(self):
+        """Crear el pool de ejecución"""
+        if self._pool is not None or self.kind == "inline":
+            return
+        if self.kind == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference"
+            )
+        else:
+            self._pool = self._process_pool()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_path, self.engine, self.lut_steps)
+        )
+
+    async def swap_model(self, model_path: str, warm_up_rows: np.ndarray):
+        """Pasar a cargar ``model_path`` sin cortar las predicciones en curso.
+
+        Con threads o inline el modelo llega en cada llamada y sólo se actualiza la ruta.
+        Con procesos se arranca un pool nuevo, se calienta con una predicción por worker y
+        después se sustituye al anterior; lo ya enviado al pool viejo termina allí con el
+        modelo anterior y sus procesos se cierran al vaciarse.
+        """
+        previous_path, self.model_path = self.model_path, model_path
+        if self.kind != "process" or self._pool is None:
+            return
+
+        new_pool = self._process_pool()
+        try:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(new_pool, _predict_in_worker, warm_up_rows)
+                for _ in range(self.workers)
+            ))
+        except BaseException:
+            new_pool.shutdown(wait=False)
+            self.model_path = previous_path
+            raise
+
+        old_pool, self._pool = self._pool, new_pool
+        # Cierre en segundo plano: no se espera aquí, pero wait_retired puede esperarlo
+        self._retiring.append(asyncio.ensure_future(asyncio.to_thread(old_pool.shutdown, wait=True)))
+
+    async def wait_retired(self):
+        """Esperar a que terminen los procesos de los pools sustituidos por ``swap_model``
+        (después ya nadie tiene cargado el modelo anterior)"""
+        retiring, self._retiring = self._retiring, []
+        await asyncio.gather(*retiring, return_exceptions=True)
+
+    def shutdown(self):
+        """Cerrar el pool esperando a las predicciones en curso"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def run(
+        self,
+        model_data: Dict[str, Any],
+        feature_array: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+        """Predecir una matriz sin bloquear el event loop.
+
+        Devuelve (calidades, confianzas, probabilidades, identidad del modelo que predijo).
+        """
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise ExecutorSaturated(
+                f"Cola de inferencia llena ({self._pending}/{self.capacity} pendientes)"
+            )
+
+        # El contador sólo se toca desde el event loop, no necesita lock
+        self._pending += 1
+        try:
+            timings = {}
+            if self.kind == "inline" or self._pool is None:
+                result = predict_array(model_data, feature_array, timings) + (model_data['identity'],)
+            elif self.kind == "thread":
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, predict_array, model_data, feature_array, timings
+                ) + (model_data['identity'],)
+            else:
+                *result, timings = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, _predict_in_worker, feature_array
+                )
+                result = tuple(result)
+            self.completed += 1
+            if self.observer is not None:
+                self.observer(len(feature_array), result[0], timings)
+            return result
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del executor para /health"""
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,296 @@
+"""
+QA/Tester - Benchmark de carga
+Repite un log de peticiones (NDJSON) contra la API, en proceso o contra un servidor local,
+y mide latencias por percentil, throughput y errores
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from validation import FEATURE_BOUNDS
+
+PERCENTILES = (50, 95, 99, 99.9)
+
+# Rangos con los que se generan peticiones sintéticas (los que valida la API)
+SYNTHETIC_BOUNDS = FEATURE_BOUNDS
+
+
+def load_request_log(path: str) -> List[Dict[str, Any]]:
+    """Leer un log NDJSON de peticiones.
+
+    Cada línea es ``{"method": "POST", "path": "/predict-json", "json": {...}}``; también
+    se aceptan ``"form"`` (formulario de /predict) y ``"body"`` (texto crudo, p. ej. NDJSON
+    para /predict-stream). ``method`` es POST por defecto. Las líneas sin ``path`` no son
+    peticiones y se ignoran.
+    """
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, dict) and isinstance(entry.get("path"), str):
+                entry.setdefault("method", "POST")
+                entries.append(entry)
+    if not entries:
+        raise SystemExit(f"❌ {path} no contiene peticiones (se esperaban líneas con 'path')")
+    return entries
+
+
+def generate_request_log(path: str, n: int, seed: int = 0, batch_rows: int = 100):
+    """Escribir un log sintético: mayoría /predict-json, algo de /predict y /predict-batch"""
+    rng = random.Random(seed)
+
+    def row():
+        return {
+            name: round(rng.uniform(low, high), 1 if high <= 10 else 0)
+            for name, (low, high) in SYNTHETIC_BOUNDS.items()
+        }
+
+    with open(path, "w") as f:
+        for _ in range(n):
+            kind = rng.random()
+            if kind < 0.8:
+                entry = {"method": "POST", "path": "/predict-json", "json": row()}
+            elif kind < 0.95:
+                entry = {"method": "POST", "path": "/predict", "form": row()}
+            else:
+                entry = {"method": "POST", "path": "/predict-batch",
+                         "json": {"rows": [row() for _ in range(batch_rows)]}}
+            f.write(json.dumps(entry) + "\n")
+
+
+async def send(client: httpx.AsyncClient, entry: Dict[str, Any]) -> int:
+    """Enviar una petición del log y devolver el status"""
+    response = await client.request(
+        entry["method"],
+        entry["path"],
+        json=entry.get("json"),
+        data=entry.get("form"),
+        content=entry.get("body")
+    )
+    await response.aread()
+    return response.status_code
+
+
+class Recorder:
+    """Latencias y resultados por petición"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    async def timed(self, client: httpx.AsyncClient, entry: Dict[str, Any], started: float):
+        """Ejecutar ``entry`` midiendo desde ``started`` (la hora prevista en modo open-loop)"""
+        try:
+            status = await send(client, entry)
+        except Exception as e:
+            status = type(e).__name__
+        self.latencies[entry["path"]].append(time.perf_counter() - started)
+        self.statuses[entry["path"]][str(status)] += 1
+
+
+async def run_closed_loop(client, entries, recorder: Recorder, concurrency: int, total: int):
+    """``concurrency`` clientes que envían la siguiente petición en cuanto reciben respuesta"""
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            await recorder.timed(client, entries[i % len(entries)], time.perf_counter())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_open_loop(client, entries, recorder: Recorder, rate: float, total: int, poisson: bool, seed: int):
+    """Llegadas a ``rate`` peticiones/s, independientes de lo que tarde el servidor.
+
+    La latencia se mide desde la hora prevista de llegada, no desde el envío real, para
+    no esconder la cola cuando el generador se retrasa (omisión coordinada).
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    scheduled = start
+    tasks = []
+    for i in range(total):
+        scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(recorder.timed(client, entries[i % len(entries)], scheduled)))
+    await asyncio.gather(*tasks)
+
+
+def summarize(latencies: List[float], statuses: Counter, elapsed: float) -> Dict[str, Any]:
+    """Percentiles en ms, throughput y tasa de errores de un conjunto de peticiones"""
+    total = sum(statuses.values())
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    summary = {
+        "requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "status_counts": dict(statuses)
+    }
+    if latencies:
+        values = np.percentile(np.asarray(latencies) * 1000, PERCENTILES)
+        summary["latency_ms"] = dict(
+            {f"p{p:g}": float(v) for p, v in zip(PERCENTILES, values)},
+            mean=float(np.mean(latencies) * 1000),
+            max=float(np.max(latencies) * 1000)
+        )
+    return summary
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 120.0):
+    """Esperar a /health/ready antes de medir (el modelo carga en segundo plano)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get("/health/ready")
+            if response.status_code in (200, 404):
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit("❌ La API no quedó lista a tiempo")
+
+
+async def run_benchmark(args, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+    else:
+        # En proceso: la app ASGI sin red ni servidor, con sus eventos de arranque y cierre
+        import main
+        app = main.app
+        await app.router.startup()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://in-process",
+            timeout=args.timeout, limits=limits
+        )
+
+    try:
+        await wait_until_ready(client)
+        recorder = Recorder()
+        if args.warmup:
+            await run_closed_loop(client, entries, Recorder(), args.concurrency or 1, args.warmup)
+
+        started = time.perf_counter()
+        if args.rate:
+            await run_open_loop(client, entries, recorder, args.rate, args.requests, args.poisson, args.seed)
+        else:
+            await run_closed_loop(client, entries, recorder, args.concurrency, args.requests)
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    all_statuses = sum(recorder.statuses.values(), Counter())
+    return {
+        "config": {
+            "log": args.log,
+            "target": args.url or "in-process",
+            "mode": "open-loop" if args.rate else "closed-loop",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate_rps": args.rate,
+            "poisson": args.poisson if args.rate else None,
+            "requests": args.requests,
+            "warmup": args.warmup
+        },
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "elapsed_s": elapsed,
+        "overall": summarize(all_latencies, all_statuses, elapsed),
+        "per_route": {
+            path: summarize(recorder.latencies[path], recorder.statuses[path], elapsed)
+            for path in sorted(recorder.latencies)
+        }
+    }
+
+
+def current_commit() -> Optional[str]:
+    """Commit actual de git, para saber qué versión del código se midió"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    config = results["config"]
+    print(f"\n📊 {config['mode']} contra {config['target']} ({results['overall']['requests']} peticiones, "
+          f"{results['elapsed_s']:.2f}s)")
+    print(f"{'Ruta':<18} {'Req':>7} {'Req/s':>9} {'Err %':>7} " +
+          " ".join(f"{'p' + format(p, 'g'):>9}" for p in PERCENTILES))
+    rows = dict(results["per_route"], **{"TOTAL": results["overall"]})
+    for route, summary in rows.items():
+        latency = summary.get("latency_ms", {})
+        print(
+            f"{route:<18} {summary['requests']:>7} {summary['throughput_rps']:>9.1f} "
+            f"{summary['error_rate'] * 100:>6.2f}% " +
+            " ".join(f"{latency.get('p' + format(p, 'g'), float('nan')):>7.2f}ms" for p in PERCENTILES)
+        )
+
+    if baseline is not None:
+        before, after = baseline["overall"], results["overall"]
+        print(f"\n🔁 Comparación con {baseline.get('commit') or 'la ejecución anterior'}:")
+        print(f"   throughput: {before['throughput_rps']:.1f} → {after['throughput_rps']:.1f} req/s "
+              f"({(after['throughput_rps'] / before['throughput_rps'] - 1) * 100:+.1f}%)")
+        for p in PERCENTILES:
+            key = "p" + format(p, "g")
+            old, new = before["latency_ms"][key], after["latency_ms"][key]
+            print(f"   {key}: {old:.2f} → {new:.2f} ms ({(new / old - 1) * 100:+.1f}%)")
+        print(f"   errores: {before['error_rate']:.2%} → {after['error_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga repitiendo un log de peticiones")
+    parser.add_argument("log", help="Log NDJSON de peticiones (ver load_request_log)")
+    parser.add_argument("--generate", type=int, metavar="N",
+                        help="Escribir primero un log sintético de N peticiones en LOG")
+    parser.add_argument("--url", help="Servidor local (p. ej. http://localhost:8000); sin --url se usa la app en proceso")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes simultáneos (closed-loop)")
+    parser.add_argument("--rate", type=float, help="Llegadas por segundo (open-loop); ignora --concurrency")
+    parser.add_argument("--poisson", action="store_true", help="Llegadas de Poisson en lugar de intervalos fijos")
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones medidas (el log se repite si es más corto)")
+    parser.add_argument("--warmup", type=int, default=100, help="Peticiones de calentamiento sin medir")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Guardar los resultados en este archivo JSON")
+    parser.add_argument("--compare", help="Resultados JSON anteriores con los que comparar")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_request_log(args.log, args.generate, args.seed)
+        print(f"📝 Log sintético de {args.generate} peticiones en {args.log}")
+    entries = load_request_log(args.log)
+
+    results = asyncio.run(run_benchmark(args, entries))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
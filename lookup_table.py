@@ -0,0 +1,185 @@
+"""
+Engineer 1 - Tabla de consulta precalculada
+Probabilidades por clase sobre una rejilla cuantizada del espacio de entrada, en un .npy mapeado en memoria
+"""
+
+import json
+import math
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Filas evaluadas por bloque al construir la tabla (limita la memoria temporal)
+BUILD_CHUNK_ROWS = 65_536
+
+# Límites de la rejilla: unos pasos demasiado finos se rechazan antes de reservar el memmap
+# (0.1 en las cuatro notas y 1 m de altitud serían ~1e11 celdas, varios TB)
+MAX_CELLS = 50_000_000
+MAX_TABLE_BYTES = 2 * 1024 ** 3
+
+
+class LookupTable:
+    """Rejilla regular sobre los rangos de entrada: cada celda guarda las probabilidades
+    que da el modelo en ese punto. Predecir es redondear cada característica al punto de
+    rejilla más cercano e indexar la tabla."""
+
+    def __init__(
+        self,
+        table: np.ndarray,
+        lows: Sequence[float],
+        highs: Sequence[float],
+        steps: Sequence[float],
+        classes: Sequence[str]
+    ):
+        self.table = table
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.steps = np.asarray(steps, dtype=np.float64)
+        self.shape = table.shape[:-1]
+        self.classes = list(classes)
+
+    @staticmethod
+    def grid_shape(lows: Sequence[float], highs: Sequence[float], steps: Sequence[float]) -> tuple:
+        """Número de puntos de rejilla por característica"""
+        return tuple(
+            int(np.floor((high - low) / step + 1e-9)) + 1
+            for low, high, step in zip(lows, highs, steps)
+        )
+
+    @classmethod
+    def check_grid(
+        cls,
+        lows: Sequence[float],
+        highs: Sequence[float],
+        steps: Sequence[float],
+        n_classes: int = 1
+    ) -> int:
+        """Número de celdas de la rejilla; ValueError si los pasos no son positivos o la
+        tabla supera MAX_CELLS o MAX_TABLE_BYTES"""
+        if any(step <= 0 for step in steps):
+            raise ValueError("Los pasos de la rejilla deben ser positivos")
+        n_cells = math.prod(cls.grid_shape(lows, highs, steps))
+        n_bytes = n_cells * n_classes * np.dtype(np.float64).itemsize
+        if n_cells > MAX_CELLS or n_bytes > MAX_TABLE_BYTES:
+            raise ValueError(
+                f"Rejilla demasiado grande: {n_cells} celdas ({n_bytes / 1e9:.1f} GB); máximo "
+                f"{MAX_CELLS} celdas y {MAX_TABLE_BYTES / 1e9:.1f} GB. Usa pasos más gruesos"
+            )
+        return n_cells
+
+    @classmethod
+    def build(
+        cls,
+        predict_proba: Callable[[np.ndarray], np.ndarray],
+        lows: Sequence[float],
+        highs: Sequence[float],
+        steps: Sequence[float],
+        classes: Sequence[str],
+        path: str,
+        signature: Dict[str, Any]
+    ) -> "LookupTable":
+        """Evaluar el modelo en todos los puntos de rejilla y escribir la tabla en ``path``.
+
+        Con varios procesos, quien llama debe tener el lock de la tabla (ver
+        ``attach_lookup_table``); los temporales llevan el pid igualmente para que un
+        proceso nunca renombre el archivo de otro.
+        """
+        n_cells = cls.check_grid(lows, highs, steps, len(classes))
+        shape = cls.grid_shape(lows, highs, steps)
+        axes = [low + step * np.arange(n) for low, step, n in zip(lows, steps, shape)]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        table = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float64, shape=shape + (len(classes),)
+        )
+        flat = table.reshape(n_cells, len(classes))
+        for start in range(0, n_cells, BUILD_CHUNK_ROWS):
+            index = np.arange(start, min(start + BUILD_CHUNK_ROWS, n_cells))
+            coords = np.unravel_index(index, shape)
+            X = np.column_stack([axis[c] for axis, c in zip(axes, coords)])
+            flat[index] = predict_proba(X)
+        table.flush()
+        del flat, table
+
+        # Escritura atómica: otros procesos nunca ven una tabla a medio construir
+        os.replace(tmp_path, path)
+        meta = {
+            "lows": list(map(float, lows)),
+            "highs": list(map(float, highs)),
+            "steps": list(map(float, steps)),
+            "classes": [str(c) for c in classes],
+            "signature": signature
+        }
+        with open(tmp_path + ".json", "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path + ".json", path + ".json")
+
+        return cls.open(path, lows, highs, steps, signature)
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        lows: Sequence[float],
+        highs: Sequence[float],
+        steps: Sequence[float],
+        signature: Dict[str, Any]
+    ) -> Optional["LookupTable"]:
+        """Mapear una tabla ya construida si corresponde al mismo modelo y rejilla"""
+        if not (os.path.exists(path) and os.path.exists(path + ".json")):
+            return None
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        if (meta["lows"] != list(map(float, lows)) or meta["highs"] != list(map(float, highs)) or
+                meta["steps"] != list(map(float, steps)) or meta["signature"] != signature):
+            return None
+
+        table = np.load(path, mmap_mode="r")
+        if table.shape[:-1] != cls.grid_shape(lows, highs, steps):
+            return None
+        return cls(table, lows, highs, steps, meta["classes"])
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidades del punto de rejilla más cercano (fuera de rango se satura al borde)"""
+        X = np.asarray(X, dtype=np.float64)
+        index = np.rint((X - self.lows) / self.steps).astype(np.intp)
+        np.clip(index, 0, np.asarray(self.shape) - 1, out=index)
+        return self.table[tuple(index.T)]
+
+    def nbytes(self) -> int:
+        return int(self.table.nbytes)
+
+    def disagreement(
+        self,
+        predict_proba: Callable[[np.ndarray], np.ndarray],
+        n_rows: int = 20_000
+    ) -> Dict[str, float]:
+        """Comparar con el modelo en vivo sobre puntos aleatorios (fuera de la rejilla)"""
+        rng = np.random.RandomState(0)
+        X = rng.uniform(self.lows, self.highs, size=(n_rows, len(self.lows)))
+        expected = predict_proba(X)
+        actual = self.predict_proba(X)
+        return {
+            "max_abs_probability_diff": float(np.abs(expected - actual).max()),
+            "label_disagreement_rate": float((expected.argmax(axis=1) != actual.argmax(axis=1)).mean()),
+            "sample_rows": n_rows
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "grid_shape": list(self.shape),
+            "cells": int(np.prod(self.shape)),
+            "steps": self.steps.tolist(),
+            "bytes": self.nbytes()
+        }
+
+
+def parse_steps(spec: str, n_features: int) -> List[float]:
+    """Leer los pasos de la rejilla: un valor para todas las características o uno por cada una"""
+    steps = [float(step) for step in spec.split(",")]
+    if len(steps) == 1:
+        steps = steps * n_features
+    if len(steps) != n_features or any(step <= 0 for step in steps):
+        raise ValueError(f"Pasos de rejilla inválidos: {spec}")
+    return steps
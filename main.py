@@ -3,15 +3,36 @@ Engineer 1 - API principal con FastAPI
 Exponer modelo de clasificación de café
 """
 
-from fastapi import FastAPI, Form, HTTPException
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-import pickle
+# Inicio del import del módulo, para informar de cuánto tarda (ver startup_timings)
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Form, Header, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
 import numpy as np
 import uvicorn
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
 import os
+import tempfile
+
+from binary_format import ARROW_STREAM_MEDIA_TYPE, BINARY_MEDIA_TYPES, RAW_MATRIX_MEDIA_TYPE, BinaryFormatError, decode_matrix
+from fast_json import FastJSONResponse, prediction_template
+from inference import ExecutorSaturated, InferenceExecutor, ensure_shared_artifact, load_model_data, predict_array, remove_unused_shared_artifacts
+from lookup_table import LookupTable, parse_steps
+from metrics import BATCH_SIZE_BUCKETS, MetricsMiddleware, MetricsRegistry, SnapshotDirectory, merge_snapshots, render
+from microbatch import MicroBatcher
+from model_registry import ModelRegistry, ShadowScorer, parse_model_specs, parse_traffic_split
+from static_assets import StaticAssets
+from tcp_server import PredictionServer, start_server as start_tcp_server
+from validation import FEATURE_RANGES, RangeValidator, rows_to_matrix, validator_for
+import request_timing
+from profiler import PROFILE_FORMATS, dump_pstats, format_collapsed, sample_stacks, start_cprofile
 
 # Crear aplicación FastAPI
 app = FastAPI(
@@ -22,6 +43,206 @@ app = FastAPI(
 
 # Modelo global
 model_data = None
+MODEL_PATH = os.environ.get("COFFEE_MODEL_PATH", "model.pkl")
+
+# Compartir el modelo entre workers: "none" (cada proceso su copia) o "mmap" (todos los
+# procesos mapean los mismos .npy de solo lectura; un model.pkl se convierte una vez)
+MODEL_SHARING = os.environ.get("COFFEE_MODEL_SHARING", "none")
+MODEL_SHARED_DIR = os.environ.get("COFFEE_MODEL_SHARED_DIR") or None
+
+# Motor de inferencia: sklearn, flat (bosque aplanado en arrays NumPy, mismo resultado bit a bit)
+# o fused (flat con el scaler fusionado en los umbrales)
+INFERENCE_ENGINE = os.environ.get("COFFEE_INFERENCE_ENGINE", "sklearn")
+
+# Modo tabla de consulta: probabilidades precalculadas sobre una rejilla (desactivado por defecto).
+# Pasos por característica (acidity,sweetness,body,aroma,altitude) o uno común
+LOOKUP_TABLE_ENABLED = os.environ.get("COFFEE_LOOKUP_TABLE", "0") == "1"
+LOOKUP_TABLE_STEPS = parse_steps(os.environ.get("COFFEE_LUT_STEPS", "1,1,1,1,100"), 5) if LOOKUP_TABLE_ENABLED else None
+if LOOKUP_TABLE_STEPS:
+    # Una rejilla desmesurada falla al arrancar, no al reservar el memmap
+    LookupTable.check_grid(
+        [low for low, _, _ in FEATURE_RANGES.values()],
+        [high for _, high, _ in FEATURE_RANGES.values()],
+        LOOKUP_TABLE_STEPS
+    )
+
+# Executor de inferencia: inline, thread o process (el modelo se precarga en cada proceso)
+INFERENCE_EXECUTOR = os.environ.get("COFFEE_INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("COFFEE_INFERENCE_WORKERS", "0")) or None
+INFERENCE_MAX_QUEUE = int(os.environ.get("COFFEE_INFERENCE_MAX_QUEUE", "256"))
+inference_executor = InferenceExecutor(
+    kind=INFERENCE_EXECUTOR,
+    workers=INFERENCE_WORKERS,
+    max_queue=INFERENCE_MAX_QUEUE,
+    model_path=MODEL_PATH,
+    engine=INFERENCE_ENGINE,
+    lut_steps=LOOKUP_TABLE_STEPS
+)
+
+# Rondas de predicciones de prueba antes de declarar la API lista (/health/ready)
+WARM_UP_ROUNDS = int(os.environ.get("COFFEE_WARM_UP_ROUNDS", "3"))
+# Estado del arranque: loading → warming → ready (o failed si no hay modelo)
+model_state = "loading"
+model_startup_task = None
+startup_timings = {"import_seconds": None, "load_seconds": None, "warm_up_seconds": None}
+
+# Recarga en caliente: POST /admin/reload-model y, opcionalmente, vigilar MODEL_PATH
+# (se recarga cuando cambia y lleva un intervalo sin cambiar)
+MODEL_WATCH_ENABLED = os.environ.get("COFFEE_MODEL_WATCH", "0") == "1"
+MODEL_WATCH_INTERVAL = float(os.environ.get("COFFEE_MODEL_WATCH_INTERVAL", "2"))
+# Si se define, los endpoints /admin exigen la cabecera X-Admin-Token con este valor
+ADMIN_TOKEN = os.environ.get("COFFEE_ADMIN_TOKEN") or None
+model_reload_lock = None
+model_watch_task = None
+model_reload_stats = {"reloads": 0, "failures": 0, "last_reload_seconds": None, "last_error": None}
+
+# Perfilado en caliente con POST /admin/profile (desactivado por defecto)
+PROFILER_ENABLED = os.environ.get("COFFEE_PROFILER", "0") == "1"
+PROFILER_MAX_SECONDS = float(os.environ.get("COFFEE_PROFILER_MAX_SECONDS", "60"))
+profiler_running = False
+
+# Máximo de filas aceptadas en una sola petición de /predict-batch
+MAX_BATCH_SIZE = 100_000
+
+# /predict-stream: filas por bloque vectorizado y longitud máxima de una línea NDJSON
+STREAM_CHUNK_ROWS = int(os.environ.get("COFFEE_STREAM_CHUNK_ROWS", "1024"))
+STREAM_MAX_LINE_BYTES = 64 * 1024
+# Resultados que se guardan en memoria antes de pasar a un archivo temporal en disco
+STREAM_SPOOL_BYTES = int(os.environ.get("COFFEE_STREAM_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Interfaz web: archivos de static/ leídos y comprimidos al arrancar, con ETag y este max-age
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_MAX_AGE = int(os.environ.get("COFFEE_STATIC_MAX_AGE", "300"))
+static_assets = StaticAssets(STATIC_DIR, max_age=STATIC_MAX_AGE)
+app.mount("/static", static_assets, name="static")
+
+# Micro-batching opcional de /predict y /predict-json (desactivado por defecto)
+MICROBATCH_ENABLED = os.environ.get("COFFEE_MICROBATCH", "0") == "1"
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("COFFEE_MICROBATCH_MAX_WAIT_MS", "2"))
+MICROBATCH_MAX_BATCH = int(os.environ.get("COFFEE_MICROBATCH_MAX_BATCH", "64"))
+micro_batcher = None
+
+# Caché de predicciones individuales (COFFEE_CACHE_SIZE=0 la desactiva)
+CACHE_SIZE = int(os.environ.get("COFFEE_CACHE_SIZE", "4096"))
+CACHE_TTL_SECONDS = float(os.environ.get("COFFEE_CACHE_TTL_SECONDS", "300"))
+# Paso de cuantización por característica (acidity,sweetness,body,aroma,altitude); 0 = valor exacto.
+# Ejemplo alineado con el formulario HTML: "0.1,0.1,0.1,0.1,1"
+CACHE_QUANTIZATION = os.environ.get("COFFEE_CACHE_QUANTIZATION", "0")
+
+# /metrics: con varios workers de uvicorn, directorio compartido donde cada uno deja sus
+# métricas para que /metrics devuelva la suma (sin definir, cada worker expone sólo las suyas)
+METRICS_DIR = os.environ.get("COFFEE_METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get("COFFEE_METRICS_FLUSH_INTERVAL", "5"))
+metrics_flush_task = None
+
+# Respuestas de predicción pre-codificadas sin revalidar el response_model (orjson si está
+# instalado) y si se devuelven las características recibidas (?echo_features=false las omite)
+FAST_JSON_ENABLED = os.environ.get("COFFEE_FAST_JSON", "1") == "1"
+ECHO_FEATURES = os.environ.get("COFFEE_ECHO_FEATURES", "1") == "1"
+
+# Cabecera Server-Timing en los endpoints de predicción y, con ?debug=timing, bloque
+# "timing" en el cuerpo (desactivado por defecto)
+SERVER_TIMING_ENABLED = os.environ.get("COFFEE_SERVER_TIMING", "0") == "1"
+
+# Servidor TCP binario junto a la API (ver tcp_server.py), con el mismo modelo y executor.
+# Sin COFFEE_TCP_PORT no se abre; escucha sólo en localhost salvo que se cambie COFFEE_TCP_HOST
+TCP_PORT = int(os.environ.get("COFFEE_TCP_PORT", "0")) or None
+TCP_HOST = os.environ.get("COFFEE_TCP_HOST", "127.0.0.1")
+tcp_listener = None
+
+# Modelos candidatos en memoria junto al principal: "alias=ruta,..." (ver model_registry.py).
+# Una petición elige modelo con X-Model-Version (alias o model_version); sin la cabecera,
+# COFFEE_TRAFFIC_SPLIT ("alias=porcentaje,...") reparte el tráfico y el resto va al principal
+MODEL_VARIANTS = parse_model_specs(os.environ.get("COFFEE_MODEL_VARIANTS", ""))
+TRAFFIC_SPLIT = parse_traffic_split(os.environ.get("COFFEE_TRAFFIC_SPLIT", ""))
+model_registry = ModelRegistry(MODEL_VARIANTS, TRAFFIC_SPLIT, INFERENCE_ENGINE, LOOKUP_TABLE_STEPS)
+# Con el executor "process" los workers sólo tienen el modelo principal: los candidatos
+# se predicen en un executor de threads propio
+candidate_executor = None
+
+# Evaluación en sombra: una fracción de las predicciones del modelo principal se repite
+# con el candidato COFFEE_SHADOW_MODEL en un executor aparte, sin retrasar la respuesta
+SHADOW_MODEL = os.environ.get("COFFEE_SHADOW_MODEL") or None
+SHADOW_SAMPLE_RATE = float(os.environ.get("COFFEE_SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_WORKERS = int(os.environ.get("COFFEE_SHADOW_WORKERS", "1"))
+SHADOW_MAX_QUEUE = int(os.environ.get("COFFEE_SHADOW_MAX_QUEUE", "16"))
+if SHADOW_MODEL is not None and SHADOW_MODEL not in MODEL_VARIANTS:
+    raise ValueError(f"COFFEE_SHADOW_MODEL={SHADOW_MODEL} no está en COFFEE_MODEL_VARIANTS")
+shadow_scorer = None
+
+# Métricas del proceso (sólo se actualizan desde el event loop, sin locks)
+metrics_registry = MetricsRegistry()
+http_requests_total = metrics_registry.counter(
+    "coffee_http_requests_total", "Peticiones HTTP por ruta y código de estado", ("route", "status")
+)
+http_request_duration = metrics_registry.histogram(
+    "coffee_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("route",)
+)
+http_requests_in_flight = metrics_registry.gauge(
+    "coffee_http_requests_in_flight", "Peticiones HTTP en curso por ruta", ("route",)
+)
+stage_duration = metrics_registry.histogram(
+    "coffee_stage_duration_seconds", "Duración de las etapas validation, scaling e inference", ("stage",)
+)
+inference_batch_rows = metrics_registry.histogram(
+    "coffee_inference_batch_rows", "Filas por llamada al modelo (incluye lotes del micro-batcher)",
+    buckets=BATCH_SIZE_BUCKETS
+)
+request_batch_rows = metrics_registry.histogram(
+    "coffee_request_batch_rows", "Filas por petición en /predict-batch y /predict-stream", ("route",),
+    buckets=BATCH_SIZE_BUCKETS
+)
+predictions_total = metrics_registry.counter(
+    "coffee_predictions_total", "Predicciones calculadas por el modelo por clase (sin aciertos de caché)",
+    ("quality",)
+)
+model_requests_total = metrics_registry.counter(
+    "coffee_model_requests_total", "Peticiones de predicción por modelo (primary o alias del candidato)",
+    ("model",)
+)
+shadow_rows_total = metrics_registry.counter(
+    "coffee_shadow_rows_total", "Filas evaluadas en sombra por el candidato", ("candidate",)
+)
+shadow_disagreements_total = metrics_registry.counter(
+    "coffee_shadow_disagreements_total", "Filas en las que el candidato en sombra predice otra calidad",
+    ("candidate",)
+)
+# Un snapshot sin refrescar en varios intervalos es de un worker que ya no escribe (sus
+# gauges dejan de sumarse)
+metrics_snapshots = SnapshotDirectory(METRICS_DIR, max_age=3 * METRICS_FLUSH_INTERVAL) if METRICS_DIR else None
+
+app.add_middleware(
+    MetricsMiddleware,
+    requests_total=http_requests_total,
+    request_duration=http_request_duration,
+    in_flight=http_requests_in_flight
+)
+if SERVER_TIMING_ENABLED:
+    app.add_middleware(request_timing.ServerTimingMiddleware)
+
+# Nombres de las etapas de predict_array en Server-Timing
+REQUEST_TIMING_STAGES = {"scaling": "scale", "inference": "infer"}
+
+def record_inference(rows: int, predictions: np.ndarray, timings: Dict[str, float]):
+    """Observer del executor: tamaño del lote, tiempos de escalado e inferencia y clases"""
+    inference_batch_rows.observe(rows)
+    for stage, seconds in timings.items():
+        stage_duration.observe(seconds, stage)
+        request_timing.record(REQUEST_TIMING_STAGES[stage], seconds)
+    if rows == 1:
+        predictions_total.inc(str(predictions[0]))
+    else:
+        for label, count in zip(*np.unique(predictions, return_counts=True)):
+            predictions_total.inc(str(label), amount=int(count))
+
+def record_shadow(rows: int, disagreements: int):
+    """Observer de la evaluación en sombra: filas comparadas y desacuerdos"""
+    shadow_rows_total.inc(SHADOW_MODEL, amount=rows)
+    if disagreements:
+        shadow_disagreements_total.inc(SHADOW_MODEL, amount=disagreements)
+
+# Validación de rangos de /predict y /predict-json (filas en el orden de FEATURE_RANGES)
+feature_validator = RangeValidator(list(FEATURE_RANGES))
 
 class CoffeeFeatures(BaseModel):
     """Modelo Pydantic para las características del café"""
@@ -46,304 +267,550 @@ class PredictionResponse(BaseModel):
     """Respuesta de predicción"""
     quality: str
     confidence: float
-    features: Dict[str, float]
+    probabilities: Dict[str, float]
+    features: Optional[Dict[str, float]] = None
+    model_version: str
+
+class BatchPredictionRequest(BaseModel):
+    """Lote de filas con características del café"""
+    rows: List[Dict[str, Any]]
+
+class BatchPredictionItem(BaseModel):
+    """Resultado de una fila del lote (predicción o error de validación)"""
+    index: int
+    quality: Optional[str] = None
+    confidence: Optional[float] = None
+    probabilities: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    """Respuesta de predicción por lotes"""
+    predictions: List[BatchPredictionItem]
+    total: int
+    valid: int
+    invalid: int
+    model_version: Optional[str] = None
 
-def load_model():
-    """Cargar el modelo entrenado"""
-    global model_data
+class PredictionCache:
+    """Caché LRU con TTL de predicciones individuales.
+
+    La clave es la versión del modelo más las cinco características cuantizadas con el
+    paso configurado, así una respuesta del modelo anterior nunca se sirve tras una
+    recarga aunque llegue a guardarse después de cambiar de modelo; cuando
+    hay cuantización el modelo se evalúa sobre el valor representativo del bucket, así
+    todas las entradas de un bucket reciben exactamente la misma respuesta. Sólo se usa
+    desde el event loop, por lo que no necesita lock.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, steps: List[float]):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.steps = steps
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def quantize(self, row: List[float]) -> List[float]:
+        """Valor representativo del bucket de cada característica"""
+        # El redondeo final evita artefactos como 68 * 0.1 = 6.800000000000001
+        return [round(round(v / step) * step, 12) if step else v for v, step in zip(row, self.steps)]
+
+    def key(self, model_version: str, row: List[float]) -> tuple:
+        return (model_version,) + tuple(round(v / step) if step else v for v, step in zip(row, self.steps))
+
+    def get(self, key: tuple) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Invalidar todas las entradas (p. ej. al recargar el modelo)"""
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "quantization": self.steps,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+def parse_quantization(spec: str, n_features: int) -> List[float]:
+    """Leer los pasos de cuantización: un valor para todas las características o uno por cada una"""
+    steps = [float(step) for step in spec.split(",")]
+    if len(steps) == 1:
+        steps = steps * n_features
+    if len(steps) != n_features or any(step < 0 for step in steps):
+        raise ValueError(f"COFFEE_CACHE_QUANTIZATION inválido: {spec}")
+    return steps
+
+prediction_cache = PredictionCache(
+    max_size=CACHE_SIZE,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    steps=parse_quantization(CACHE_QUANTIZATION, len(FEATURE_RANGES))
+)
+
+# Filas de calentamiento: centro y extremos del rango válido de cada característica
+WARM_UP_ROWS = np.array([
+    [(low + high) / 2 for low, high, _ in FEATURE_RANGES.values()],
+    [low for low, _, _ in FEATURE_RANGES.values()],
+    [high for _, high, _ in FEATURE_RANGES.values()]
+], dtype=np.float64)
+
+def resolve_model_path() -> str:
+    """Ruta que cargan la API y el executor (el artefacto compartido si MODEL_SHARING=mmap)"""
+    if MODEL_SHARING == "mmap":
+        path = ensure_shared_artifact(MODEL_PATH, MODEL_SHARED_DIR)
+        print(f"🔗 Modelo compartido entre workers desde {path}")
+        return path
+    return MODEL_PATH
+
+def open_model(path: str) -> Dict[str, Any]:
+    """Cargar el modelo de ``path``"""
+    new_model = load_model_data(path, INFERENCE_ENGINE, LOOKUP_TABLE_STEPS)
+    print(f"✅ Modelo cargado exitosamente (versión {new_model['model_version']})")
+    print(f"📊 Accuracy del modelo: {new_model['accuracy']:.3f}")
+    print(f"🌲 Motor de inferencia: {new_model['engine']}")
+    if new_model['lut'] is not None:
+        report = new_model['lut_report']
+        print(
+            f"🗂️ Tabla de consulta: {report['cells']} celdas, {report['bytes'] / 1e6:.1f} MB, "
+            f"máx. diferencia {report['max_abs_probability_diff']:.3f}, "
+            f"desacuerdo de etiqueta {report['label_disagreement_rate']:.2%}"
+        )
+    return new_model
+
+def warm_up_model(current_model: Dict[str, Any]):
+    """Pagar los costes de la primera llamada (páginas del mmap, cachés de NumPy/sklearn)
+    con unas predicciones de prueba antes de recibir tráfico"""
+    for _ in range(WARM_UP_ROUNDS):
+        predict_array(current_model, WARM_UP_ROWS)
+
+def load_model() -> Optional[Dict[str, Any]]:
+    """Cargar el modelo entrenado (sin publicarlo: eso lo hace prepare_model cuando está listo)"""
+    # Las predicciones en caché pertenecen al modelo anterior
+    prediction_cache.clear()
     try:
-        if os.path.exists('model.pkl'):
-            with open('model.pkl', 'rb') as f:
-                model_data = pickle.load(f)
-            print("✅ Modelo cargado exitosamente")
-            print(f"📊 Accuracy del modelo: {model_data['accuracy']:.3f}")
-        else:
-            print("❌ Archivo model.pkl no encontrado. Ejecuta train_model.py primero.")
-            model_data = None
+        if os.path.exists(MODEL_PATH):
+            path = resolve_model_path()
+            # Los procesos del executor cargan el mismo artefacto
+            inference_executor.model_path = path
+            return open_model(path)
+        print(f"❌ Archivo {MODEL_PATH} no encontrado. Ejecuta train_model.py primero.")
     except Exception as e:
         print(f"❌ Error cargando modelo: {e}")
-        model_data = None
+    return None
+
+async def warm_up_executor(current_model: Dict[str, Any]):
+    """Unas predicciones de prueba por worker a través del executor de inferencia"""
+    for _ in range(WARM_UP_ROUNDS):
+        await asyncio.gather(*(
+            run_inference(WARM_UP_ROWS, current_model) for _ in range(inference_executor.workers)
+        ))
+
+async def prepare_model():
+    """Cargar y calentar el modelo en segundo plano al arrancar.
+
+    Mientras tanto la API está viva (/health/live) pero no lista (/health/ready). El
+    calentamiento pasa también por el executor, así con ``process`` cada worker arranca
+    y carga su copia del modelo antes de la primera petición real. ``model_data`` no se
+    publica hasta ese momento: antes, las peticiones reciben 503 en vez de predecir en el
+    event loop con un executor sin pool.
+    """
+    global model_data, model_state
+    model_state = "loading"
+    started = time.perf_counter()
+    new_model = await asyncio.to_thread(load_model)
+    startup_timings["load_seconds"] = time.perf_counter() - started
+    if new_model is None:
+        model_state = "failed"
+        return
 
-# Cargar modelo al iniciar
-load_model()
+    model_state = "warming"
+    started = time.perf_counter()
+    try:
+        # El pool se crea ahora: el executor ya conoce la ruta definitiva del modelo
+        inference_executor.start()
+        await asyncio.to_thread(warm_up_model, new_model)
+        await warm_up_executor(new_model)
+    except Exception as e:
+        print(f"❌ Error calentando el modelo: {e}")
+        model_state = "failed"
+        return
+    startup_timings["warm_up_seconds"] = time.perf_counter() - started
+    await load_candidates()
+    # Las métricas empiezan después del calentamiento: sus filas no son tráfico real
+    inference_executor.observer = record_inference
+    model_data = new_model
+    model_state = "ready"
+    print(
+        f"🔥 API lista. Import: {startup_timings['import_seconds']:.2f}s, "
+        f"carga: {startup_timings['load_seconds']:.2f}s, "
+        f"calentamiento: {startup_timings['warm_up_seconds']:.2f}s"
+    )
+
+async def load_candidates():
+    """Cargar y calentar los modelos candidatos y preparar sus executors y la sombra.
+
+    Los candidatos no se recargan con el modelo principal.
+    """
+    global candidate_executor, shadow_scorer
+    if not model_registry.paths:
+        return
+    await asyncio.to_thread(model_registry.load, warm_up_model)
+    if model_registry.models and inference_executor.kind == "process":
+        candidate_executor = InferenceExecutor(
+            kind="thread", workers=INFERENCE_WORKERS, max_queue=INFERENCE_MAX_QUEUE
+        )
+        candidate_executor.start()
+        candidate_executor.observer = record_inference
+    if SHADOW_MODEL in model_registry.models:
+        shadow_executor = InferenceExecutor(kind="thread", workers=SHADOW_WORKERS, max_queue=SHADOW_MAX_QUEUE)
+        shadow_executor.start()
+        shadow_scorer = ShadowScorer(
+            SHADOW_MODEL, model_registry.models[SHADOW_MODEL], SHADOW_SAMPLE_RATE, shadow_executor
+        )
+        shadow_scorer.observer = record_shadow
+        print(f"👥 Evaluación en sombra con {SHADOW_MODEL} en el {SHADOW_SAMPLE_RATE:.0%} de las predicciones")
+
+async def reload_model() -> Dict[str, Any]:
+    """Volver a cargar MODEL_PATH y cambiar de modelo sin cortar peticiones.
+
+    La carga y el calentamiento ocurren fuera del event loop mientras el modelo actual
+    sigue respondiendo; después se sustituye la referencia global en una sola asignación.
+    Las peticiones en curso ya tienen su referencia (o su proceso del pool anterior) y
+    terminan con el modelo viejo. Si la carga falla, el modelo actual sigue activo.
+    """
+    global model_data, model_reload_lock, model_state
+    if model_reload_lock is None:
+        model_reload_lock = asyncio.Lock()
+
+    async with model_reload_lock:
+        previous_version = model_data['model_version'] if model_data is not None else None
+        started = time.perf_counter()
+        try:
+            path = await asyncio.to_thread(resolve_model_path)
+            new_model = await asyncio.to_thread(open_model, path)
+            await asyncio.to_thread(warm_up_model, new_model)
+            await inference_executor.swap_model(path, WARM_UP_ROWS)
+            if model_state == "failed":
+                # Arrancó sin modelo: el pool se crea y se calienta antes de publicarlo
+                inference_executor.start()
+                await warm_up_executor(new_model)
+        except Exception as e:
+            model_reload_stats["failures"] += 1
+            model_reload_stats["last_error"] = str(e)
+            print(f"❌ Error recargando modelo, se mantiene la versión {previous_version}: {e}")
+            raise
+
+        model_data = new_model
+        prediction_cache.clear()
+        if model_state == "failed":
+            await load_candidates()
+            inference_executor.observer = record_inference
+        model_state = "ready"
+        if MODEL_SHARING == "mmap":
+            # Este worker ya no usa el artefacto anterior: borrarlo si tampoco lo usa otro
+            try:
+                await inference_executor.wait_retired()
+                await asyncio.to_thread(remove_unused_shared_artifacts, MODEL_PATH, MODEL_SHARED_DIR, path)
+            except OSError as e:
+                print(f"⚠️ No se pudieron borrar artefactos compartidos anteriores: {e}")
+        elapsed = time.perf_counter() - started
+        model_reload_stats["reloads"] += 1
+        model_reload_stats["last_reload_seconds"] = elapsed
+        model_reload_stats["last_error"] = None
+        print(f"🔄 Modelo recargado: {previous_version} → {new_model['model_version']} en {elapsed:.2f}s")
+        return {
+            "previous_version": previous_version,
+            "model_version": new_model['model_version'],
+            "reload_seconds": elapsed
+        }
+
+def model_file_signature() -> Optional[Tuple[int, int]]:
+    """Tamaño y fecha de MODEL_PATH (de header.json si es un artefacto), o None si no existe"""
+    path = os.path.join(MODEL_PATH, "header.json") if os.path.isdir(MODEL_PATH) else MODEL_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+async def watch_model_file():
+    """Recargar el modelo cuando MODEL_PATH cambia y deja de cambiar durante un intervalo"""
+    loaded = model_file_signature()
+    seen = loaded
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        current = model_file_signature()
+        # Esperar a que el archivo esté estable: no cargar un modelo a medio escribir
+        if current is not None and current == seen and current != loaded:
+            try:
+                await reload_model()
+            except Exception:
+                pass
+            loaded = current
+        seen = current
+
+async def run_inference(
+    feature_array: np.ndarray,
+    current_model: Optional[Dict[str, Any]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Predecir una matriz 2-D en el executor de inferencia con ``current_model`` (por
+    defecto el modelo activo).
+
+    Las predicciones del modelo principal se muestrean para la evaluación en sombra, que
+    corre en su propia tarea: aquí no se espera al candidato.
+
+    Devuelve (calidades, confianzas, probabilidades, identidad del modelo que predijo).
+    """
+    current_model = current_model or model_data
+    if model_registry.is_candidate(current_model):
+        return await (candidate_executor or inference_executor).run(current_model, feature_array)
+    result = await inference_executor.run(current_model, feature_array)
+    if shadow_scorer is not None:
+        shadow_scorer.maybe_score(feature_array, result[0], result[2], result[3]['classes'])
+    return result
+
+async def run_inference_rows(feature_array: np.ndarray) -> Tuple[Any, ...]:
+    """run_inference con la identidad del modelo repetida por fila (para el micro-batcher)"""
+    predictions, confidences, probabilities, served = await run_inference(feature_array)
+    return predictions, confidences, probabilities, [served] * len(predictions)
+
+def class_probabilities(probabilities: np.ndarray, classes: List[str]) -> Dict[str, float]:
+    """Convertir un vector de probabilidades en un dict {clase: probabilidad}"""
+    return {label: float(p) for label, p in zip(classes, probabilities)}
+
+async def predict_row(
+    row: List[float],
+    current_model: Optional[Dict[str, Any]] = None
+) -> Tuple[str, float, Dict[str, float], str]:
+    """Predecir una sola fila con ``current_model`` (por defecto el modelo activo): primero
+    la caché, luego el micro-batcher si está activo (sólo agrupa filas del modelo activo).
+
+    Devuelve (calidad, confianza, probabilidades, versión del modelo que respondió).
+    """
+    current_model = current_model or model_data
+    if prediction_cache.enabled:
+        cached = prediction_cache.get(prediction_cache.key(current_model['model_version'], row))
+        if cached is not None:
+            quality, confidence, probabilities, version = cached
+            return quality, confidence, dict(probabilities), version
+        cache_row, row = row, prediction_cache.quantize(row)
+
+    if micro_batcher is not None and current_model is model_data:
+        quality, confidence, probabilities, served = await micro_batcher.submit(row)
+    else:
+        predictions, confidences, probability_matrix, served = await run_inference(
+            np.array([row], dtype=np.float64), current_model
+        )
+        quality, confidence, probabilities = predictions[0], confidences[0], probability_matrix[0]
+    result = (
+        str(quality),
+        float(confidence),
+        class_probabilities(probabilities, served['classes']),
+        served['model_version']
+    )
+
+    if prediction_cache.enabled:
+        # Se guarda bajo la versión que respondió, que puede ser la anterior a una recarga
+        prediction_cache.put(prediction_cache.key(result[3], cache_row), result)
+        return result[0], result[1], dict(result[2]), result[3]
+    return result
+
+async def flush_metrics():
+    """Escribir periódicamente las métricas de este worker en METRICS_DIR"""
+    while True:
+        try:
+            await asyncio.to_thread(metrics_snapshots.write, metrics_registry)
+        except OSError as e:
+            print(f"⚠️ No se pudieron escribir las métricas en {METRICS_DIR}: {e}")
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
 
 @app.on_event("startup")
 async def startup_event():
     """Evento de inicio de la aplicación"""
+    global micro_batcher, model_watch_task, model_startup_task, metrics_flush_task, tcp_listener
     print("🚀 Coffee Quality Classifier API iniciada")
-    if model_data is None:
-        print("⚠️ Modelo no cargado. Algunas funcionalidades no estarán disponibles.")
+    # La carga del modelo no bloquea el arranque: /health/ready indica cuándo termina
+    model_startup_task = asyncio.create_task(prepare_model())
+    print(f"⚙️ Executor de inferencia: {inference_executor.kind} ({inference_executor.workers} workers)")
+    if MICROBATCH_ENABLED:
+        micro_batcher = MicroBatcher(
+            run_inference_rows,
+            max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+            max_batch=MICROBATCH_MAX_BATCH
+        )
+        micro_batcher.start()
+        print(f"📦 Micro-batching activo: {MICROBATCH_MAX_WAIT_MS} ms / {MICROBATCH_MAX_BATCH} filas")
+    if MODEL_WATCH_ENABLED:
+        model_watch_task = asyncio.create_task(watch_model_file())
+        print(f"👀 Vigilando {MODEL_PATH} cada {MODEL_WATCH_INTERVAL}s para recargar el modelo")
+    if metrics_snapshots is not None:
+        metrics_flush_task = asyncio.create_task(flush_metrics())
+    if TCP_PORT:
+        # Hasta que el modelo esté listo las peticiones TCP reciben STATUS_ERROR
+        tcp_server = PredictionServer(
+            lambda: model_data if model_state == "ready" else None,
+            inference_executor,
+            max_rows=MAX_BATCH_SIZE
+        )
+        tcp_listener = await start_tcp_server(tcp_server, TCP_HOST, TCP_PORT)
+        print(f"🔌 Servidor TCP binario en {TCP_HOST}:{TCP_PORT}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento de cierre de la aplicación"""
+    global micro_batcher, model_watch_task, model_startup_task, metrics_flush_task, tcp_listener
+    global candidate_executor, shadow_scorer
+    if tcp_listener is not None:
+        tcp_listener.close()
+        tcp_listener = None
+    if model_startup_task is not None:
+        model_startup_task.cancel()
+        model_startup_task = None
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+        model_watch_task = None
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+        micro_batcher = None
+    inference_executor.shutdown()
+    if candidate_executor is not None:
+        candidate_executor.shutdown()
+        candidate_executor = None
+    if shadow_scorer is not None:
+        await shadow_scorer.stop()
+        shadow_scorer.executor.shutdown()
+        shadow_scorer = None
+    if metrics_flush_task is not None:
+        metrics_flush_task.cancel()
+        metrics_flush_task = None
+        # Los contadores de este worker siguen en el total tras su salida; sus gauges no
+        metrics_snapshots.write(metrics_registry, final=True)
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """Página principal con formulario"""
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="es">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Clasificador de Calidad de Café</title>
-        <style>
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                max-width: 800px;
-                margin: 0 auto;
-                padding: 20px;
-                background: linear-gradient(135deg, #8B4513 0%, #D2691E 100%);
-                min-height: 100vh;
-            }
-            .container {
-                background: white;
-                padding: 30px;
-                border-radius: 15px;
-                box-shadow: 0 10px 25px rgba(0,0,0,0.2);
-            }
-            h1 {
-                color: #8B4513;
-                text-align: center;
-                margin-bottom: 30px;
-                font-size: 2.5em;
-            }
-            .form-group {
-                margin-bottom: 20px;
-            }
-            label {
-                display: block;
-                margin-bottom: 5px;
-                font-weight: bold;
-                color: #5D4037;
-            }
-            input[type="number"] {
-                width: 100%;
-                padding: 12px;
-                border: 2px solid #D7CCC8;
-                border-radius: 8px;
-                font-size: 16px;
-                transition: border-color 0.3s;
-            }
-            input[type="number"]:focus {
-                border-color: #8B4513;
-                outline: none;
-            }
-            .btn {
-                background: #8B4513;
-                color: white;
-                padding: 15px 30px;
-                border: none;
-                border-radius: 8px;
-                font-size: 18px;
-                cursor: pointer;
-                width: 100%;
-                transition: background-color 0.3s;
-            }
-            .btn:hover {
-                background: #6D4C41;
-            }
-            .result {
-                margin-top: 20px;
-                padding: 20px;
-                border-radius: 8px;
-                display: none;
-            }
-            .result.show {
-                display: block;
-            }
-            .result.premium {
-                background: #E8F5E8;
-                border: 2px solid #4CAF50;
-                color: #2E7D32;
-            }
-            .result.bueno {
-                background: #FFF3E0;
-                border: 2px solid #FF9800;
-                color: #E65100;
-            }
-            .result.regular {
-                background: #FFEBEE;
-                border: 2px solid #F44336;
-                color: #C62828;
-            }
-            .info {
-                background: #E3F2FD;
-                padding: 15px;
-                border-radius: 8px;
-                margin-bottom: 20px;
-                border-left: 4px solid #2196F3;
-            }
-            .loading {
-                display: none;
-                text-align: center;
-                margin-top: 20px;
-                padding: 20px;
-                background: #f0f0f0;
-                border-radius: 8px;
-                border: 2px solid #ddd;
-            }
-            .loading.show {
-                display: block !important;
-            }
-            .coffee-icon {
-                font-size: 3em;
-                text-align: center;
-                margin-bottom: 20px;
-            }
-            /* Asegurar que los resultados sean visibles */
-            .result {
-                margin-top: 20px !important;
-                padding: 20px !important;
-                border-radius: 8px !important;
-                display: none !important;
-            }
-            .result.show {
-                display: block !important;
-                animation: fadeIn 0.5s ease-in;
-            }
-            @keyframes fadeIn {
-                from { opacity: 0; }
-                to { opacity: 1; }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="coffee-icon">☕</div>
-            <h1>Clasificador de Calidad de Café</h1>
-            
-            <div class="info">
-                <strong>ℹ️ Instrucciones:</strong><br>
-                Ingresa las características de tu café para obtener una clasificación de calidad.
-                <ul>
-                    <li><strong>Acidez:</strong> Nivel de acidez (1-10)</li>
-                    <li><strong>Dulzura:</strong> Nivel de dulzura (1-10)</li>
-                    <li><strong>Cuerpo:</strong> Intensidad del cuerpo (1-10)</li>
-                    <li><strong>Aroma:</strong> Intensidad del aroma (1-10)</li>
-                    <li><strong>Altitud:</strong> Metros sobre el nivel del mar (500-2000)</li>
-                </ul>
-            </div>
-
-            <form id="coffeeForm">
-                <div class="form-group">
-                    <label for="acidity">Acidez (1-10):</label>
-                    <input type="number" id="acidity" name="acidity" min="1" max="10" step="0.1" value="5.5" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="sweetness">Dulzura (1-10):</label>
-                    <input type="number" id="sweetness" name="sweetness" min="1" max="10" step="0.1" value="7.0" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="body">Cuerpo (1-10):</label>
-                    <input type="number" id="body" name="body" min="1" max="10" step="0.1" value="6.8" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="aroma">Aroma (1-10):</label>
-                    <input type="number" id="aroma" name="aroma" min="1" max="10" step="0.1" value="7.2" required>
-                </div>
-                
-                <div class="form-group">
-                    <label for="altitude">Altitud (metros):</label>
-                    <input type="number" id="altitude" name="altitude" min="500" max="2000" step="1" value="1200" required>
-                </div>
-                
-                <button type="submit" class="btn">🔍 Clasificar Café</button>
-            </form>
-            
-            <div class="loading" id="loading">
-                <p>⏳ Analizando café...</p>
-            </div>
-            
-            <div class="result" id="result">
-                <h3 id="resultTitle"></h3>
-                <p id="resultText"></p>
-                <p id="confidenceText"></p>
-            </div>
-        </div>
-
-        <script>
-            document.getElementById('coffeeForm').addEventListener('submit', async (e) => {
-                e.preventDefault();
-                console.log('Formulario enviado'); // Debug
-                
-                const loading = document.getElementById('loading');
-                const result = document.getElementById('result');
-                
-                // Mostrar loading
-                loading.className = 'loading show';
-                result.className = 'result';
-                
-                // Obtener valores del formulario
-                const acidity = document.getElementById('acidity').value;
-                const sweetness = document.getElementById('sweetness').value;
-                const body = document.getElementById('body').value;
-                const aroma = document.getElementById('aroma').value;
-                const altitude = document.getElementById('altitude').value;
-                
-                console.log('Valores:', { acidity, sweetness, body, aroma, altitude }); // Debug
-                
-                const formData = new FormData();
-                formData.append('acidity', acidity);
-                formData.append('sweetness', sweetness);
-                formData.append('body', body);
-                formData.append('aroma', aroma);
-                formData.append('altitude', altitude);
-                
-                try {
-                    console.log('Enviando petición...'); // Debug
-                    const response = await fetch('/predict', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    
-                    console.log('Respuesta recibida:', response.status); // Debug
-                    const data = await response.json();
-                    console.log('Datos:', data); // Debug
-                    
-                    if (response.ok) {
-                        const resultTitle = document.getElementById('resultTitle');
-                        const resultText = document.getElementById('resultText');
-                        const confidenceText = document.getElementById('confidenceText');
-                        
-                        resultTitle.textContent = `Calidad: ${data.quality}`;
-                        resultText.textContent = getQualityDescription(data.quality);
-                        confidenceText.textContent = `Confianza: ${(data.confidence * 100).toFixed(1)}%`;
-                        
-                        result.className = `result show ${data.quality.toLowerCase()}`;
-                        console.log('Resultado mostrado correctamente'); // Debug
-                    } else {
-                        throw new Error(data.detail || 'Error desconocido');
-                    }
-                } catch (error) {
-                    console.error('Error:', error); // Debug
-                    const resultTitle = document.getElementById('resultTitle');
-                    const resultText = document.getElementById('resultText');
-                    const confidenceText = document.getElementById('confidenceText');
-                    
-                    resultTitle.textContent = 'Error';
-                    resultText.textContent = `Error: ${error.message}`;
-                    confidenceText.textContent = '';
-                    result.className = 'result show regular';
-                }
-                
-                loading.className = 'loading';
-                console.log('Loading oculto'); // Debug
-            });
-            
-            function getQualityDescription(quality) {
-                const descriptions = {
-                    'Premium': '🏆 ¡Excelente café! Este café tiene características superiores que lo hacen ideal para los paladares más exigentes.',
-                    'Bueno': '👍 Buen café con características sólidas. Una elección confiable para el consumo diario.',
-                    'Regular': '⚠️ Café de calidad básica. Podría beneficiarse de mejoras en el procesamiento o origen.'
-                };
-                return descriptions[quality] || 'Calidad no reconocida.';
-            }
-        </script>
-    </body>
-    </html>
+async def read_root(request: Request):
+    """Página principal con formulario (static/home.html, servida desde memoria)"""
+    return static_assets.response("home.html", request.headers)
+
+def with_timing(response: BaseModel) -> Any:
+    """Devolver ``response`` tal cual o, si la petición pidió ?debug=timing, con un bloque
+    "timing" (ms por etapa hasta este punto; serialize sólo va en Server-Timing)"""
+    timing = request_timing.finish_handler()
+    if timing is None:
+        return response
+    return JSONResponse(content=dict(jsonable_encoder(response), timing=timing))
+
+def select_model(requested_version: Optional[str]) -> Dict[str, Any]:
+    """Modelo de una petición: el de X-Model-Version (alias, model_version o "primary"),
+    si no el candidato que toque según COFFEE_TRAFFIC_SPLIT, si no el principal.
+
+    404 si se pide una versión que no está cargada.
     """
-    return html_content
+    if requested_version:
+        if requested_version in ("primary", model_data['model_version']):
+            selected = None
+        else:
+            selected = model_registry.get(requested_version)
+            if selected is None:
+                raise HTTPException(status_code=404, detail=f"Versión de modelo no cargada: {requested_version}")
+    else:
+        selected = model_registry.route()
+    
+    if selected is None:
+        model_requests_total.inc("primary")
+        return model_data
+    alias, candidate = selected
+    model_registry.record(alias)
+    model_requests_total.inc(alias)
+    return candidate
+
+def validate_row(row: List[float]):
+    """Comprobar los rangos de una fila; 400 con el mensaje de la primera característica fuera de rango"""
+    started = time.perf_counter()
+    error = feature_validator.first_error(row)
+    validation_seconds = time.perf_counter() - started
+    stage_duration.observe(validation_seconds, "validation")
+    request_timing.record("validate", validation_seconds)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
+
+def prediction_response(
+    quality: str,
+    confidence: float,
+    probabilities: Dict[str, float],
+    features: Dict[str, float],
+    version: str,
+    echo_features: Optional[bool]
+) -> Any:
+    """Respuesta de una predicción individual.
+
+    Con FAST_JSON_ENABLED se escriben directamente los bytes a partir de la plantilla del
+    modelo: los valores salen del propio modelo, así que no se vuelven a validar. Si no,
+    se pasa por PredictionResponse como siempre.
+    """
+    if echo_features is None:
+        echo_features = ECHO_FEATURES
+    features = features if echo_features else None
+    timing = request_timing.finish_handler()
+    if FAST_JSON_ENABLED:
+        template = prediction_template(version, tuple(probabilities))
+        body = template.encode(
+            quality, confidence, probabilities.values(), features,
+            extra={"timing": timing} if timing is not None else None
+        )
+        return Response(content=body, media_type="application/json")
+
+    response = PredictionResponse(
+        quality=quality,
+        confidence=confidence,
+        probabilities=probabilities,
+        features=features,
+        model_version=version
+    )
+    if timing is None and features is not None:
+        return response
+    content = jsonable_encoder(response, exclude_none=True)
+    if timing is not None:
+        content['timing'] = timing
+    return JSONResponse(content=content)
 
 @app.post("/predict", response_model=PredictionResponse)
 async def predict_coffee_quality(
@@ -351,93 +818,389 @@ async def predict_coffee_quality(
     sweetness: float = Form(...),
     body: float = Form(...),
     aroma: float = Form(...),
-    altitude: float = Form(...)
+    altitude: float = Form(...),
+    echo_features: Optional[bool] = None,
+    x_model_version: Optional[str] = Header(None)
 ):
     """Predecir la calidad del café basado en características"""
+    request_timing.start_handler()
     
     if model_data is None:
         raise HTTPException(status_code=503, detail="Modelo no disponible. Entrena el modelo primero.")
     
+    features = {
+        'acidity': acidity,
+        'sweetness': sweetness,
+        'body': body,
+        'aroma': aroma,
+        'altitude': altitude
+    }
+    row = [acidity, sweetness, body, aroma, altitude]
+    validate_row(row)
+    current_model = select_model(x_model_version)
+    
     try:
-        # Validar entrada
-        features = {
-            'acidity': acidity,
-            'sweetness': sweetness,
-            'body': body,
-            'aroma': aroma,
-            'altitude': altitude
-        }
-        
-        # Validaciones básicas
-        if not (1 <= acidity <= 10):
-            raise HTTPException(status_code=400, detail="Acidez debe estar entre 1 y 10")
-        if not (1 <= sweetness <= 10):
-            raise HTTPException(status_code=400, detail="Dulzura debe estar entre 1 y 10")
-        if not (1 <= body <= 10):
-            raise HTTPException(status_code=400, detail="Cuerpo debe estar entre 1 y 10")
-        if not (1 <= aroma <= 10):
-            raise HTTPException(status_code=400, detail="Aroma debe estar entre 1 y 10")
-        if not (500 <= altitude <= 2000):
-            raise HTTPException(status_code=400, detail="Altitud debe estar entre 500 y 2000 metros")
-        
-        # Preparar datos para predicción
-        feature_array = np.array([[acidity, sweetness, body, aroma, altitude]])
-        feature_array_scaled = model_data['scaler'].transform(feature_array)
-        
-        # Hacer predicción
-        prediction = model_data['model'].predict(feature_array_scaled)[0]
-        prediction_proba = model_data['model'].predict_proba(feature_array_scaled)[0]
+        # Hacer predicción (agrupada con otras peticiones si hay micro-batching)
+        prediction, confidence, probabilities, version = await predict_row(row, current_model)
         
-        # Obtener confianza
-        confidence = float(max(prediction_proba))
-        
-        return PredictionResponse(
-            quality=prediction,
-            confidence=confidence,
-            features=features
-        )
+        return prediction_response(prediction, confidence, probabilities, features, version, echo_features)
         
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en predicción: {str(e)}")
 
 @app.post("/predict-json", response_model=PredictionResponse)
-async def predict_coffee_quality_json(features: CoffeeFeatures):
+async def predict_coffee_quality_json(
+    features: CoffeeFeatures,
+    echo_features: Optional[bool] = None,
+    x_model_version: Optional[str] = Header(None)
+):
     """Predecir calidad del café usando JSON (para APIs)"""
+    request_timing.start_handler()
     
     if model_data is None:
         raise HTTPException(status_code=503, detail="Modelo no disponible. Entrena el modelo primero.")
     
+    row = [features.acidity, features.sweetness, features.body, features.aroma, features.altitude]
+    validate_row(row)
+    current_model = select_model(x_model_version)
+    
     try:
-        # Preparar datos
-        feature_array = np.array([[
-            features.acidity, features.sweetness, features.body, 
-            features.aroma, features.altitude
-        ]])
-        feature_array_scaled = model_data['scaler'].transform(feature_array)
-        
-        # Predicción
-        prediction = model_data['model'].predict(feature_array_scaled)[0]
-        prediction_proba = model_data['model'].predict_proba(feature_array_scaled)[0]
-        confidence = float(max(prediction_proba))
+        # Predicción (agrupada con otras peticiones si hay micro-batching)
+        prediction, confidence, probabilities, version = await predict_row(row, current_model)
         
-        return PredictionResponse(
-            quality=prediction,
-            confidence=confidence,
-            features=features.dict()
-        )
+        return prediction_response(prediction, confidence, probabilities, features.dict(), version, echo_features)
         
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en predicción: {str(e)}")
 
+def validate_batch_row(row: Any) -> Tuple[Optional[CoffeeFeatures], Optional[str]]:
+    """Validar una fila del lote; devuelve (características, error)"""
+    try:
+        features = CoffeeFeatures.parse_obj(row)
+    except ValidationError as e:
+        # Si la fila no es un objeto el error no tiene campo (``loc`` vacío)
+        errors = "; ".join(
+            f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" if err['loc'] else err['msg']
+            for err in e.errors()
+        )
+        return None, errors
+
+    error = feature_validator.first_error([getattr(features, name) for name in FEATURE_RANGES])
+    if error is not None:
+        return None, error
+
+    return features, None
+
+def validate_rows(rows: List[Any], feature_names: List[str]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Validar filas JSON de una vez: matriz de características (columnas en el orden de
+    ``feature_names``) y error por fila (None = válida).
+
+    Los rangos se comprueban sobre toda la matriz; sólo las filas que no se pueden
+    convertir directamente (no son dicts, faltan campos, valores no numéricos) pasan por
+    Pydantic para obtener su mensaje de error.
+    """
+    features, unparsed = rows_to_matrix(rows, feature_names)
+    errors = validator_for(tuple(feature_names)).row_errors(features)
+    for i in np.flatnonzero(unparsed).tolist():
+        parsed, errors[i] = validate_batch_row(rows[i])
+        if parsed is not None:
+            features[i] = [getattr(parsed, name) for name in feature_names]
+    return features, errors
+
+# /predict-batch acepta JSON o, para clientes de alto volumen, una matriz binaria
+BATCH_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": BatchPredictionRequest.schema()},
+            RAW_MATRIX_MEDIA_TYPE: {
+                "schema": {"type": "string", "format": "binary"},
+                "description": "Matriz little-endian filas × características (orden de /model-info), "
+                               "con X-Matrix-Shape: 'filas,columnas' y X-Matrix-Dtype: float32 o float64"
+            },
+            ARROW_STREAM_MEDIA_TYPE: {
+                "schema": {"type": "string", "format": "binary"},
+                "description": "Stream Arrow IPC con una columna numérica por característica"
+            }
+        }
+    }
+}
+
+async def read_batch(request: Request, feature_names: List[str]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Leer el cuerpo de /predict-batch según su Content-Type y validarlo.
+
+    Devuelve la matriz de características y el error de cada fila (None = válida). Los
+    formatos binarios llegan ya como matriz: no hay JSON que parsear ni Pydantic por fila.
+    """
+    started = time.perf_counter()
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    body = await request.body()
+    
+    if content_type in BINARY_MEDIA_TYPES:
+        try:
+            features = decode_matrix(body, content_type, request.headers, feature_names)
+        except BinaryFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        check_batch_size(len(features))
+        validation_started = time.perf_counter()
+        errors = validator_for(tuple(feature_names)).row_errors(features)
+    elif content_type == "application/json":
+        try:
+            batch = BatchPredictionRequest.parse_obj(json.loads(body))
+        except ValueError as e:
+            # Mismo 422 que si FastAPI hubiese parseado el cuerpo
+            errors = e.errors() if isinstance(e, ValidationError) else [
+                {"type": "json_invalid", "loc": (), "msg": f"JSON inválido: {e}", "input": None}
+            ]
+            raise RequestValidationError([dict(err, loc=("body",) + tuple(err["loc"])) for err in errors])
+        check_batch_size(len(batch.rows))
+        validation_started = time.perf_counter()
+        features, errors = validate_rows(batch.rows, feature_names)
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type no soportado: {content_type}. Opciones: application/json, {', '.join(BINARY_MEDIA_TYPES)}"
+        )
+    
+    validation_seconds = time.perf_counter() - validation_started
+    stage_duration.observe(validation_seconds, "validation")
+    request_timing.record("parse", validation_started - started)
+    request_timing.record("validate", validation_seconds)
+    return features, errors
+
+def check_batch_size(rows: int):
+    if rows > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote excede el máximo de {MAX_BATCH_SIZE} filas"
+        )
+    request_batch_rows.observe(rows, "/predict-batch")
+
+@app.post("/predict-batch", response_model=BatchPredictionResponse, openapi_extra=BATCH_OPENAPI)
+async def predict_coffee_quality_batch(request: Request):
+    """Predecir la calidad de muchos cafés en una sola pasada vectorizada"""
+    request_timing.start_handler()
+    
+    if model_data is None:
+        raise HTTPException(status_code=503, detail="Modelo no disponible. Entrena el modelo primero.")
+    
+    # Todo el lote usa el mismo modelo aunque haya una recarga a mitad de petición
+    current_model = select_model(request.headers.get("x-model-version"))
+    version = None
+    
+    # Validar cada fila por separado: los errores no invalidan el lote completo
+    features, errors = await read_batch(request, current_model['feature_names'])
+    # Dicts con los campos de BatchPredictionItem, en su orden
+    items = [
+        {"index": i, "quality": None, "confidence": None, "probabilities": None, "error": error}
+        for i, error in enumerate(errors)
+    ]
+    valid_indices = [i for i, error in enumerate(errors) if error is None]
+    
+    if valid_indices:
+        try:
+            # Una sola matriz 2-D para escalar y predecir todo el lote
+            predictions, confidences, probability_matrix, served = await run_inference(
+                features[valid_indices], current_model
+            )
+        except ExecutorSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error en predicción: {str(e)}")
+        
+        classes = served['classes']
+        # tolist() convierte toda la matriz a floats de Python de una vez
+        for i, quality, confidence, probabilities in zip(
+            valid_indices, predictions.tolist(), confidences.tolist(), probability_matrix.tolist()
+        ):
+            items[i]["quality"] = str(quality)
+            items[i]["confidence"] = confidence
+            items[i]["probabilities"] = dict(zip(classes, probabilities))
+        version = served['model_version']
+    
+    content = {
+        "predictions": items,
+        "total": len(items),
+        "valid": len(valid_indices),
+        "invalid": len(items) - len(valid_indices),
+        "model_version": version
+    }
+    if FAST_JSON_ENABLED:
+        # Los items ya tienen la forma de BatchPredictionItem: se codifican sin revalidar
+        timing = request_timing.finish_handler()
+        if timing is not None:
+            content["timing"] = timing
+        return FastJSONResponse(content=content)
+    return with_timing(BatchPredictionResponse(**content))
+
+async def iter_ndjson_lines(request: Request):
+    """Líneas no vacías del cuerpo NDJSON a medida que llegan, sin acumular el cuerpo"""
+    pending = b""
+    async for chunk in request.stream():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        if len(pending) > STREAM_MAX_LINE_BYTES:
+            raise ValueError(f"Línea de más de {STREAM_MAX_LINE_BYTES} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+async def score_ndjson(request: Request, current_model: Dict[str, Any]):
+    """Validar y predecir el NDJSON en bloques de STREAM_CHUNK_ROWS filas, generando NDJSON.
+
+    En memoria sólo hay un bloque de filas a la vez. Cada línea de salida lleva el índice
+    de la fila de entrada y su predicción o su error de validación.
+    """
+    feature_names = current_model['feature_names']
+    results = []  # (índice, error de JSON) en orden; error None = fila a validar
+    rows = []  # filas JSON del bloque, una por cada resultado sin error de JSON
+    parse_seconds = 0.0
+
+    async def flush():
+        nonlocal parse_seconds
+        # Rangos de todo el bloque en una pasada; una observación de validación por bloque
+        validation_started = time.perf_counter()
+        features, row_errors = validate_rows(rows, feature_names)
+        stage_duration.observe(parse_seconds + time.perf_counter() - validation_started, "validation")
+        parse_seconds = 0.0
+        valid = [i for i, error in enumerate(row_errors) if error is None]
+        if valid:
+            predictions, confidences, probability_matrix, served = await run_inference(
+                features[valid], current_model
+            )
+            predicted = iter(zip(predictions, confidences, probability_matrix))
+        row_errors = iter(row_errors)
+        lines = []
+        for index, error in results:
+            if error is None:
+                error = next(row_errors)
+            if error is not None:
+                item = {"index": index, "error": error}
+            else:
+                quality, confidence, probabilities = next(predicted)
+                item = {
+                    "index": index,
+                    "quality": str(quality),
+                    "confidence": float(confidence),
+                    "probabilities": class_probabilities(probabilities, served['classes']),
+                    "model_version": served['model_version']
+                }
+            lines.append(json.dumps(item, ensure_ascii=False))
+        results.clear()
+        rows.clear()
+        return "\n".join(lines) + "\n"
+
+    index = 0
+    try:
+        async for line in iter_ndjson_lines(request):
+            parse_started = time.perf_counter()
+            try:
+                rows.append(json.loads(line))
+                error = None
+            except ValueError as e:
+                error = f"JSON inválido: {e}"
+            parse_seconds += time.perf_counter() - parse_started
+            results.append((index, error))
+            index += 1
+            if len(results) >= STREAM_CHUNK_ROWS:
+                yield await flush()
+        if results:
+            yield await flush()
+    except (ExecutorSaturated, ValueError) as e:
+        # El error va como última línea: las filas anteriores ya tienen su resultado
+        yield json.dumps({"error": str(e), "rows_processed": index}, ensure_ascii=False) + "\n"
+    finally:
+        request_batch_rows.observe(index, "/predict-stream")
+
+async def iter_spooled(spool, chunk_size: int = 1024 * 1024):
+    """Emitir el contenido de un archivo temporal en bloques y cerrarlo al terminar"""
+    try:
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        spool.close()
+
+@app.post("/predict-stream")
+async def predict_coffee_quality_stream(request: Request):
+    """Predecir un cuerpo NDJSON (una fila CoffeeFeatures por línea) devolviendo NDJSON"""
+    
+    if model_data is None:
+        raise HTTPException(status_code=503, detail="Modelo no disponible. Entrena el modelo primero.")
+    
+    # Los resultados se escriben en un archivo temporal (en memoria hasta STREAM_SPOOL_BYTES,
+    # después en disco) mientras se lee el cuerpo y se devuelven al terminar la subida: la
+    # mayoría de clientes HTTP/1.1 no leen la respuesta hasta haber enviado todo el cuerpo,
+    # así que responder a la vez bloquearía ambos lados. La memoria no crece con el tamaño
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES)
+    try:
+        # Todo el stream usa el mismo modelo aunque haya una recarga a mitad
+        async for block in score_ndjson(request, select_model(request.headers.get("x-model-version"))):
+            spool.write(block.encode())
+    except BaseException:
+        spool.close()
+        raise
+    
+    return StreamingResponse(iter_spooled(spool), media_type="application/x-ndjson")
+
 @app.get("/health")
 async def health_check():
     """Verificar estado de la API"""
     return {
         "status": "healthy",
+        "ready": model_state == "ready",
+        "model_state": model_state,
+        "startup": startup_timings,
         "model_loaded": model_data is not None,
-        "model_accuracy": model_data['accuracy'] if model_data else None
+        "model_accuracy": model_data['accuracy'] if model_data else None,
+        "model_version": model_data['model_version'] if model_data else None,
+        "model_reload": dict(model_reload_stats, watching=model_watch_task is not None),
+        "microbatching": micro_batcher.stats() if micro_batcher is not None else None,
+        "inference_executor": inference_executor.stats(),
+        "prediction_cache": prediction_cache.stats()
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: el proceso responde (no depende del modelo)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 200 sólo cuando el modelo está cargado y calentado, 503 mientras tanto"""
+    body = {
+        "ready": model_state == "ready",
+        "model_state": model_state,
+        "model_version": model_data['model_version'] if model_data else None,
+        "startup": startup_timings
+    }
+    if model_state != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus (sumadas entre workers si hay METRICS_DIR)"""
+    if metrics_snapshots is None:
+        snapshots = [metrics_registry.snapshot()]
+    else:
+        # Refrescar el snapshot propio y sumar el último de cada worker
+        await asyncio.to_thread(metrics_snapshots.write, metrics_registry)
+        snapshots = await asyncio.to_thread(metrics_snapshots.read_all)
+    return PlainTextResponse(
+        render(merge_snapshots(snapshots)),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @app.get("/model-info")
 async def model_info():
     """Información del modelo"""
@@ -447,9 +1210,96 @@ async def model_info():
     return {
         "features": model_data['feature_names'],
         "accuracy": model_data['accuracy'],
-        "classes": list(model_data['model'].classes_)
+        "model_version": model_data['model_version'],
+        "classes": [str(label) for label in model_data['classes']],
+        "engine": model_data['engine'],
+        "forest": model_data['forest'].stats() if model_data['forest'] is not None else None,
+        "lookup_table": model_data['lut_report'] if model_data['lut'] is not None else None
     }
 
+@app.get("/models")
+async def list_models():
+    """Modelo principal, candidatos cargados, reparto de tráfico y evaluación en sombra"""
+    primary = None
+    if model_data is not None:
+        primary = {
+            "path": MODEL_PATH,
+            "model_version": model_data['model_version'],
+            "accuracy": model_data['accuracy'],
+            "engine": model_data['engine']
+        }
+    return dict(
+        primary=primary,
+        **model_registry.stats(),
+        shadow=shadow_scorer.stats() if shadow_scorer is not None else None
+    )
+
+def require_admin(token: Optional[str]):
+    """Comprobar la cabecera X-Admin-Token si COFFEE_ADMIN_TOKEN está definido"""
+    if ADMIN_TOKEN is not None and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+@app.post("/admin/reload-model")
+async def admin_reload_model(x_admin_token: Optional[str] = Header(None)):
+    """Recargar el modelo desde disco sin cortar las peticiones en curso"""
+    require_admin(x_admin_token)
+    try:
+        return await reload_model()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error recargando modelo: {str(e)}")
+
+@app.post("/admin/profile")
+async def admin_profile(
+    seconds: float = 10.0,
+    format: str = "collapsed",
+    interval_ms: float = 5.0,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Perfilar este worker durante ``seconds`` mientras sigue atendiendo peticiones.
+
+    ``collapsed`` muestrea las pilas de todos los threads (event loop y threads de
+    inferencia) y devuelve el formato de flamegraph; ``pstats`` activa cProfile en el
+    event loop y devuelve su volcado. Con el executor ``process`` la inferencia ocurre
+    en otros procesos y sólo se ve la espera.
+    """
+    global profiler_running
+    require_admin(x_admin_token)
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Perfilado desactivado (COFFEE_PROFILER=1)")
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato desconocido: {format}. Opciones: {', '.join(PROFILE_FORMATS)}")
+    if not (0 < seconds <= PROFILER_MAX_SECONDS):
+        raise HTTPException(status_code=400, detail=f"seconds debe estar entre 0 y {PROFILER_MAX_SECONDS:g}")
+    if interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="interval_ms debe ser positivo")
+    if profiler_running:
+        raise HTTPException(status_code=409, detail="Ya hay un perfilado en curso en este worker")
+
+    profiler_running = True
+    try:
+        if format == "collapsed":
+            # El muestreo corre en su propio thread: el event loop sigue libre
+            stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000.0)
+            content, media_type = format_collapsed(stacks).encode(), "text/plain; charset=utf-8"
+        else:
+            profile = start_cprofile()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                content = dump_pstats(profile)
+            media_type = "application/octet-stream"
+    finally:
+        profiler_running = False
+
+    filename = f"coffee-{os.getpid()}-{int(time.time())}.{'txt' if format == 'collapsed' else 'prof'}"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+startup_timings["import_seconds"] = time.perf_counter() - IMPORT_STARTED
+
 if __name__ == "__main__":
     print("🚀 Iniciando Coffee Quality Classifier API...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,198 @@
+"""
+Engineer 1 - Medición de carga del modelo
+Arranque en frío (model.pkl frente al artefacto .npy) y memoria por worker de uvicorn
+con y sin modelo compartido
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Se ejecuta en un intérprete nuevo para medir un arranque realmente en frío
+COLD_START_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import numpy as np
+from inference import load_model_data, predict_array
+t1 = time.perf_counter()
+model_data = load_model_data(sys.argv[1], sys.argv[2])
+t2 = time.perf_counter()
+predict_array(model_data, np.array([[5.5, 7.0, 6.8, 7.2, 1200.0]]))
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "load_s": t2 - t1,
+    "first_prediction_s": t3 - t2,
+    "total_s": t3 - t0,
+    "engine": model_data['engine']
+}))
+"""
+
+
+def measure_cold_start(path: str, engine: str, repeats: int) -> dict:
+    """Mediana de varios arranques en frío cargando ``path`` con ``engine``"""
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", COLD_START_SNIPPET, path, engine],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = {"path": path, "engine": runs[0]["engine"], "repeats": repeats}
+    for key in ("import_s", "load_s", "first_prediction_s", "total_s"):
+        result[key] = statistics.median(run[key] for run in runs)
+    return result
+
+
+def read_memory(pid: int) -> dict:
+    """Rss, Pss y memoria privada (USS) de un proceso en kB, desde /proc (sólo Linux)"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss_kb": values.get("Rss", 0),
+        "pss_kb": values.get("Pss", 0),
+        "uss_kb": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    }
+
+
+def worker_pids(master_pid: int) -> list:
+    """Procesos worker lanzados por el master de uvicorn"""
+    pids = []
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        children = [int(pid) for pid in f.read().split()]
+    for pid in children:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            if b"spawn_main" in f.read():
+                pids.append(pid)
+    return pids
+
+
+def measure_workers(workers: int, sharing: str, model_path: str, port: int, timeout: float = 60.0) -> dict:
+    """Arrancar uvicorn con ``workers`` procesos y medir la memoria de cada uno"""
+    env = dict(
+        os.environ,
+        COFFEE_MODEL_PATH=model_path,
+        COFFEE_MODEL_SHARING=sharing,
+        COFFEE_INFERENCE_EXECUTOR="inline"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "uvicorn", "main:app",
+         "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + timeout
+        pids = []
+        while time.time() < deadline:
+            pids = worker_pids(server.pid)
+            if len(pids) == workers:
+                try:
+                    # Una petición real para que el modelo esté tocado en memoria
+                    request = urllib.request.Request(
+                        f"http://127.0.0.1:{port}/predict-json",
+                        data=json.dumps({"acidity": 5.5, "sweetness": 7.0, "body": 6.8,
+                                         "aroma": 7.2, "altitude": 1200}).encode(),
+                        headers={"Content-Type": "application/json"}
+                    )
+                    urllib.request.urlopen(request, timeout=2).read()
+                    break
+                except OSError:
+                    pass
+            time.sleep(0.5)
+        else:
+            raise RuntimeError(f"uvicorn no arrancó {workers} workers en {timeout}s")
+
+        # Dar tiempo a que todos los workers terminen de cargar el modelo
+        time.sleep(3)
+        per_worker = [read_memory(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "sharing": sharing,
+        "workers": len(per_worker),
+        "per_worker": per_worker,
+        "mean_rss_kb": statistics.mean(w["rss_kb"] for w in per_worker),
+        "mean_pss_kb": statistics.mean(w["pss_kb"] for w in per_worker),
+        "mean_uss_kb": statistics.mean(w["uss_kb"] for w in per_worker),
+        "total_pss_kb": sum(w["pss_kb"] for w in per_worker)
+    }
+
+
+def run_cold_start(args) -> dict:
+    print("⏱️ Midiendo arranque en frío...")
+    results = [
+        measure_cold_start(args.pickle, args.engine, args.repeats),
+        measure_cold_start(args.artifact, "fused", args.repeats)
+    ]
+
+    print(f"\n{'Artefacto':<30} {'Motor':<8} {'Import':>9} {'Carga':>9} {'1ª pred.':>9} {'Total':>9}")
+    for r in results:
+        print(
+            f"{r['path']:<30} {r['engine']:<8} {r['import_s'] * 1000:>7.1f}ms {r['load_s'] * 1000:>7.1f}ms "
+            f"{r['first_prediction_s'] * 1000:>7.1f}ms {r['total_s'] * 1000:>7.1f}ms"
+        )
+    speedup = results[0]["total_s"] / results[1]["total_s"]
+    print(f"\n🚀 El artefacto arranca {speedup:.1f}x más rápido que pickle")
+    return {"cold_start": results, "speedup": speedup}
+
+
+def run_workers(args) -> dict:
+    print(f"🧠 Midiendo memoria con {args.workers} workers de uvicorn...")
+    results = [
+        measure_workers(args.workers, "none", args.pickle, args.port),
+        measure_workers(args.workers, "mmap", args.pickle, args.port)
+    ]
+
+    print(f"\n{'Modo':<8} {'Workers':>8} {'RSS medio':>12} {'PSS medio':>12} {'USS medio':>12} {'PSS total':>12}")
+    for r in results:
+        print(
+            f"{r['sharing']:<8} {r['workers']:>8} {r['mean_rss_kb'] / 1024:>10.1f}MB {r['mean_pss_kb'] / 1024:>10.1f}MB "
+            f"{r['mean_uss_kb'] / 1024:>10.1f}MB {r['total_pss_kb'] / 1024:>10.1f}MB"
+        )
+    saved = (results[0]["mean_uss_kb"] - results[1]["mean_uss_kb"]) / 1024
+    print(f"\n📉 Memoria privada ahorrada por worker con el modelo compartido: {saved:.1f} MB")
+    return {"workers": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medir la carga del modelo")
+    parser.add_argument("--pickle", default="model.pkl", help="Ruta del model.pkl")
+    parser.add_argument("--output", help="Guardar los resultados en este archivo JSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cold = subparsers.add_parser("cold-start", help="Arranque en frío: pickle frente a artefacto")
+    cold.add_argument("--artifact", default="model_artifact", help="Directorio del artefacto")
+    cold.add_argument("--engine", default="sklearn", help="Motor para el model.pkl")
+    cold.add_argument("--repeats", type=int, default=5)
+
+    workers = subparsers.add_parser("workers", help="Memoria por worker de uvicorn con y sin modelo compartido")
+    workers.add_argument("--workers", type=int, default=4)
+    workers.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+    results = run_cold_start(args) if args.command == "cold-start" else run_workers(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Engineer 1 - Métricas en formato de texto de Prometheus
+Contadores, gauges e histogramas por proceso, un middleware ASGI que mide cada petición y
+la agregación de las métricas de varios workers de uvicorn
+"""
+
+import bisect
+import glob
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.routing import Mount
+
+# Límites superiores de los buckets (en segundos y en filas)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536, 100_000)
+
+_process_token: Tuple[int, str] = (0, "")
+
+
+def process_token() -> str:
+    """``<pid>-<aleatorio>`` que identifica a este proceso: un pid reutilizado por otro
+    worker tiene otro token, así que no pisa ni hereda las series del anterior"""
+    global _process_token
+    pid = os.getpid()
+    if _process_token[0] != pid:
+        _process_token = (pid, f"{pid}-{uuid.uuid4().hex[:12]}")
+    return _process_token[1]
+
+
+class Metric:
+    """Métrica con etiquetas; cada combinación de valores de etiqueta es una serie.
+
+    Las métricas sólo se actualizan desde el event loop del worker, así que no necesitan
+    lock: incrementar un valor es una búsqueda en un dict y una suma. Cada proceso tiene
+    su propio registro y las series de varios workers se suman al exponerlas.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        return [(labels, value) for labels, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    """Histograma de buckets fijos: por serie, una cuenta por bucket (no acumulada) más
+    el bucket +Inf y la suma de las observaciones. Las cuentas acumuladas que pide el
+    formato de Prometheus se calculan al exponer, no en cada observación."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            # [cuenta por bucket..., cuenta +Inf, suma]
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        return [(labels, list(series)) for labels, series in self._values.items()]
+
+
+class MetricsRegistry:
+    """Conjunto de métricas de un proceso"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia serializable en JSON de todas las series"""
+        return {
+            "pid": os.getpid(),
+            "token": process_token(),
+            "metrics": {
+                name: {
+                    "kind": metric.kind,
+                    "documentation": metric.documentation,
+                    "labelnames": list(metric.labelnames),
+                    "buckets": list(getattr(metric, "buckets", ())),
+                    "samples": [[list(labels), value] for labels, value in metric.samples()]
+                }
+                for name, metric in self.metrics.items()
+            }
+        }
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, aunque sea de otro usuario
+        pass
+    return True
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sumar las series de varios procesos.
+
+    Contadores e histogramas de workers ya terminados se conservan (si no, los totales
+    bajarían); sus gauges se descartan, porque sus peticiones en curso ya no existen. Un
+    snapshot indica si su worker sigue vivo con ``alive`` (lo pone SnapshotDirectory);
+    si no, se mira si su pid existe.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        alive = snapshot.get("alive")
+        if alive is None:
+            alive = pid_alive(snapshot["pid"])
+        for name, metric in snapshot["metrics"].items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric["samples"]:
+                labels = tuple(labels)
+                current = target["samples"].get(labels)
+                if current is None:
+                    target["samples"][labels] = value
+                elif isinstance(value, list):
+                    target["samples"][labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][labels] = current + value
+    return merged
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames: Sequence[str], labels: Sequence[str], le: Optional[str] = None) -> str:
+    pairs = [f'{name}="{escape_label_value(str(value))}"' for name, value in zip(labelnames, labels)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(merged: Dict[str, Any]) -> str:
+    """Texto de exposición de Prometheus (versión 0.0.4) a partir de series agregadas"""
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{format_labels(labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labelnames, labels, repr(float(bound)))} {cumulative}")
+            cumulative += value[-2]
+            lines.append(f"{name}_bucket{format_labels(labelnames, labels, '+Inf')} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labelnames, labels)} {value[-1]}")
+            lines.append(f"{name}_count{format_labels(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class SnapshotDirectory:
+    """Directorio compartido donde cada worker deja su snapshot como ``<token>.json``
+    (ver ``process_token``).
+
+    Escribir sólo el archivo propio (renombrado atómico) evita cualquier lock entre
+    procesos; quien atiende /metrics refresca el suyo y suma los de todos. Los archivos
+    de workers terminados se quedan: sus contadores siguen en el total. Un worker cuenta
+    como terminado si lo dejó escrito al cerrarse (``final``), si su pid ya no existe o si
+    su archivo lleva más de ``max_age`` segundos sin refrescarse.
+    """
+
+    def __init__(self, path: str, max_age: Optional[float] = None):
+        self.path = path
+        self.max_age = max_age
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, registry: MetricsRegistry, final: bool = False):
+        """Escribir el snapshot de este proceso; ``final`` al cerrarse el worker"""
+        snapshot = registry.snapshot()
+        snapshot["final"] = final
+        target = os.path.join(self.path, f"{snapshot['token']}.json")
+        tmp = target + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, target)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        """Snapshots de todos los workers, con ``alive`` indicando si siguen activos"""
+        snapshots = []
+        now = time.time()
+        own_token = process_token()
+        for path in glob.glob(os.path.join(self.path, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+                age = now - os.path.getmtime(path)
+            except (OSError, ValueError):
+                # Otro worker lo está reemplazando
+                continue
+            if snapshot.get("token") == own_token:
+                snapshot["alive"] = True
+            else:
+                snapshot["alive"] = (
+                    not snapshot.get("final")
+                    and (self.max_age is None or age <= self.max_age)
+                    and pid_alive(snapshot["pid"])
+                )
+            snapshots.append(snapshot)
+        return snapshots
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: peticiones por ruta y código, latencia por ruta y peticiones en curso.
+
+    La ruta es la plantilla registrada en la app (no la URL), así las rutas desconocidas
+    se agrupan en ``other`` y el número de series no crece con lo que envíen los clientes.
+    """
+
+    def __init__(self, app, requests_total: Counter, request_duration: Histogram,
+                 in_flight: Gauge, routes: Optional[Iterable[str]] = None):
+        self.app = app
+        self.requests_total = requests_total
+        self.request_duration = request_duration
+        self.in_flight = in_flight
+        self.routes = set(routes) if routes is not None else None
+        self.mounts = []
+
+    def route_label(self, scope) -> str:
+        if self.routes is None:
+            # Las rutas se leen en la primera petición, cuando ya están todas registradas
+            self.routes = {getattr(route, "path", None) for route in scope["app"].routes}
+            self.mounts = [route.path for route in scope["app"].routes if isinstance(route, Mount)]
+        path = scope["path"]
+        if path in self.routes:
+            return path
+        # Todo lo que cuelga de un Mount (p. ej. /static/...) cuenta como el Mount
+        return next((mount for mount in self.mounts if path.startswith(mount + "/")), "other")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self.route_label(scope)
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        self.in_flight.inc(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.request_duration.observe(time.perf_counter() - started, route)
+            self.requests_total.inc(route, status[0])
+            self.in_flight.dec(route)
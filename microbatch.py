@@ -0,0 +1,150 @@
+"""
+Engineer 1 - Micro-batching de predicciones individuales
+Agrupa filas concurrentes de /predict y /predict-json en una sola llamada al modelo
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalescedor de peticiones: acumula filas durante max_wait_ms o hasta max_batch
+    filas, ejecuta una sola inferencia sobre la matriz apilada y reparte los resultados
+    a los futures que esperan."""
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], Awaitable[Tuple[Sequence[Any], ...]]],
+        max_wait_ms: float = 2.0,
+        max_batch: int = 64
+    ):
+        if max_batch < 1:
+            raise ValueError("max_batch debe ser al menos 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms no puede ser negativo")
+
+        self.predict_fn = predict_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = None
+        self._task = None
+        self._inflight = set()
+
+        # Estadísticas de tamaño de lote
+        self.batches = 0
+        self.rows = 0
+        self.max_seen = 0
+        self.histogram = {}
+
+    def start(self):
+        """Arrancar el bucle de coalescencia en el event loop actual"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Detener el bucle y fallar las peticiones que queden en cola"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Dejar terminar los lotes ya despachados
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher detenido"))
+
+    async def submit(self, row: Sequence[float]) -> Tuple[Any, ...]:
+        """Encolar una fila y esperar su parte de cada salida de predict_fn"""
+        if self._task is None:
+            raise RuntimeError("Micro-batcher no iniciado")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Sequence[float], asyncio.Future]]:
+        """Esperar la primera fila y acumular más hasta el límite de tiempo o tamaño"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            # Vaciar primero lo que ya está en cola sin ceder el event loop
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Bucle principal: recolectar lotes y despacharlos sin esperar a que terminen"""
+        while True:
+            batch = await self._collect()
+            # Las peticiones canceladas por el cliente no ocupan sitio en la matriz
+            batch = [(row, future) for row, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self._record(len(batch))
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Sequence[float], asyncio.Future]]):
+        """Predecir una vez sobre el lote apilado y repartir los resultados"""
+        try:
+            feature_array = np.array([row for row, _ in batch], dtype=np.float64)
+            outputs = await self.predict_fn(feature_array)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Cada salida de predict_fn tiene una entrada por fila: la fila i recibe la i-ésima de cada una
+        for (_, future), *values in zip(batch, *outputs):
+            if not future.done():
+                future.set_result(tuple(values))
+
+    def _record(self, size: int):
+        """Registrar el tamaño de un lote en las estadísticas"""
+        self.batches += 1
+        self.rows += size
+        self.max_seen = max(self.max_seen, size)
+        # Buckets en potencias de 2: 1, 2, 4, 8, ...
+        bucket = 1 << (size - 1).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de tamaño de lote para /health"""
+        return {
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_seen,
+            "batch_size_histogram": {f"<={k}": v for k, v in sorted(self.histogram.items())},
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "inflight_batches": len(self._inflight)
+        }
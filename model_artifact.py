@@ -0,0 +1,166 @@
+"""
+Engineer 1 - Artefacto de modelo sin pickle
+Nodos del bosque y parámetros del scaler en archivos .npy con una cabecera JSON
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from forest_engine import FlatForest
+
+ARTIFACT_FORMAT = "coffee-forest"
+ARTIFACT_FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+
+# Arrays guardados, uno por archivo <nombre>.npy
+ARRAY_NAMES = (
+    "feature", "threshold", "threshold_raw", "left", "right", "value", "roots",
+    "scaler_mean", "scaler_scale"
+)
+
+
+class ArrayScaler:
+    """Equivalente de ``StandardScaler.transform`` a partir de mean_ y scale_.
+
+    Hace las mismas operaciones en el mismo orden (restar y después dividir en float64),
+    así que el resultado es idéntico bit a bit.
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+    def inverse_transform(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.mean_
+
+
+def content_digest(arrays: Dict[str, np.ndarray]) -> str:
+    """Hash corto del contenido de los arrays, en el orden de ARRAY_NAMES"""
+    digest = hashlib.sha256()
+    for name in ARRAY_NAMES:
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def is_artifact(path: str) -> bool:
+    """¿Es ``path`` un directorio de artefacto (y no un model.pkl)?"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, HEADER_FILE))
+
+
+def write_artifact(
+    path: str,
+    forest: FlatForest,
+    fused_forest: FlatForest,
+    scaler,
+    feature_names,
+    accuracy: float,
+    model_version: Optional[str] = None
+) -> Dict[str, Any]:
+    """Escribir el artefacto en el directorio ``path``.
+
+    ``forest`` es el bosque aplanado sobre la entrada escalada y ``fused_forest`` el mismo
+    con el scaler fusionado en los umbrales (ya verificado); comparten todos los arrays
+    salvo el umbral. ``model_version`` conserva la versión de un model.pkl convertido (por
+    defecto, el hash del contenido). Devuelve la cabecera escrita.
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        "feature": forest.feature,
+        "threshold": forest.threshold,
+        "threshold_raw": fused_forest.threshold,
+        "left": forest.left,
+        "right": forest.right,
+        "value": forest.value,
+        "roots": forest.roots,
+        "scaler_mean": np.asarray(scaler.mean_, dtype=np.float64),
+        "scaler_scale": np.asarray(scaler.scale_, dtype=np.float64)
+    }
+
+    # Cada .npy se escribe aparte y se renombra: los procesos que tienen mapeada la versión
+    # anterior conservan su inodo y nunca ven un archivo truncado
+    for name in ARRAY_NAMES:
+        array = np.ascontiguousarray(arrays[name])
+        target = os.path.join(path, f"{name}.npy")
+        with open(target + ".tmp", "wb") as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(target + ".tmp", target)
+
+    digest = content_digest(arrays)
+    header = {
+        "format": ARTIFACT_FORMAT,
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        # La versión del modelo es un hash del contenido: dos entrenamientos iguales dan la misma
+        "model_version": model_version or digest,
+        "content_digest": digest,
+        "feature_names": list(feature_names),
+        "classes": [str(c) for c in forest.classes_],
+        "accuracy": float(accuracy),
+        "max_depth": forest.max_depth,
+        "n_estimators": forest.n_estimators,
+        "arrays": {name: f"{name}.npy" for name in ARRAY_NAMES}
+    }
+    # La cabecera se escribe al final: un artefacto sin cabecera no se considera válido
+    tmp_header = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp_header, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_header, os.path.join(path, HEADER_FILE))
+    return header
+
+
+def read_artifact(path: str, mmap_mode: str = "r") -> Dict[str, Any]:
+    """Cargar un artefacto como model_data, con los arrays mapeados en memoria.
+
+    No usa pickle: los .npy se abren con ``allow_pickle=False``. El resultado tiene el
+    bosque fusionado en ``forest``, el bosque sobre entrada escalada en ``scaled_forest``
+    y un ``ArrayScaler`` en ``scaler``; no incluye el modelo de sklearn.
+    """
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} no es un artefacto {ARTIFACT_FORMAT}")
+    if header.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Versión de artefacto no soportada: {header.get('format_version')} "
+            f"(se esperaba {ARTIFACT_FORMAT_VERSION})"
+        )
+
+    arrays = {
+        name: np.load(os.path.join(path, filename), mmap_mode=mmap_mode, allow_pickle=False)
+        for name, filename in header["arrays"].items()
+    }
+    # Detecta un artefacto a medio reescribir (arrays de versiones distintas). Los
+    # artefactos sin content_digest usan el hash del contenido como model_version
+    if content_digest(arrays) != header.get("content_digest", header["model_version"]):
+        raise ValueError(f"El contenido de {path} no coincide con su cabecera")
+    classes = np.asarray(header["classes"], dtype=object)
+
+    def forest_with(threshold: np.ndarray, fused: bool) -> FlatForest:
+        return FlatForest(
+            feature=arrays["feature"],
+            threshold=threshold,
+            left=arrays["left"],
+            right=arrays["right"],
+            value=arrays["value"],
+            roots=arrays["roots"],
+            classes=classes,
+            max_depth=header["max_depth"],
+            fused=fused
+        )
+
+    return {
+        'forest': forest_with(arrays["threshold_raw"], fused=True),
+        'scaled_forest': forest_with(arrays["threshold"], fused=False),
+        'scaler': ArrayScaler(arrays["scaler_mean"], arrays["scaler_scale"]),
+        'feature_names': header["feature_names"],
+        'accuracy': header["accuracy"],
+        'model_version': header["model_version"],
+        'artifact': True
+    }
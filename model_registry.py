@@ -0,0 +1,215 @@
+"""
+Engineer 1 - Registro de modelos candidatos
+Varios artefactos versionados en memoria junto al modelo principal: selección por
+cabecera, reparto de tráfico por porcentaje (A/B) y evaluación en sombra de un candidato
+"""
+
+import asyncio
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from inference import ExecutorSaturated, InferenceExecutor, load_model_data
+
+
+def parse_model_specs(spec: str) -> Dict[str, str]:
+    """Leer ``"alias=ruta,alias=ruta"`` (COFFEE_MODEL_VARIANTS)"""
+    models = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        alias, sep, path = part.partition("=")
+        if not sep or not alias.strip() or not path.strip():
+            raise ValueError(f"Modelo candidato inválido: {part} (se esperaba alias=ruta)")
+        models[alias.strip()] = path.strip()
+    return models
+
+
+def parse_traffic_split(spec: str) -> Dict[str, float]:
+    """Leer ``"alias=porcentaje,..."`` (COFFEE_TRAFFIC_SPLIT); el resto va al modelo principal"""
+    split = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        alias, sep, percent = part.partition("=")
+        try:
+            split[alias.strip()] = float(percent)
+        except ValueError:
+            raise ValueError(f"Reparto de tráfico inválido: {part} (se esperaba alias=porcentaje)")
+    if any(percent < 0 for percent in split.values()) or sum(split.values()) > 100:
+        raise ValueError(f"Reparto de tráfico inválido: {spec} (porcentajes entre 0 y 100 en total)")
+    return split
+
+
+class ModelRegistry:
+    """Modelos candidatos cargados en memoria, por alias.
+
+    El modelo principal sigue siendo el de MODEL_PATH (con su recarga en caliente); aquí
+    sólo están los candidatos, que se cargan al arrancar y no se recargan. Un candidato
+    se puede pedir por su alias o por su ``model_version``, o recibir un porcentaje del
+    tráfico que no pide versión.
+    """
+
+    def __init__(
+        self,
+        paths: Dict[str, str],
+        split: Dict[str, float],
+        engine: str = "sklearn",
+        lut_steps: Optional[List[float]] = None
+    ):
+        unknown = [alias for alias in split if alias not in paths]
+        if unknown:
+            raise ValueError(f"Reparto de tráfico a modelos no configurados: {', '.join(unknown)}")
+        self.paths = paths
+        self.split = split
+        self.engine = engine
+        self.lut_steps = lut_steps
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, str] = {}
+        self.routed: Dict[str, int] = {}
+
+    def load(self, warm_up: Callable[[Dict[str, Any]], None]):
+        """Cargar y calentar todos los candidatos. Un candidato que no carga se omite (su
+        parte del tráfico va al modelo principal) y su error queda en ``errors``."""
+        for alias, path in self.paths.items():
+            try:
+                model_data = load_model_data(path, self.engine, self.lut_steps)
+                warm_up(model_data)
+            except Exception as e:
+                self.errors[alias] = str(e)
+                print(f"❌ Modelo candidato {alias} ({path}) no cargado: {e}")
+                continue
+            self.models[alias] = model_data
+            print(f"🧪 Modelo candidato {alias}: versión {model_data['model_version']}, accuracy {model_data['accuracy']:.3f}")
+
+    def get(self, version: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(alias, modelo) para un alias o una ``model_version``; None si no está cargado"""
+        if version in self.models:
+            return version, self.models[version]
+        for alias, model_data in self.models.items():
+            if model_data['model_version'] == version:
+                return alias, model_data
+        return None
+
+    def route(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Candidato que recibe esta petición según el reparto, o None (modelo principal)"""
+        if not self.split:
+            return None
+        draw = random.random() * 100
+        for alias, percent in self.split.items():
+            if draw < percent:
+                return (alias, self.models[alias]) if alias in self.models else None
+            draw -= percent
+        return None
+
+    def is_candidate(self, model_data: Dict[str, Any]) -> bool:
+        return any(model_data is candidate for candidate in self.models.values())
+
+    def record(self, alias: str):
+        self.routed[alias] = self.routed.get(alias, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Candidatos cargados, reparto y peticiones servidas por cada uno"""
+        return {
+            "candidates": {
+                alias: {
+                    "path": self.paths[alias],
+                    "model_version": model_data['model_version'],
+                    "accuracy": model_data['accuracy'],
+                    "engine": model_data['engine'],
+                    "traffic_percent": self.split.get(alias, 0.0),
+                    "requests": self.routed.get(alias, 0)
+                }
+                for alias, model_data in self.models.items()
+            },
+            "errors": self.errors,
+            "primary_traffic_percent": 100.0 - sum(
+                percent for alias, percent in self.split.items() if alias in self.models
+            )
+        }
+
+
+class ShadowScorer:
+    """Evalúa en sombra una fracción de las predicciones del modelo principal con un candidato.
+
+    ``maybe_score`` decide con probabilidad ``sample_rate`` y, si toca, lanza una tarea y
+    vuelve enseguida: la respuesta no espera al candidato. La tarea predice en su propio
+    executor (``executor``, con cola acotada); si está lleno la muestra se descarta en vez
+    de esperar. Se compara la etiqueta de cada fila y la diferencia de probabilidades.
+
+    Si se asigna ``observer``, se llama tras cada muestra con (filas, desacuerdos).
+    """
+
+    def __init__(self, alias: str, model_data: Dict[str, Any], sample_rate: float, executor: InferenceExecutor):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("La fracción de sombra debe estar entre 0 y 1")
+        self.alias = alias
+        self.model_data = model_data
+        self.sample_rate = sample_rate
+        self.executor = executor
+        self.observer: Optional[Callable[[int, int], None]] = None
+        self._tasks = set()
+        self.samples = 0
+        self.rows = 0
+        self.disagreements = 0
+        self.compared_rows = 0
+        self.probability_diff_sum = 0.0
+        self.max_probability_diff = 0.0
+        self.dropped = 0
+        self.errors = 0
+
+    def maybe_score(self, features: np.ndarray, predictions: np.ndarray, probabilities: np.ndarray, classes: List[str]):
+        """Muestrear una predicción ya hecha por el modelo principal (sin esperar)"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        task = asyncio.get_running_loop().create_task(self._score(features, predictions, probabilities, classes))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, features: np.ndarray, predictions: np.ndarray, probabilities: np.ndarray, classes: List[str]):
+        try:
+            shadow_predictions, _, shadow_probabilities, served = await self.executor.run(self.model_data, features)
+        except ExecutorSaturated:
+            self.dropped += 1
+            return
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Error en la evaluación en sombra con {self.alias}: {e}")
+            return
+
+        disagreements = int(np.count_nonzero(
+            np.asarray(shadow_predictions).astype(str) != np.asarray(predictions).astype(str)
+        ))
+        self.samples += 1
+        self.rows += len(features)
+        self.disagreements += disagreements
+        # Las probabilidades sólo se comparan si los dos modelos tienen las mismas clases
+        if list(served['classes']) == list(classes):
+            diff = np.abs(shadow_probabilities - probabilities).max(axis=1)
+            self.compared_rows += len(diff)
+            self.probability_diff_sum += float(diff.sum())
+            self.max_probability_diff = max(self.max_probability_diff, float(diff.max()))
+        if self.observer is not None:
+            self.observer(len(features), disagreements)
+
+    async def stop(self):
+        """Esperar a las muestras en curso"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tasa de desacuerdo y muestras descartadas para /models"""
+        return {
+            "candidate": self.alias,
+            "model_version": self.model_data['model_version'],
+            "sample_rate": self.sample_rate,
+            "samples": self.samples,
+            "rows": self.rows,
+            "disagreements": self.disagreements,
+            "disagreement_rate": self.disagreements / self.rows if self.rows else 0.0,
+            "mean_max_probability_diff": (
+                self.probability_diff_sum / self.compared_rows if self.compared_rows else None
+            ),
+            "max_probability_diff": self.max_probability_diff,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "pending": len(self._tasks),
+            "executor": self.executor.stats()
+        }
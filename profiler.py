@@ -0,0 +1,66 @@
+"""
+Engineer 1 - Perfilado de un worker en marcha
+Muestreo de las pilas de todos los threads (formato collapsed para flamegraphs) o cProfile
+del event loop (volcado de pstats), sin reiniciar el proceso
+"""
+
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+PROFILE_FORMATS = ("collapsed", "pstats")
+
+
+def frame_label(frame) -> str:
+    """Nombre de una función en la pila: ``función (archivo.py)``"""
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Dict[str, int]:
+    """Muestrear las pilas de todos los threads del proceso cada ``interval`` segundos.
+
+    Devuelve ``{pila colapsada: muestras}`` con las funciones de fuera hacia dentro
+    separadas por ``;`` y el nombre del thread como raíz, el formato que leen
+    flamegraph.pl, speedscope o inferno. El thread que muestrea no aparece.
+    """
+    own = threading.get_ident()
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def start_cprofile() -> cProfile.Profile:
+    """cProfile sobre el thread actual (el event loop si se llama desde una corrutina)"""
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def dump_pstats(profile: cProfile.Profile) -> bytes:
+    """Volcado en el mismo formato que ``Profile.dump_stats`` (se abre con pstats.Stats o snakeviz)"""
+    profile.disable()
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
@@ -0,0 +1,103 @@
+"""
+Engineer 1 - Desglose de tiempos por petición
+Cabecera Server-Timing con lo que tarda cada etapa (parse, validate, scale, infer, serialize)
+y bloque de tiempos opcional en el cuerpo de la respuesta
+"""
+
+import contextvars
+import time
+from typing import Dict, Optional
+
+# Orden de las etapas en la cabecera y en el bloque de tiempos
+STAGES = ("parse", "validate", "scale", "infer", "serialize")
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Tiempos de una petición. Vive en un ContextVar: el endpoint, el executor (que
+    llama a su observer en el contexto de quien espera la predicción) y el middleware
+    ven el mismo objeto. Las filas predichas por el micro-batcher corren en otra tarea
+    y no anotan scale/infer."""
+
+    __slots__ = ("started", "debug", "handler_started", "handler_finished", "stages")
+
+    def __init__(self, debug: bool = False):
+        self.started = time.perf_counter()
+        self.debug = debug
+        self.handler_started = None
+        self.handler_finished = None
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def milliseconds(self) -> Dict[str, float]:
+        timings = {stage: round(self.stages[stage] * 1000, 3) for stage in STAGES if stage in self.stages}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timings
+
+
+def start_handler():
+    """Llamar al entrar en el endpoint: lo anterior (recibir el cuerpo, parsear el
+    formulario o el JSON y validarlo con Pydantic) cuenta como ``parse``"""
+    timing = _current.get()
+    if timing is not None:
+        timing.handler_started = time.perf_counter()
+        timing.add("parse", timing.handler_started - timing.started)
+
+
+def record(stage: str, seconds: float):
+    """Sumar ``seconds`` a ``stage`` en la petición actual (sin efecto fuera de una petición)"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def finish_handler() -> Optional[Dict[str, float]]:
+    """Llamar justo antes de devolver: lo que pasa después cuenta como ``serialize``.
+
+    Devuelve el bloque de tiempos en ms si la petición lo pidió con ``?debug=timing``.
+    """
+    timing = _current.get()
+    if timing is None:
+        return None
+    timing.handler_finished = time.perf_counter()
+    return timing.milliseconds() if timing.debug else None
+
+
+def server_timing_header(timing: RequestTiming) -> str:
+    timings = timing.milliseconds()
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
+
+
+class ServerTimingMiddleware:
+    """Middleware ASGI que añade ``Server-Timing`` a las respuestas de los endpoints que
+    llaman a ``start_handler``. ``serialize`` es el tiempo entre ``finish_handler`` y el
+    inicio de la respuesta (validación del response_model y codificación del JSON)."""
+
+    def __init__(self, app, debug_param: bytes = b"debug=timing"):
+        self.app = app
+        self.debug_param = debug_param
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(debug=self.debug_param in scope.get("query_string", b"").split(b"&"))
+        token = _current.set(timing)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and timing.handler_started is not None:
+                if timing.handler_finished is not None:
+                    timing.add("serialize", time.perf_counter() - timing.handler_finished)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timing).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
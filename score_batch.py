@@ -0,0 +1,222 @@
+"""
+Data Scientist - Puntuación offline de archivos
+Predice la calidad de un CSV o Parquet completo con el mismo modelo que la API, por bloques
+y en paralelo
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from inference import ENGINES, load_model_data, predict_array
+from validation import validator_for
+
+# Modelo propio de cada proceso del pool (se carga en el initializer)
+_worker_model_data = None
+
+
+def read_chunks(path: str, chunk_size: int, columns) -> Iterator[pd.DataFrame]:
+    """Leer ``path`` por bloques de ``chunk_size`` filas (CSV con pandas, Parquet con pyarrow)"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Leer Parquet requiere pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=list(columns)):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=list(columns))
+
+
+def render_chunk(result: pd.DataFrame, output_path: str) -> Tuple[Any, str, int, int]:
+    """Preparar un bloque para escribirlo: (contenido, cabecera CSV, filas, válidas).
+
+    Para CSV el texto se formatea aquí, dentro del worker, porque formatear cuesta tanto
+    como predecir; el proceso principal sólo escribe. Para Parquet se devuelve el DataFrame.
+    """
+    valid = int(result["quality"].notna().sum())
+    if output_path.endswith(".parquet"):
+        return result, "", len(result), valid
+    return result.to_csv(index=False, header=False), result.iloc[:0].to_csv(index=False), len(result), valid
+
+
+class ChunkWriter:
+    """Escribe los bloques de resultados en orden a un CSV o Parquet"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet = None
+        self._csv = None
+
+    def write(self, content: Any, header: str):
+        if self.path.endswith(".parquet"):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise SystemExit("❌ Escribir Parquet requiere pyarrow: pip install pyarrow")
+            table = pa.Table.from_pandas(content, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            if self._csv is None:
+                self._csv = open(self.path, "w", newline="")
+                self._csv.write(header)
+            self._csv.write(content)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._csv is not None:
+            self._csv.close()
+
+
+def valid_mask(features: np.ndarray, feature_names) -> np.ndarray:
+    """Filas completas y dentro de los rangos de entrenamiento (las mismas reglas que la API)"""
+    return validator_for(tuple(feature_names)).valid_mask(features)
+
+
+def score_chunk(model_data: Dict[str, Any], frame: pd.DataFrame, with_probabilities: bool) -> pd.DataFrame:
+    """Predecir las filas válidas de un bloque y añadir quality y confidence (vacías si no)"""
+    feature_names = list(model_data['feature_names'])
+    features = frame[feature_names].to_numpy(dtype=np.float64)
+    mask = valid_mask(features, feature_names)
+
+    result = frame.copy()
+    # Columna de texto aunque el bloque no tenga filas válidas: con None Arrow la tipa como
+    # null y el ParquetWriter, creado con el esquema del primer bloque, rechaza los siguientes
+    result["quality"] = pd.Series(pd.NA, index=result.index, dtype="string")
+    result["confidence"] = np.nan
+    probabilities = None
+    if mask.any():
+        predictions, confidences, probabilities = predict_array(model_data, features[mask])
+        result.loc[mask, "quality"] = predictions.astype(str)
+        result.loc[mask, "confidence"] = confidences
+    if with_probabilities:
+        for j, label in enumerate(model_data['identity']['classes']):
+            result[f"prob_{label}"] = np.nan
+            if probabilities is not None:
+                result.loc[mask, f"prob_{label}"] = probabilities[:, j]
+    return result
+
+
+def _init_worker(model_path: str, engine: str):
+    """Initializer del pool: cargar el modelo una vez por proceso"""
+    global _worker_model_data
+    _worker_model_data = load_model_data(model_path, engine)
+
+
+def _score_in_worker(frame: pd.DataFrame, with_probabilities: bool, output_path: str) -> Tuple[Any, str, int, int]:
+    return render_chunk(score_chunk(_worker_model_data, frame, with_probabilities), output_path)
+
+
+def score_file(
+    input_path: str,
+    output_path: str,
+    model_path: str = "model.pkl",
+    engine: str = "sklearn",
+    workers: Optional[int] = None,
+    chunk_size: int = 100_000,
+    with_probabilities: bool = False
+) -> Dict[str, Any]:
+    """Puntuar ``input_path`` en ``output_path`` y devolver las estadísticas de la ejecución.
+
+    Los bloques se reparten en un pool de procesos (cada uno carga el modelo una vez en su
+    initializer, como el executor de la API) y se escriben en el orden de entrada. Como
+    mucho hay ``2 * workers`` bloques en vuelo, así la memoria no crece con el archivo.
+    Con ``workers=0`` todo se ejecuta en el proceso actual.
+    """
+    started = time.perf_counter()
+    model_data = load_model_data(model_path, engine)
+    feature_names = list(model_data['feature_names'])
+    workers = min(4, os.cpu_count() or 1) if workers is None else workers
+
+    pool = None
+    if workers > 0:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, engine)
+        )
+
+    writer = ChunkWriter(output_path)
+    rows = 0
+    valid = 0
+    inflight = deque()
+
+    def drain_one():
+        nonlocal rows, valid
+        future = inflight.popleft()
+        content, header, chunk_rows, chunk_valid = future.result() if pool is not None else future
+        writer.write(content, header)
+        rows += chunk_rows
+        valid += chunk_valid
+
+    try:
+        for frame in read_chunks(input_path, chunk_size, feature_names):
+            if pool is None:
+                inflight.append(render_chunk(score_chunk(model_data, frame, with_probabilities), output_path))
+            else:
+                inflight.append(pool.submit(_score_in_worker, frame, with_probabilities, output_path))
+            while len(inflight) > max(1, 2 * workers) - 1:
+                drain_one()
+        while inflight:
+            drain_one()
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "input": input_path,
+        "output": output_path,
+        "model_version": model_data['model_version'],
+        "engine": model_data['engine'],
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "rows": rows,
+        "valid": valid,
+        "invalid": rows - valid,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Puntuar un CSV o Parquet con el clasificador de calidad de café")
+    parser.add_argument("input", help="Archivo .csv o .parquet con las columnas acidity, sweetness, body, aroma, altitude")
+    parser.add_argument("output", help="Archivo de salida .csv o .parquet")
+    parser.add_argument("--model", default="model.pkl", help="model.pkl o directorio de artefacto")
+    parser.add_argument("--engine", choices=ENGINES, default="sklearn", help="Motor de inferencia")
+    parser.add_argument("--workers", type=int, help="Procesos del pool (0 = en este proceso)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Filas por bloque")
+    parser.add_argument("--probabilities", action="store_true", help="Añadir una columna de probabilidad por clase")
+    args = parser.parse_args()
+
+    print(f"☕ Puntuando {args.input} con {args.model}...")
+    stats = score_file(
+        args.input,
+        args.output,
+        model_path=args.model,
+        engine=args.engine,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        with_probabilities=args.probabilities
+    )
+    print(f"✅ {stats['rows']} filas en {stats['seconds']:.2f}s ({stats['rows_per_second']:,.0f} filas/s)")
+    print(f"📊 Válidas: {stats['valid']}, inválidas: {stats['invalid']} (sin predicción)")
+    print(f"💾 Resultados guardados en {stats['output']} (modelo {stats['model_version']}, motor {stats['engine']})")
+
+
+if __name__ == "__main__":
+    main()
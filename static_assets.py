@@ -0,0 +1,91 @@
+"""
+Engineer 1 - Archivos estáticos servidos desde memoria
+La interfaz web se lee y se comprime una vez al arrancar; cada petición sólo elige la
+variante (gzip o sin comprimir) y responde 304 si el navegador ya la tiene
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+
+# Por debajo de este tamaño comprimir no compensa la cabecera gzip
+GZIP_MIN_BYTES = 512
+
+
+class StaticAsset:
+    """Un archivo con su versión gzip y su ETag ya calculados"""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        # ETag débil: identifica el contenido sea cual sea la codificación de la respuesta
+        self.etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+        self.gzip_body = gzipped if gzipped is not None and len(gzipped) < len(body) else None
+
+
+class StaticAssets:
+    """App ASGI que sirve los archivos de ``directory`` desde memoria.
+
+    Respuestas con ETag y ``Cache-Control: public, max-age``; ``If-None-Match`` con el
+    ETag actual se responde con 304 sin cuerpo y ``Accept-Encoding: gzip`` recibe la
+    versión comprimida al arrancar. Los cambios en disco no se ven hasta reiniciar.
+    """
+
+    def __init__(self, directory: str, max_age: int = 300):
+        self.directory = directory
+        self.max_age = max_age
+        self.assets: Dict[str, StaticAsset] = {}
+        self.load()
+
+    def load(self):
+        """Leer y comprimir todos los archivos del directorio"""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                # Starlette añade charset=utf-8 a los tipos text/*
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                with open(path, "rb") as f:
+                    assets[name] = StaticAsset(f.read(), media_type)
+        self.assets = assets
+
+    def response(self, name: str, headers: Headers) -> Optional[Response]:
+        """Respuesta para el archivo ``name`` según las cabeceras de la petición (None si no existe)"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+
+        response_headers = {
+            "ETag": asset.etag,
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "Vary": "Accept-Encoding"
+        }
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # Comparación débil: W/"x" y "x" son el mismo recurso
+            if "*" in tags or asset.etag in tags or asset.etag[2:] in tags:
+                return Response(status_code=304, headers=response_headers)
+
+        body = asset.body
+        if asset.gzip_body is not None and "gzip" in headers.get("accept-encoding", ""):
+            body = asset.gzip_body
+            response_headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type=asset.media_type, headers=response_headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            name = scope["path"].lstrip("/") or "index.html"
+            response = self.response(name, Headers(scope=scope))
+            if response is None:
+                response = PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
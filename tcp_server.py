@@ -0,0 +1,367 @@
+"""
+Engineer 1 - Servidor TCP binario de predicción
+Protocolo ligero para servicios internos: vectores de características float64 con prefijo
+de longitud, sin HTTP ni JSON, con peticiones encadenadas (pipelining) por conexión
+
+Protocolo (todos los enteros y floats en little-endian):
+
+- Cada mensaje es ``<uint32 longitud><carga>``.
+- Petición: la carga es una matriz float64 filas × características, fila a fila, con las
+  características en el orden de ``/model-info``. Una petición puede traer de 1 a
+  ``max_rows`` filas.
+- Respuesta: el primer byte de la carga es el estado (``STATUS_*``). Con ``STATUS_OK``
+  siguen ``<uint16 n>`` y n bytes de JSON con la versión, las clases y las
+  características del modelo, y después un registro por fila (``result_dtype``): índice
+  de la clase (``INVALID_ROW`` si la fila está fuera de rango), confianza y
+  probabilidades por clase. Con otro estado sigue un mensaje de error en UTF-8.
+
+Las respuestas llegan en el orden de las peticiones, así que un cliente puede enviar
+varias sin esperar. Las peticiones que llegan juntas se predicen en una sola llamada al
+modelo.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import struct
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from inference import ENGINES, EXECUTOR_KINDS, ExecutorSaturated, InferenceExecutor, load_model_data
+from validation import validator_for
+
+FRAME_HEADER = struct.Struct("<I")
+IDENTITY_HEADER = struct.Struct("<BH")
+
+STATUS_OK = 0
+STATUS_BAD_REQUEST = 1
+STATUS_BUSY = 2
+STATUS_ERROR = 3
+
+# Índice de clase de las filas fuera de rango (su confianza y probabilidades son NaN)
+INVALID_ROW = 255
+
+# Mensajes mayores que esto cierran la conexión sin leerlos
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+# Bytes de peticiones leídas pero sin responder por conexión antes de dejar de leer del
+# socket; el número de peticiones es un segundo límite (muchos mensajes pequeños)
+MAX_PENDING_BYTES = 4 * MAX_FRAME_BYTES
+MAX_PENDING_FRAMES = 1024
+
+
+def result_dtype(n_classes: int) -> np.dtype:
+    """Registro de respuesta de una fila: clase (uint8), confianza y probabilidades (float64)"""
+    return np.dtype([("quality", "u1"), ("confidence", "<f8"), ("probabilities", "<f8", (n_classes,))])
+
+
+def frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def error_frame(status: int, message: str) -> bytes:
+    return frame(bytes([status]) + message.encode("utf-8"))
+
+
+@lru_cache(maxsize=16)
+def identity_prefix(model_version: str, classes: Tuple[str, ...], feature_names: Tuple[str, ...]) -> bytes:
+    """Estado y JSON del modelo ya codificados (no cambian entre respuestas del mismo modelo)"""
+    identity = json.dumps({
+        "model_version": model_version,
+        "classes": list(classes),
+        "feature_names": list(feature_names)
+    }).encode("utf-8")
+    return IDENTITY_HEADER.pack(STATUS_OK, len(identity)) + identity
+
+
+class PredictionServer:
+    """Predice los mensajes de todas las conexiones con el modelo que devuelve ``get_model``
+    (None si todavía no hay modelo) en el executor de inferencia compartido."""
+
+    def __init__(
+        self,
+        get_model: Callable[[], Optional[Dict[str, Any]]],
+        executor: InferenceExecutor,
+        max_rows: int = 100_000
+    ):
+        self.get_model = get_model
+        self.executor = executor
+        self.max_rows = max_rows
+        self.connections = 0
+        self.requests = 0
+
+    def protocol(self) -> "PredictionProtocol":
+        return PredictionProtocol(self)
+
+    async def handle(self, payloads: Sequence[bytes]) -> List[bytes]:
+        """Respuestas enmarcadas para ``payloads``, en el mismo orden.
+
+        Las matrices válidas se concatenan y se predicen en una sola llamada; las filas
+        fuera de rango no llegan al modelo.
+        """
+        self.requests += len(payloads)
+        model_data = self.get_model()
+        if model_data is None:
+            return [error_frame(STATUS_ERROR, "Modelo no disponible")] * len(payloads)
+
+        feature_names = model_data['feature_names']
+        row_bytes = 8 * len(feature_names)
+        responses: List[Optional[bytes]] = [None] * len(payloads)
+        matrices = []
+        for i, payload in enumerate(payloads):
+            rows, remainder = divmod(len(payload), row_bytes)
+            if remainder or not 0 < rows <= self.max_rows:
+                responses[i] = error_frame(
+                    STATUS_BAD_REQUEST,
+                    f"Se esperaban de 1 a {self.max_rows} filas de {len(feature_names)} float64, "
+                    f"recibidos {len(payload)} bytes"
+                )
+            else:
+                matrices.append((i, np.frombuffer(payload, dtype="<f8").reshape(rows, len(feature_names))))
+        if not matrices:
+            return responses
+
+        features = matrices[0][1] if len(matrices) == 1 else np.concatenate([m for _, m in matrices])
+        valid = validator_for(tuple(feature_names)).valid_mask(features)
+        try:
+            if valid.all():
+                predictions, confidences, probabilities, served = await self.executor.run(model_data, features)
+            elif valid.any():
+                predictions, confidences, probabilities, served = await self.executor.run(
+                    model_data, features[valid]
+                )
+            else:
+                predictions, confidences, probabilities = (), (), np.empty((0, len(model_data['classes'])))
+                served = model_data['identity']
+        except ExecutorSaturated as e:
+            for i, _ in matrices:
+                responses[i] = error_frame(STATUS_BUSY, str(e))
+            return responses
+        except Exception as e:
+            for i, _ in matrices:
+                responses[i] = error_frame(STATUS_ERROR, f"Error en la predicción: {e}")
+            return responses
+
+        classes = served['classes']
+        records = np.empty(len(features), dtype=result_dtype(len(classes)))
+        records["quality"] = INVALID_ROW
+        records["confidence"] = np.nan
+        records["probabilities"] = np.nan
+        # El índice de la clase es el argmax en el orden de ``classes``
+        records["quality"][valid] = probabilities.argmax(axis=1) if len(predictions) else []
+        records["confidence"][valid] = confidences
+        records["probabilities"][valid] = probabilities
+
+        prefix = identity_prefix(served['model_version'], tuple(classes), tuple(feature_names))
+        start = 0
+        for i, matrix in matrices:
+            body = records[start:start + len(matrix)].tobytes()
+            start += len(matrix)
+            responses[i] = FRAME_HEADER.pack(len(prefix) + len(body)) + prefix + body
+        return responses
+
+
+class PredictionProtocol(asyncio.Protocol):
+    """Una conexión: separa los mensajes del flujo de bytes y responde en orden.
+
+    ``data_received`` sólo trocea; una tarea por conexión toma todos los mensajes
+    pendientes de una vez, los predice juntos y escribe las respuestas. Si lo recibido y
+    sin responder (incluido el lote que se está prediciendo) supera ``MAX_PENDING_BYTES``
+    o ``MAX_PENDING_FRAMES``, se deja de leer del socket hasta ponerse al día; si el
+    cliente no lee las respuestas, se deja de predecir. Así la memoria por conexión queda
+    acotada por esos límites más un mensaje a medio recibir.
+    """
+
+    def __init__(self, server: PredictionServer):
+        self.server = server
+        self.transport = None
+        self.buffer = bytearray()
+        self.pending = deque()
+        # Peticiones recibidas y todavía sin responder, en bytes y en número
+        self.pending_bytes = 0
+        self.pending_frames = 0
+        self.has_pending = asyncio.Event()
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.reading_paused = False
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+        self.task = asyncio.get_running_loop().create_task(self.serve())
+
+    def connection_lost(self, exc):
+        self.server.connections -= 1
+        if self.task is not None:
+            self.task.cancel()
+
+    def data_received(self, data: bytes):
+        buffer = self.buffer
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(buffer, offset)
+            if length > MAX_FRAME_BYTES:
+                self.transport.write(error_frame(STATUS_BAD_REQUEST, f"Mensaje de {length} bytes, máximo {MAX_FRAME_BYTES}"))
+                self.transport.close()
+                return
+            end = offset + FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            self.pending.append(bytes(buffer[offset + FRAME_HEADER.size:end]))
+            self.pending_bytes += length
+            self.pending_frames += 1
+            offset = end
+        if offset:
+            del buffer[:offset]
+            self.has_pending.set()
+            if self.over_limit() and not self.reading_paused:
+                self.reading_paused = True
+                self.transport.pause_reading()
+
+    def over_limit(self) -> bool:
+        return self.pending_bytes >= MAX_PENDING_BYTES or self.pending_frames >= MAX_PENDING_FRAMES
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    async def serve(self):
+        while True:
+            await self.has_pending.wait()
+            self.has_pending.clear()
+            payloads = list(self.pending)
+            self.pending.clear()
+            responses = await self.server.handle(payloads)
+            self.pending_bytes -= sum(len(payload) for payload in payloads)
+            self.pending_frames -= len(payloads)
+            self.transport.writelines(responses)
+            if self.reading_paused and not self.over_limit():
+                self.reading_paused = False
+                self.transport.resume_reading()
+            await self.can_write.wait()
+
+
+async def start_server(
+    server: PredictionServer,
+    host: str = "127.0.0.1",
+    port: int = 9000
+) -> asyncio.AbstractServer:
+    """Escuchar en ``host:port``. Con ``reuse_port`` varios workers de uvicorn comparten el puerto"""
+    return await asyncio.get_running_loop().create_server(
+        server.protocol, host, port, reuse_port=hasattr(socket, "SO_REUSEPORT")
+    )
+
+
+class PredictionError(Exception):
+    """Respuesta con estado de error del servidor"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class PredictionClient:
+    """Cliente asyncio del protocolo. Varias llamadas concurrentes a ``predict`` sobre la
+    misma conexión se encadenan sin esperar a las respuestas anteriores."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = deque()
+        self.reader_task = asyncio.get_running_loop().create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 9000) -> "PredictionClient":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                (length,) = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+                payload = await self.reader.readexactly(length)
+                future = self.waiting.popleft()
+                if not future.done():
+                    future.set_result(payload)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            while self.waiting:
+                future = self.waiting.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Conexión cerrada por el servidor: {e}"))
+
+    async def predict(self, features: np.ndarray) -> Tuple[List[Optional[str]], np.ndarray, np.ndarray, Dict[str, Any]]:
+        """Predecir una matriz (filas × características en el orden del modelo).
+
+        Devuelve (calidades, con None en las filas fuera de rango; confianzas;
+        probabilidades; identidad del modelo que predijo).
+        """
+        body = np.ascontiguousarray(features, dtype="<f8").tobytes()
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        self.writer.write(FRAME_HEADER.pack(len(body)) + body)
+        return decode_response(await future)
+
+    async def close(self):
+        self.writer.close()
+        self.reader_task.cancel()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+def decode_response(payload: bytes) -> Tuple[List[Optional[str]], np.ndarray, np.ndarray, Dict[str, Any]]:
+    """Decodificar la carga de una respuesta (lanza PredictionError si no es STATUS_OK)"""
+    if payload[0] != STATUS_OK:
+        raise PredictionError(payload[0], payload[1:].decode("utf-8", errors="replace"))
+    _, size = IDENTITY_HEADER.unpack_from(payload)
+    start = IDENTITY_HEADER.size
+    identity = json.loads(payload[start:start + size])
+    classes = identity["classes"]
+    records = np.frombuffer(payload, dtype=result_dtype(len(classes)), offset=start + size)
+    qualities = [None if index == INVALID_ROW else classes[index] for index in records["quality"].tolist()]
+    return qualities, records["confidence"], records["probabilities"], identity
+
+
+async def serve_forever(args):
+    model_data = load_model_data(args.model, args.engine)
+    executor = InferenceExecutor(
+        kind=args.executor, workers=args.workers, model_path=args.model, engine=args.engine
+    )
+    executor.start()
+    server = PredictionServer(lambda: model_data, executor, max_rows=args.max_rows)
+    listener = await start_server(server, args.host, args.port)
+    print(f"✅ Modelo cargado (versión {model_data['model_version']}, motor {model_data['engine']})")
+    print(f"🔌 Servidor TCP binario en {args.host}:{args.port} ({executor.kind}, {executor.workers} workers)")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor TCP binario del clasificador de calidad de café")
+    parser.add_argument("--model", default="model.pkl", help="model.pkl o directorio de artefacto")
+    parser.add_argument("--engine", choices=ENGINES, default="sklearn", help="Motor de inferencia")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--executor", choices=EXECUTOR_KINDS, default="thread", help="Executor de inferencia")
+    parser.add_argument("--workers", type=int, help="Workers del executor")
+    parser.add_argument("--max-rows", type=int, default=100_000, help="Filas máximas por petición")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
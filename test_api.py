@@ -5,6 +5,10 @@ Script completo de testing para la aplicación de clasificación de café
 
 import requests
 import json
+import os
+import tempfile
+import socket
+import struct
 import time
 import sys
 from typing import Dict, Any, List
@@ -66,7 +70,12 @@ class CoffeeAPITester:
                 
                 if all(field in data for field in required_fields):
                     accuracy = data.get('accuracy', 0)
-                    self.log_test("Model Info", True, f"Accuracy: {accuracy:.3f}, Classes: {len(data.get('classes', []))}")
+                    self.log_test(
+                        "Model Info",
+                        True,
+                        f"Accuracy: {accuracy:.3f}, Classes: {len(data.get('classes', []))}, "
+                        f"Motor: {data.get('engine')}"
+                    )
                 else:
                     self.log_test("Model Info", False, "Campos faltantes en respuesta")
             else:
@@ -187,11 +196,20 @@ class CoffeeAPITester:
             
             if response.status_code == 200:
                 result = response.json()
-                required_fields = ['quality', 'confidence', 'features']
+                required_fields = ['quality', 'confidence', 'probabilities', 'features']
                 
                 if all(field in result for field in required_fields):
                     quality = result.get('quality')
                     confidence = result.get('confidence', 0)
+                    probabilities = result.get('probabilities', {})
+                    
+                    # La calidad debe ser la clase más probable y su probabilidad la confianza
+                    if (max(probabilities, key=probabilities.get) != quality or
+                            abs(probabilities[quality] - confidence) > 1e-9 or
+                            abs(sum(probabilities.values()) - 1.0) > 1e-6):
+                        self.log_test("Predicción JSON", False, f"Probabilidades inconsistentes: {probabilities}")
+                        return
+                    
                     self.log_test(
                         "Predicción JSON", 
                         True, 
@@ -205,6 +223,135 @@ class CoffeeAPITester:
         except Exception as e:
             self.log_test("Predicción JSON", False, str(e))
     
+    def test_prediction_batch(self):
+        """Test 5b: Predicción por lotes"""
+        rows = [
+            {"acidity": 5.5, "sweetness": 8.0, "body": 7.5, "aroma": 8.5, "altitude": 1500},
+            {"acidity": 4.0, "sweetness": 4.5, "body": 5.0, "aroma": 5.2, "altitude": 800},
+            {"acidity": 15, "sweetness": 7, "body": 6, "aroma": 7, "altitude": 1200},
+            {"acidity": 5.5, "sweetness": 7.0, "body": 6.8, "aroma": 7.2}
+        ]
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/predict-batch",
+                json={"rows": rows},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                predictions = result.get('predictions', [])
+                
+                if (len(predictions) == len(rows) and
+                        result.get('valid') == 2 and result.get('invalid') == 2 and
+                        predictions[0].get('quality') == "Premium" and
+                        predictions[1].get('quality') == "Regular" and
+                        predictions[2].get('error') and predictions[3].get('error')):
+                    self.log_test(
+                        "Predicción Batch",
+                        True,
+                        f"Válidas: {result['valid']}, Inválidas: {result['invalid']}"
+                    )
+                else:
+                    self.log_test("Predicción Batch", False, f"Respuesta inesperada: {result}")
+            else:
+                self.log_test("Predicción Batch", False, f"Status code: {response.status_code}")
+                
+        except Exception as e:
+            self.log_test("Predicción Batch", False, str(e))
+    
+    def test_prediction_stream(self):
+        """Test 5c: Predicción en streaming NDJSON"""
+        rows = [
+            {"acidity": 5.5, "sweetness": 8.0, "body": 7.5, "aroma": 8.5, "altitude": 1500},
+            {"acidity": 15, "sweetness": 7, "body": 6, "aroma": 7, "altitude": 1200},
+            {"acidity": 4.0, "sweetness": 4.5, "body": 5.0, "aroma": 5.2, "altitude": 800}
+        ]
+        body = "\n".join(json.dumps(row) for row in rows) + "\nno es json\n"
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/predict-stream",
+                data=body.encode(),
+                headers={"Content-Type": "application/x-ndjson"},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                results = [json.loads(line) for line in response.text.splitlines() if line]
+                
+                if (len(results) == 4 and [r.get('index') for r in results] == [0, 1, 2, 3] and
+                        results[0].get('quality') == "Premium" and
+                        results[2].get('quality') == "Regular" and
+                        results[1].get('error') and results[3].get('error')):
+                    self.log_test("Predicción Streaming", True, f"Líneas: {len(results)}, Errores: 2")
+                else:
+                    self.log_test("Predicción Streaming", False, f"Respuesta inesperada: {results}")
+            else:
+                self.log_test("Predicción Streaming", False, f"Status code: {response.status_code}")
+                
+        except Exception as e:
+            self.log_test("Predicción Streaming", False, str(e))
+    
+    def test_prediction_stream_non_object(self):
+        """Test 5e: Línea NDJSON que es JSON válido pero no un objeto"""
+        row = {"acidity": 5.5, "sweetness": 8.0, "body": 7.5, "aroma": 8.5, "altitude": 1500}
+        body = json.dumps(row) + "\n[1, 2]\n"
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/predict-stream",
+                data=body.encode(),
+                headers={"Content-Type": "application/x-ndjson"},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                results = [json.loads(line) for line in response.text.splitlines() if line]
+                error = results[1].get('error') if len(results) == 2 else None
+                
+                if (results[0].get('quality') == "Premium" and error and
+                        "dictionary" in error and not error.startswith(":")):
+                    self.log_test("Streaming Línea No Objeto", True, error)
+                else:
+                    self.log_test("Streaming Línea No Objeto", False, f"Respuesta inesperada: {results}")
+            else:
+                self.log_test("Streaming Línea No Objeto", False, f"Status code: {response.status_code}")
+                
+        except Exception as e:
+            self.log_test("Streaming Línea No Objeto", False, str(e))
+    
+    def test_prediction_batch_overflow(self):
+        """Test 5d: Lote con un entero JSON que no cabe en float64"""
+        rows = [
+            {"acidity": 5.5, "sweetness": 8.0, "body": 7.5, "aroma": 8.5, "altitude": 1500},
+            {"acidity": 10 ** 400, "sweetness": 7, "body": 6, "aroma": 7, "altitude": 1200}
+        ]
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/predict-batch",
+                json={"rows": rows},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                predictions = result.get('predictions', [])
+                
+                if (len(predictions) == 2 and result.get('valid') == 1 and
+                        predictions[0].get('quality') == "Premium" and
+                        "acidity" in (predictions[1].get('error') or "")):
+                    self.log_test("Batch con Overflow", True, predictions[1]['error'])
+                else:
+                    self.log_test("Batch con Overflow", False, f"Respuesta inesperada: {result}")
+            else:
+                self.log_test("Batch con Overflow", False, f"Status code: {response.status_code}")
+                
+        except Exception as e:
+            self.log_test("Batch con Overflow", False, str(e))
+    
     def test_input_validation(self):
         """Test 6: Validación de entradas"""
         invalid_cases = [
@@ -240,6 +387,14 @@ class CoffeeAPITester:
                         False, 
                         f"Se esperaba error 400/422, obtenido: {response.status_code}"
                     )
+                
+                # /predict-json aplica los mismos rangos
+                response = requests.post(f"{self.base_url}/predict-json", json=case["data"], timeout=5)
+                self.log_test(
+                    f"Validación JSON - {case['name']}",
+                    response.status_code == 400,
+                    f"Status code: {response.status_code}"
+                )
                     
             except Exception as e:
                 self.log_test(f"Validación - {case['name']}", False, str(e))
@@ -312,6 +467,7 @@ class CoffeeAPITester:
         
         # Crear 10 threads concurrentes
         threads = []
+        start_time = time.time()
         for i in range(10):
             thread = threading.Thread(target=make_request)
             threads.append(thread)
@@ -320,6 +476,7 @@ class CoffeeAPITester:
         # Esperar a que terminen todos
         for thread in threads:
             thread.join()
+        wall_time = time.time() - start_time
         
         success_rate = len(results) / (len(results) + len(errors)) * 100
         
@@ -327,7 +484,8 @@ class CoffeeAPITester:
             self.log_test(
                 "Peticiones Concurrentes", 
                 True, 
-                f"Éxito: {len(results)}/10 ({success_rate:.1f}%)"
+                f"Éxito: {len(results)}/10 ({success_rate:.1f}%), Tiempo total: {wall_time:.3f}s "
+                f"({len(results) / wall_time:.1f} req/s)"
             )
         else:
             self.log_test(
@@ -336,6 +494,500 @@ class CoffeeAPITester:
                 f"Tasa de éxito baja: {success_rate:.1f}%"
             )
     
+    def test_microbatching_stats(self):
+        """Test 9: Estadísticas de micro-batching (si está activo)"""
+        try:
+            response = requests.get(f"{self.base_url}/health", timeout=5)
+            
+            if response.status_code == 200:
+                stats = response.json().get('microbatching')
+                if stats is None:
+                    self.log_test("Micro-batching", True, "Desactivado en el servidor")
+                elif stats.get('batches', 0) > 0 and stats.get('rows', 0) >= stats['batches']:
+                    self.log_test(
+                        "Micro-batching",
+                        True,
+                        f"Lotes: {stats['batches']}, Tamaño medio: {stats['mean_batch_size']:.2f}"
+                    )
+                else:
+                    self.log_test("Micro-batching", False, f"Estadísticas inconsistentes: {stats}")
+            else:
+                self.log_test("Micro-batching", False, f"Status code: {response.status_code}")
+                
+        except Exception as e:
+            self.log_test("Micro-batching", False, str(e))
+    
+    def test_prediction_cache(self):
+        """Test 10: Caché de predicciones"""
+        test_data = {"acidity": 6.1, "sweetness": 7.3, "body": 6.4, "aroma": 7.7, "altitude": 1333}
+        
+        try:
+            before = requests.get(f"{self.base_url}/health", timeout=5).json().get('prediction_cache')
+            if not before or not before.get('enabled'):
+                self.log_test("Caché de Predicciones", True, "Desactivada en el servidor")
+                return
+            
+            first = requests.post(f"{self.base_url}/predict-json", json=test_data, timeout=10)
+            second = requests.post(f"{self.base_url}/predict-json", json=test_data, timeout=10)
+            after = requests.get(f"{self.base_url}/health", timeout=5).json()['prediction_cache']
+            
+            if first.status_code != 200 or second.status_code != 200:
+                self.log_test("Caché de Predicciones", False, f"Status codes: {first.status_code}, {second.status_code}")
+            elif first.json() != second.json():
+                self.log_test("Caché de Predicciones", False, "La respuesta en caché difiere de la original")
+            elif after['hits'] <= before['hits']:
+                self.log_test("Caché de Predicciones", False, "La segunda petición no fue un hit")
+            else:
+                self.log_test(
+                    "Caché de Predicciones",
+                    True,
+                    f"Hits: {after['hits']}, Misses: {after['misses']}, Tasa: {after['hit_rate']:.2f}"
+                )
+                
+        except Exception as e:
+            self.log_test("Caché de Predicciones", False, str(e))
+    
+    def test_model_reload(self):
+        """Test 11: Recarga del modelo en caliente"""
+        import threading
+        
+        test_data = {"acidity": 5.5, "sweetness": 7.0, "body": 6.8, "aroma": 7.2, "altitude": 1200}
+        errors = []
+        
+        def make_requests():
+            for _ in range(10):
+                try:
+                    response = requests.post(f"{self.base_url}/predict-json", json=test_data, timeout=10)
+                    if response.status_code != 200:
+                        errors.append(f"Status: {response.status_code}")
+                except Exception as e:
+                    errors.append(str(e))
+        
+        try:
+            # Peticiones en paralelo mientras se recarga: ninguna debe fallar
+            threads = [threading.Thread(target=make_requests) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            reload_response = requests.post(f"{self.base_url}/admin/reload-model", timeout=60)
+            for thread in threads:
+                thread.join()
+            
+            if reload_response.status_code == 403:
+                self.log_test("Recarga del Modelo", True, "Endpoint protegido con token")
+                return
+            if reload_response.status_code != 200:
+                self.log_test("Recarga del Modelo", False, f"Status code: {reload_response.status_code}")
+                return
+            
+            version = reload_response.json()['model_version']
+            prediction = requests.post(f"{self.base_url}/predict-json", json=test_data, timeout=10).json()
+            health = requests.get(f"{self.base_url}/health", timeout=5).json()
+            
+            if errors:
+                self.log_test("Recarga del Modelo", False, f"Peticiones fallidas durante la recarga: {errors[:3]}")
+            elif prediction.get('model_version') != version or health.get('model_version') != version:
+                self.log_test("Recarga del Modelo", False, "La versión servida no coincide con la recargada")
+            else:
+                self.log_test(
+                    "Recarga del Modelo",
+                    True,
+                    f"Versión: {version}, Recarga: {reload_response.json()['reload_seconds']:.2f}s"
+                )
+                
+        except Exception as e:
+            self.log_test("Recarga del Modelo", False, str(e))
+    
+    def test_readiness(self):
+        """Test 12: Liveness y readiness"""
+        try:
+            live = requests.get(f"{self.base_url}/health/live", timeout=5)
+            ready = requests.get(f"{self.base_url}/health/ready", timeout=5)
+            
+            if live.status_code != 200:
+                self.log_test("Liveness/Readiness", False, f"Liveness status code: {live.status_code}")
+            elif ready.status_code != 200 or not ready.json().get('ready'):
+                self.log_test("Liveness/Readiness", False, f"No lista: {ready.json().get('model_state')}")
+            else:
+                startup = ready.json()['startup']
+                self.log_test(
+                    "Liveness/Readiness",
+                    True,
+                    f"Import: {startup['import_seconds']:.2f}s, Carga: {startup['load_seconds']:.2f}s, "
+                    f"Calentamiento: {startup['warm_up_seconds']:.2f}s"
+                )
+                
+        except Exception as e:
+            self.log_test("Liveness/Readiness", False, str(e))
+    
+    def test_metrics(self):
+        """Test 13: Métricas de Prometheus"""
+        try:
+            response = requests.get(f"{self.base_url}/metrics", timeout=5)
+            
+            if response.status_code != 200:
+                self.log_test("Métricas", False, f"Status code: {response.status_code}")
+                return
+            
+            # Las pruebas anteriores ya hicieron predicciones: deben aparecer sus series
+            text = response.text
+            expected = [
+                'coffee_http_requests_total{route="/predict-json",status="200"}',
+                'coffee_http_request_duration_seconds_count{route="/predict"}',
+                'coffee_stage_duration_seconds_count{stage="inference"}',
+                'coffee_inference_batch_rows_count',
+                'coffee_predictions_total{quality='
+            ]
+            missing = [series for series in expected if series not in text]
+            if missing:
+                self.log_test("Métricas", False, f"Faltan series: {missing}")
+            else:
+                self.log_test("Métricas", True, f"{len(text.splitlines())} líneas")
+                
+        except Exception as e:
+            self.log_test("Métricas", False, str(e))
+    
+    def test_profiler(self):
+        """Test 14: Perfilado en caliente (si está activo)"""
+        try:
+            response = requests.post(f"{self.base_url}/admin/profile", params={"seconds": 1}, timeout=15)
+            
+            if response.status_code == 404:
+                self.log_test("Perfilado", True, "Desactivado en el servidor")
+            elif response.status_code == 403:
+                self.log_test("Perfilado", True, "Endpoint protegido con token")
+            elif response.status_code != 200:
+                self.log_test("Perfilado", False, f"Status code: {response.status_code}")
+            else:
+                # Formato collapsed: "pila;de;funciones muestras" por línea
+                lines = response.text.splitlines()
+                if lines and all(line.rsplit(" ", 1)[-1].isdigit() for line in lines):
+                    self.log_test("Perfilado", True, f"{len(lines)} pilas distintas")
+                else:
+                    self.log_test("Perfilado", False, "Respuesta sin pilas en formato collapsed")
+                
+        except Exception as e:
+            self.log_test("Perfilado", False, str(e))
+    
+    def test_server_timing(self):
+        """Test 15: Desglose de tiempos del servidor (si está activo)"""
+        test_data = {"acidity": 6.3, "sweetness": 7.1, "body": 6.2, "aroma": 7.4, "altitude": 1420}
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/predict-json", params={"debug": "timing"}, json=test_data, timeout=10
+            )
+            header = response.headers.get("Server-Timing")
+            
+            if response.status_code != 200:
+                self.log_test("Server-Timing", False, f"Status code: {response.status_code}")
+            elif header is None:
+                self.log_test("Server-Timing", True, "Desactivado en el servidor")
+            else:
+                timing = response.json().get('timing') or {}
+                stages = dict(
+                    (part.split(";dur=")[0].strip(), float(part.split(";dur=")[1]))
+                    for part in header.split(",")
+                )
+                if 'parse' not in stages or 'total' not in timing:
+                    self.log_test("Server-Timing", False, f"Cabecera o bloque incompletos: {header}")
+                elif any(ms < 0 for ms in stages.values()) or sum(
+                    ms for stage, ms in stages.items() if stage != 'total'
+                ) > stages['total'] + 0.01:
+                    self.log_test("Server-Timing", False, f"Tiempos inconsistentes: {header}")
+                else:
+                    self.log_test("Server-Timing", True, header)
+                
+        except Exception as e:
+            self.log_test("Server-Timing", False, str(e))
+    
+    def test_echo_features(self):
+        """Test 16: Respuesta sin las características recibidas"""
+        test_data = {"acidity": 5.5, "sweetness": 7.0, "body": 6.8, "aroma": 7.2, "altitude": 1200}
+        
+        try:
+            full = requests.post(f"{self.base_url}/predict-json", json=test_data, timeout=10)
+            compact = requests.post(
+                f"{self.base_url}/predict-json", params={"echo_features": "false"}, json=test_data, timeout=10
+            )
+            
+            if full.status_code != 200 or compact.status_code != 200:
+                self.log_test("Respuesta Compacta", False, f"Status codes: {full.status_code}, {compact.status_code}")
+            elif 'features' in compact.json():
+                self.log_test("Respuesta Compacta", False, "La respuesta incluye features")
+            elif dict(compact.json(), features=full.json()['features']) != full.json():
+                self.log_test("Respuesta Compacta", False, "La predicción difiere de la respuesta completa")
+            else:
+                self.log_test(
+                    "Respuesta Compacta",
+                    True,
+                    f"{len(compact.content)} bytes frente a {len(full.content)}"
+                )
+                
+        except Exception as e:
+            self.log_test("Respuesta Compacta", False, str(e))
+    
+    def test_static_cache(self):
+        """Test 17: Interfaz web cacheable (ETag, gzip y 304)"""
+        try:
+            first = requests.get(f"{self.base_url}/", headers={"Accept-Encoding": "gzip"}, timeout=5)
+            etag = first.headers.get("ETag")
+            
+            if first.status_code != 200 or etag is None:
+                self.log_test("Caché de la Interfaz", False, f"Status code: {first.status_code}, ETag: {etag}")
+                return
+            
+            second = requests.get(f"{self.base_url}/", headers={"If-None-Match": etag}, timeout=5)
+            advanced = requests.get(f"{self.base_url}/static/index.html", timeout=5)
+            
+            if second.status_code != 304 or second.content:
+                self.log_test("Caché de la Interfaz", False, f"Se esperaba 304 sin cuerpo, obtenido: {second.status_code}")
+            elif advanced.status_code != 200:
+                self.log_test("Caché de la Interfaz", False, f"/static/index.html: {advanced.status_code}")
+            else:
+                self.log_test(
+                    "Caché de la Interfaz",
+                    True,
+                    f"{first.headers.get('Content-Encoding', 'identity')}, {first.headers.get('Cache-Control')}"
+                )
+                
+        except Exception as e:
+            self.log_test("Caché de la Interfaz", False, str(e))
+    
+    def test_prediction_binary(self):
+        """Test 18: Lote como matriz binaria float64"""
+        rows = [
+            [5.5, 7.0, 6.8, 7.2, 1200.0],
+            [15.0, 7.0, 6.0, 7.0, 1200.0],  # fuera de rango
+            [3.0, 4.0, 4.5, 3.5, 800.0]
+        ]
+        
+        try:
+            features = requests.get(f"{self.base_url}/model-info", timeout=5).json()['features']
+            names = ['acidity', 'sweetness', 'body', 'aroma', 'altitude']
+            ordered = [[row[names.index(name)] for name in features] for row in rows]
+            body = struct.pack(f"<{len(rows) * len(features)}d", *[value for row in ordered for value in row])
+            binary = requests.post(
+                f"{self.base_url}/predict-batch",
+                data=body,
+                headers={
+                    "Content-Type": "application/x-coffee-matrix",
+                    "X-Matrix-Shape": f"{len(rows)},{len(features)}",
+                    "X-Matrix-Dtype": "float64"
+                },
+                timeout=10
+            )
+            as_json = requests.post(
+                f"{self.base_url}/predict-batch",
+                json={"rows": [dict(zip(names, row)) for row in rows]},
+                timeout=10
+            )
+            
+            if binary.status_code != 200:
+                self.log_test("Predicción Binaria", False, f"Status code: {binary.status_code}")
+            elif binary.json()['predictions'] != as_json.json()['predictions']:
+                self.log_test("Predicción Binaria", False, "El resultado difiere del lote JSON")
+            else:
+                self.log_test(
+                    "Predicción Binaria",
+                    True,
+                    f"Válidas: {binary.json()['valid']}, Inválidas: {binary.json()['invalid']}"
+                )
+                
+        except Exception as e:
+            self.log_test("Predicción Binaria", False, str(e))
+    
+    def test_tcp_server(self):
+        """Test 19: Servidor TCP binario (si está activo, puerto COFFEE_TCP_PORT o 9000)"""
+        host = self.base_url.split("://", 1)[-1].split("/", 1)[0].rsplit(":", 1)[0]
+        port = int(os.environ.get("COFFEE_TCP_PORT", "9000"))
+        rows = [
+            [5.5, 7.0, 6.8, 7.2, 1200.0],
+            [15.0, 7.0, 6.0, 7.0, 1200.0]  # fuera de rango
+        ]
+        
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+        except OSError:
+            self.log_test("Servidor TCP", True, "Desactivado en el servidor")
+            return
+        
+        def read_exactly(n):
+            data = b""
+            while len(data) < n:
+                chunk = sock.recv(n - len(data))
+                if not chunk:
+                    raise ConnectionError("Conexión cerrada")
+                data += chunk
+            return data
+        
+        try:
+            with sock:
+                names = ['acidity', 'sweetness', 'body', 'aroma', 'altitude']
+                features = requests.get(f"{self.base_url}/model-info", timeout=5).json()['features']
+                body = struct.pack(
+                    f"<{len(rows) * len(features)}d",
+                    *[row[names.index(name)] for row in rows for name in features]
+                )
+                # Dos peticiones encadenadas sin esperar a la primera respuesta
+                sock.sendall((struct.pack("<I", len(body)) + body) * 2)
+                responses = []
+                for _ in range(2):
+                    (length,) = struct.unpack("<I", read_exactly(4))
+                    responses.append(read_exactly(length))
+                
+            status, size = struct.unpack_from("<BH", responses[0])
+            if status != 0:
+                self.log_test("Servidor TCP", False, f"Estado {status}: {responses[0][1:].decode()}")
+                return
+            identity = json.loads(responses[0][3:3 + size])
+            record_size = 1 + 8 + 8 * len(identity['classes'])
+            records = responses[0][3 + size:]
+            first, second = records[0], records[record_size]
+            expected = requests.post(
+                f"{self.base_url}/predict-json", json=dict(zip(names, rows[0])), timeout=10
+            ).json()['quality']
+            
+            if responses[0] != responses[1]:
+                self.log_test("Servidor TCP", False, "Las respuestas encadenadas difieren")
+            elif identity['classes'][first] != expected or second != 255:
+                self.log_test("Servidor TCP", False, "Resultado distinto de /predict-json")
+            else:
+                self.log_test("Servidor TCP", True, f"Calidad: {expected}, fila fuera de rango marcada")
+                
+        except Exception as e:
+            self.log_test("Servidor TCP", False, str(e))
+    
+    def test_model_registry(self):
+        """Test 20: Selección de modelo por cabecera y registro de candidatos"""
+        test_data = {"acidity": 6.3, "sweetness": 7.1, "body": 6.2, "aroma": 7.4, "altitude": 1420}
+        
+        try:
+            models = requests.get(f"{self.base_url}/models", timeout=5).json()
+            primary = requests.post(
+                f"{self.base_url}/predict-json", json=test_data,
+                headers={"X-Model-Version": "primary"}, timeout=10
+            )
+            unknown = requests.post(
+                f"{self.base_url}/predict-json", json=test_data,
+                headers={"X-Model-Version": "no-existe"}, timeout=10
+            )
+            
+            if primary.status_code != 200 or primary.json()['model_version'] != models['primary']['model_version']:
+                self.log_test("Registro de Modelos", False, "X-Model-Version: primary no usa el modelo principal")
+            elif unknown.status_code != 404:
+                self.log_test("Registro de Modelos", False, f"Versión desconocida devolvió {unknown.status_code}")
+            else:
+                for alias, candidate in models['candidates'].items():
+                    response = requests.post(
+                        f"{self.base_url}/predict-json", json=test_data,
+                        headers={"X-Model-Version": alias}, timeout=10
+                    )
+                    if response.status_code != 200 or response.json()['model_version'] != candidate['model_version']:
+                        self.log_test("Registro de Modelos", False, f"El candidato {alias} no responde")
+                        return
+                shadow = models.get('shadow')
+                details = f"Candidatos: {len(models['candidates'])}"
+                if shadow is not None:
+                    details += f", desacuerdo en sombra: {shadow['disagreement_rate']:.2%}"
+                self.log_test("Registro de Modelos", True, details)
+                
+        except Exception as e:
+            self.log_test("Registro de Modelos", False, str(e))
+    
+    def test_offline_scoring(self):
+        """Test 21: Puntuación offline a Parquet con un primer bloque sin filas válidas (local)"""
+        try:
+            import pandas as pd
+            import pyarrow.parquet as pq
+            from score_batch import score_file
+        except ImportError:
+            self.log_test("Puntuación Offline", True, "pyarrow no instalado")
+            return
+        if not os.path.exists("model.pkl"):
+            self.log_test("Puntuación Offline", True, "Sin model.pkl local")
+            return
+        
+        invalid = {"acidity": 15.0, "sweetness": 7.0, "body": 6.0, "aroma": 7.0, "altitude": 1200.0}
+        valid = {"acidity": 5.5, "sweetness": 7.0, "body": 6.8, "aroma": 7.2, "altitude": 1200.0}
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                input_path = os.path.join(tmp, "entrada.parquet")
+                output_path = os.path.join(tmp, "salida.parquet")
+                # Primer bloque de 4 filas todo fuera de rango, después filas válidas
+                pd.DataFrame([invalid] * 4 + [valid] * 4).to_parquet(input_path, index=False)
+                stats = score_file(input_path, output_path, workers=0, chunk_size=4)
+                result = pq.read_table(output_path).to_pandas()
+            
+            qualities = result["quality"].tolist()
+            if stats["valid"] != 4 or stats["invalid"] != 4:
+                self.log_test("Puntuación Offline", False, f"Válidas {stats['valid']}, inválidas {stats['invalid']}")
+            elif any(pd.notna(q) for q in qualities[:4]) or any(pd.isna(q) for q in qualities[4:]):
+                self.log_test("Puntuación Offline", False, f"Calidades inesperadas: {qualities}")
+            else:
+                self.log_test("Puntuación Offline", True, f"Calidad de las filas válidas: {qualities[4]}")
+                
+        except Exception as e:
+            self.log_test("Puntuación Offline", False, str(e))
+    
+    def test_shared_fused_model(self):
+        """Test 22: Modelo fusionado compartido en modo mmap (local)"""
+        try:
+            import pickle
+            import numpy as np
+            from inference import ensure_shared_artifact, load_model_data, predict_array
+            from train_model import export_fused_model
+        except ImportError as e:
+            self.log_test("Modelo Fusionado Compartido", True, f"Dependencias no instaladas: {e}")
+            return
+        if not os.path.exists("model.pkl"):
+            self.log_test("Modelo Fusionado Compartido", True, "Sin model.pkl local")
+            return
+        
+        rng = np.random.RandomState(0)
+        X = np.column_stack([rng.uniform(1, 10, 100) for _ in range(4)] + [rng.uniform(500, 2000, 100)])
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                with open("model.pkl", "rb") as f:
+                    model_data = pickle.load(f)
+                fused_path = os.path.join(tmp, "model_fused.pkl")
+                export_fused_model(model_data, X, fused_path)
+                
+                direct = load_model_data(fused_path)
+                shared_path = ensure_shared_artifact(fused_path, os.path.join(tmp, "shm"))
+                shared = load_model_data(shared_path, "fused")
+                same = np.array_equal(predict_array(direct, X)[2], predict_array(shared, X)[2])
+                
+                if shared['model_version'] != direct['model_version']:
+                    self.log_test(
+                        "Modelo Fusionado Compartido", False,
+                        f"Versión {shared['model_version']} en mmap y {direct['model_version']} sin compartir"
+                    )
+                elif not same:
+                    self.log_test("Modelo Fusionado Compartido", False, "Probabilidades distintas en mmap")
+                else:
+                    self.log_test("Modelo Fusionado Compartido", True, f"Versión {shared['model_version']}")
+                del shared
+                
+        except Exception as e:
+            self.log_test("Modelo Fusionado Compartido", False, f"{type(e).__name__}: {e}")
+    
+    def wait_until_ready(self, timeout: float = 60.0):
+        """Esperar a que el modelo termine de cargar y calentarse (/health/ready)"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                response = requests.get(f"{self.base_url}/health/ready", timeout=5)
+                # 404: servidor sin probe de readiness, no hay nada que esperar
+                if response.status_code in (200, 404):
+                    return
+                if response.json().get('model_state') == 'failed':
+                    return
+            except Exception:
+                pass
+            time.sleep(0.5)
+    
     def run_all_tests(self):
         """Ejecutar todas las pruebas"""
         print("🧪 Iniciando batería completa de pruebas...\n")
@@ -347,6 +999,7 @@ class CoffeeAPITester:
         except:
             print("❌ No se puede conectar a la API. Asegúrate de que esté ejecutándose en", self.base_url)
             return
+        self.wait_until_ready()
         
         # Ejecutar tests
         print("🔍 Ejecutando pruebas...")
@@ -357,9 +1010,27 @@ class CoffeeAPITester:
         self.test_main_page()
         self.test_prediction_form()
         self.test_prediction_json()
+        self.test_prediction_batch()
+        self.test_prediction_stream()
+        self.test_prediction_batch_overflow()
+        self.test_prediction_stream_non_object()
         self.test_input_validation()
         self.test_response_time()
         self.test_concurrent_requests()
+        self.test_microbatching_stats()
+        self.test_prediction_cache()
+        self.test_model_reload()
+        self.test_readiness()
+        self.test_metrics()
+        self.test_profiler()
+        self.test_server_timing()
+        self.test_echo_features()
+        self.test_static_cache()
+        self.test_prediction_binary()
+        self.test_tcp_server()
+        self.test_model_registry()
+        self.test_offline_scoring()
+        self.test_shared_fused_model()
         
         # Resumen
         print("\n" + "=" * 60)
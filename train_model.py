@@ -9,8 +9,15 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report
+import argparse
 import pickle
 
+from forest_engine import FlatForest, verification_sample
+from model_artifact import write_artifact
+# Rangos válidos de cada característica (mínimo, máximo); se usan para limpiar el dataset
+# y son los mismos que valida la API
+from validation import FEATURE_BOUNDS
+
 def create_coffee_dataset():
     """
     Crear un dataset sintético de café con diferentes características
@@ -61,17 +68,71 @@ def create_coffee_dataset():
     })
     
     # Limpiar datos (eliminar outliers)
-    data = data[
-        (data['acidity'] >= 1) & (data['acidity'] <= 10) &
-        (data['sweetness'] >= 1) & (data['sweetness'] <= 10) &
-        (data['body'] >= 1) & (data['body'] <= 10) &
-        (data['aroma'] >= 1) & (data['aroma'] <= 10) &
-        (data['altitude'] >= 500) & (data['altitude'] <= 2000)
-    ]
+    in_bounds = np.ones(len(data), dtype=bool)
+    for name, (low, high) in FEATURE_BOUNDS.items():
+        in_bounds &= (data[name] >= low) & (data[name] <= high)
+    data = data[in_bounds]
     
     return data
 
-def train_model():
+def build_fused_forest(model_data, X_check):
+    """
+    Fusionar el StandardScaler en los umbrales del bosque, verificando que predice
+    exactamente igual que el pipeline scaler + modelo
+    """
+    model = model_data['model']
+    scaler = model_data['scaler']
+    forest = FlatForest.from_sklearn(model).fold_scaler(scaler.mean_, scaler.scale_)
+    
+    # Verificación de equivalencia: datos reales más filas justo sobre los umbrales
+    X_check = np.vstack([
+        np.asarray(X_check, dtype=np.float64),
+        verification_sample(forest, len(model_data['feature_names']), scaler=scaler)
+    ])
+    mismatch = forest.verify_against(model, X_check, scaler=scaler)
+    if mismatch is not None:
+        raise ValueError(f"El modelo fusionado no es equivalente al pipeline: {mismatch}")
+    print(f"✅ Equivalencia verificada con el pipeline de dos pasos ({len(X_check)} filas)")
+    
+    return forest
+
+def export_fused_model(model_data, X_check, path='model_fused.pkl'):
+    """
+    Exportar un artefacto con el StandardScaler fusionado en los umbrales del bosque
+    """
+    fused_data = {
+        'forest': build_fused_forest(model_data, X_check),
+        'feature_names': model_data['feature_names'],
+        'accuracy': model_data['accuracy'],
+        'fused': True
+    }
+    
+    with open(path, 'wb') as f:
+        pickle.dump(fused_data, f)
+    
+    print(f"✅ Modelo fusionado guardado como '{path}'")
+    
+    return fused_data
+
+def export_artifact(model_data, X_check, path='model_artifact'):
+    """
+    Exportar el modelo como artefacto versionado sin pickle: arrays .npy de los nodos y
+    del scaler más una cabecera JSON con feature_names, classes y accuracy
+    """
+    header = write_artifact(
+        path,
+        forest=FlatForest.from_sklearn(model_data['model']),
+        fused_forest=build_fused_forest(model_data, X_check),
+        scaler=model_data['scaler'],
+        feature_names=model_data['feature_names'],
+        accuracy=model_data['accuracy']
+    )
+    
+    print(f"✅ Artefacto guardado en '{path}/' (versión {header['model_version']})")
+    
+    return header
+
+def train_model(fused=False, output_format="pickle"):
     """
     Entrenar el modelo de clasificación
     """
@@ -122,12 +183,34 @@ def train_model():
         'accuracy': accuracy
     }
     
-    with open('model.pkl', 'wb') as f:
-        pickle.dump(model_data, f)
+    if output_format in ("pickle", "both"):
+        with open('model.pkl', 'wb') as f:
+            pickle.dump(model_data, f)
+        
+        print("✅ Modelo guardado como 'model.pkl'")
+    
+    if output_format in ("artifact", "both"):
+        print("📦 Exportando artefacto sin pickle...")
+        export_artifact(model_data, X)
     
-    print("✅ Modelo guardado como 'model.pkl'")
+    if fused:
+        print("🔗 Fusionando StandardScaler en los umbrales del bosque...")
+        export_fused_model(model_data, X)
     
     return model_data
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Entrenar el clasificador de calidad de café")
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Exportar además model_fused.pkl con el scaler fusionado en los umbrales"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["pickle", "artifact", "both"],
+        default="pickle",
+        help="pickle: model.pkl; artifact: directorio model_artifact/ (.npy + cabecera JSON, sin pickle)"
+    )
+    args = parser.parse_args()
+    train_model(fused=args.fused, output_format=args.format)
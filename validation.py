@@ -0,0 +1,97 @@
+"""
+Engineer 1 - Validación de rangos de las características
+Tabla única de rangos válidos (la misma que limpia el dataset de entrenamiento) y
+validación vectorizada de matrices completas para la API y la puntuación offline
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rangos válidos de cada característica (mínimo, máximo, mensaje de error). train_model.py
+# descarta del dataset las filas fuera de ellos, así que son los límites del entrenamiento
+FEATURE_RANGES = {
+    'acidity': (1, 10, "Acidez debe estar entre 1 y 10"),
+    'sweetness': (1, 10, "Dulzura debe estar entre 1 y 10"),
+    'body': (1, 10, "Cuerpo debe estar entre 1 y 10"),
+    'aroma': (1, 10, "Aroma debe estar entre 1 y 10"),
+    'altitude': (500, 2000, "Altitud debe estar entre 500 y 2000 metros"),
+}
+
+# (mínimo, máximo) de cada característica
+FEATURE_BOUNDS = {name: (low, high) for name, (low, high, _) in FEATURE_RANGES.items()}
+
+
+class RangeValidator:
+    """Comprueba los rangos de una matriz (filas × características) en una pasada de NumPy.
+
+    Las columnas siguen el orden de ``feature_names``. Un NaN cuenta como fuera de rango.
+    """
+
+    def __init__(self, feature_names: Sequence[str], ranges: Dict[str, Tuple[float, float, str]] = FEATURE_RANGES):
+        self.feature_names = list(feature_names)
+        self.lows = np.array([ranges[name][0] for name in self.feature_names], dtype=np.float64)
+        self.highs = np.array([ranges[name][1] for name in self.feature_names], dtype=np.float64)
+        self.messages = [ranges[name][2] for name in self.feature_names]
+        self._table = [
+            (i, ranges[name][0], ranges[name][1], ranges[name][2]) for i, name in enumerate(self.feature_names)
+        ]
+
+    def error_mask(self, features: np.ndarray) -> np.ndarray:
+        """Matriz booleana del tamaño de ``features``: True donde el valor está fuera de rango"""
+        return ~((features >= self.lows) & (features <= self.highs))
+
+    def valid_mask(self, features: np.ndarray) -> np.ndarray:
+        """True en las filas con todas las características dentro de rango"""
+        return ~self.error_mask(features).any(axis=1)
+
+    def row_errors(self, features: np.ndarray) -> List[Optional[str]]:
+        """Mensaje de la primera característica fuera de rango de cada fila (None si es válida)"""
+        errors = self.error_mask(features)
+        invalid = errors.any(axis=1)
+        messages = [None] * len(features)
+        for i, column in zip(np.flatnonzero(invalid).tolist(), errors[invalid].argmax(axis=1).tolist()):
+            messages[i] = self.messages[column]
+        return messages
+
+    def first_error(self, row: Sequence[float]) -> Optional[str]:
+        """Mensaje de error de una sola fila, o None si es válida.
+
+        Para una fila la misma tabla se recorre en Python: crear un array cuesta más que
+        las cinco comparaciones.
+        """
+        for column, low, high, message in self._table:
+            if not (low <= row[column] <= high):
+                return message
+        return None
+
+
+@lru_cache(maxsize=8)
+def validator_for(feature_names: Tuple[str, ...]) -> RangeValidator:
+    """Validador para un orden de columnas (el de ``model_data['feature_names']``)"""
+    return RangeValidator(feature_names)
+
+
+def rows_to_matrix(rows: Sequence[Any], feature_names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Convertir filas JSON (dicts) en una matriz float64 de una sola vez.
+
+    Devuelve (matriz, filas que no se pudieron convertir). Las filas que no son dicts o
+    les falta una característica, o con valores no numéricos o NaN, quedan marcadas para
+    validarlas una a una y dar el mensaje de error de Pydantic; el resto no pasa por
+    Pydantic.
+    """
+    names = list(feature_names)
+    try:
+        features = np.array([[row[name] for name in names] for row in rows], dtype=np.float64)
+    except (KeyError, TypeError, ValueError, IndexError, OverflowError):
+        # Alguna fila no encaja: convertirlas por separado para aislarla
+        features = np.full((len(rows), len(names)), np.nan)
+        for i, row in enumerate(rows):
+            try:
+                features[i] = [row[name] for name in names]
+            except (KeyError, TypeError, ValueError, IndexError, OverflowError):
+                pass
+    if features.ndim != 2:
+        features = features.reshape(len(rows), len(names))
+    return features, np.isnan(features).any(axis=1)